@@ -0,0 +1,196 @@
+"""
+Adaptive centroid tracker with array-backed state
+Object state lives in contiguous NumPy arrays and association is solved in one step with linear_sum_assignment.
+Each track carries a constant-velocity Kalman filter, so positions can be predicted on frames where detection is skipped.
+"""
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+from scipy.spatial.distance import cdist
+
+# Cost used for pairs outside the distance gate (must stay finite for the solver)
+GATED_COST = 1e6
+
+# Measurement model: only the centroid (cx, cy) of the state [cx, cy, vx, vy] is observed
+H = np.array([[1, 0, 0, 0],
+              [0, 1, 0, 0]], dtype=np.float64)
+
+
+class AdaptiveTracker:
+    """Improved tracker that adapts to different scenarios"""
+    def __init__(self, max_disappeared=10, max_distance=50, use_kalman=True,
+                 process_noise=1.0, measurement_noise=4.0, initial_velocity_var=100.0, max_gate_factor=3.0):
+        self.next_id = 0
+        self.max_disappeared = max_disappeared
+        self.max_distance = max_distance
+
+        # Constant-velocity Kalman filter parameters (pixels, pixels/frame)
+        self.use_kalman = use_kalman
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.initial_velocity_var = initial_velocity_var
+        self.max_gate_factor = max_gate_factor
+
+        # One row per active object
+        self.ids = np.empty(0, dtype=np.int64)
+        self.state = np.empty((0, 4), dtype=np.float64)          # cx, cy, vx, vy
+        self.covariance = np.empty((0, 4, 4), dtype=np.float64)
+        self.sizes = np.empty((0, 2), dtype=np.float64)          # box width, height
+        self.disappeared = np.empty(0, dtype=np.int32)
+
+        # Object ID of each detection passed to the last update() call
+        self.last_ids = np.empty(0, dtype=np.int64)
+
+    @property
+    def centroids(self):
+        """Current (predicted) centroid of every active object"""
+        return self.state[:, :2]
+
+    @property
+    def objects(self):
+        """Active objects as {object_id: (cx, cy)}"""
+        return {int(i): (float(c[0]), float(c[1])) for i, c in zip(self.ids, self.centroids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def predict(self, frames=1):
+        """Advance every track by `frames` frames with the constant-velocity model"""
+        if not self.use_kalman or len(self.ids) == 0 or frames <= 0:
+            return
+
+        dt = float(frames)
+        F = np.array([[1, 0, dt, 0],
+                      [0, 1, 0, dt],
+                      [0, 0, 1, 0],
+                      [0, 0, 0, 1]], dtype=np.float64)
+        # Discrete white-noise acceleration model
+        q = self.process_noise
+        Q = q * np.array([[dt ** 4 / 4, 0, dt ** 3 / 2, 0],
+                          [0, dt ** 4 / 4, 0, dt ** 3 / 2],
+                          [dt ** 3 / 2, 0, dt ** 2, 0],
+                          [0, dt ** 3 / 2, 0, dt ** 2]], dtype=np.float64)
+
+        self.state = self.state @ F.T
+        self.covariance = F @ self.covariance @ F.T + Q
+
+    def predicted_boxes(self):
+        """Predicted [x1, y1, x2, y2, object_id] for every active object"""
+        half = self.sizes / 2
+        boxes = np.hstack([self.centroids - half, self.centroids + half]).astype(int)
+        return [[*box, oid] for box, oid in zip(boxes.tolist(), self.ids.tolist())]
+
+    def update(self, detections, frames_elapsed=0):
+        """Associate [x1, y1, x2, y2] detections with tracked objects.
+
+        frames_elapsed predicts the tracks forward first; leave it at 0 when
+        predict() is already called once per frame.
+        Returns one [x1, y1, x2, y2, object_id] entry per detection, in input order.
+        """
+        self.predict(frames_elapsed)
+
+        boxes = np.asarray(detections, dtype=np.float64).reshape(-1, 4)
+        if len(boxes) == 0:
+            self.disappeared += 1
+            self.prune()
+            self.last_ids = np.empty(0, dtype=np.int64)
+            return []
+
+        input_centroids = (boxes[:, :2] + boxes[:, 2:]) / 2
+        input_sizes = boxes[:, 2:] - boxes[:, :2]
+        det_ids = self.associate(input_centroids, input_sizes)
+
+        self.last_ids = det_ids
+        return [[*box, oid] for box, oid in zip(np.asarray(detections).tolist(), det_ids.tolist())]
+
+    def associate(self, input_centroids, input_sizes):
+        """Match centroids to objects, register the unmatched ones and return the ID per centroid"""
+        det_ids = np.full(len(input_centroids), -1, dtype=np.int64)
+        matched_rows = np.zeros(len(self.ids), dtype=bool)
+
+        if len(self.ids) > 0:
+            # Distances between predicted object positions (rows) and detections (cols)
+            D = cdist(self.centroids, input_centroids)
+            gate = D <= self.gate_radius()[:, np.newaxis]
+
+            # Only solve for rows/cols that have at least one candidate inside the gate
+            rows_idx = np.flatnonzero(gate.any(axis=1))
+            cols_idx = np.flatnonzero(gate.any(axis=0))
+            if len(rows_idx) > 0:
+                sub_D = D[np.ix_(rows_idx, cols_idx)]
+                cost = np.where(gate[np.ix_(rows_idx, cols_idx)], sub_D, GATED_COST)
+                r, c = linear_sum_assignment(cost)
+                valid = cost[r, c] < GATED_COST
+                rows, cols = rows_idx[r[valid]], cols_idx[c[valid]]
+
+                self.correct(rows, input_centroids[cols])
+                self.sizes[rows] = input_sizes[cols]
+                self.disappeared[rows] = 0
+                matched_rows[rows] = True
+                det_ids[cols] = self.ids[rows]
+
+            self.disappeared[~matched_rows] += 1
+
+        new_cols = np.flatnonzero(det_ids < 0)
+        if len(new_cols) > 0:
+            det_ids[new_cols] = self.register(input_centroids[new_cols], input_sizes[new_cols])
+
+        self.prune()
+        return det_ids
+
+    def gate_radius(self):
+        """Association radius per track, widened by the predicted position uncertainty"""
+        if not self.use_kalman:
+            return np.full(len(self.ids), float(self.max_distance))
+        position_sigma = np.sqrt(self.covariance[:, 0, 0] + self.covariance[:, 1, 1])
+        return np.minimum(self.max_distance + position_sigma, self.max_distance * self.max_gate_factor)
+
+    def correct(self, rows, measurements):
+        """Kalman measurement update for the matched rows"""
+        if not self.use_kalman:
+            self.state[rows, :2] = measurements
+            self.state[rows, 2:] = 0
+            return
+
+        P = self.covariance[rows]
+        S = P[:, :2, :2] + np.eye(2) * self.measurement_noise
+        K = P[:, :, :2] @ np.linalg.inv(S)                    # (n, 4, 2)
+        innovation = measurements - self.state[rows, :2]
+        self.state[rows] += (K @ innovation[:, :, np.newaxis])[:, :, 0]
+        self.covariance[rows] = P - K @ (H @ P)
+
+    def register(self, centroids, sizes=None):
+        """Register new objects and return their IDs"""
+        centroids = np.asarray(centroids, dtype=np.float64).reshape(-1, 2)
+        count = len(centroids)
+        if sizes is None:
+            sizes = np.zeros((count, 2))
+        new_ids = np.arange(self.next_id, self.next_id + count, dtype=np.int64)
+        self.next_id += count
+
+        state = np.hstack([centroids, np.zeros((count, 2))])
+        covariance = np.tile(np.diag([self.measurement_noise, self.measurement_noise,
+                                      self.initial_velocity_var, self.initial_velocity_var]), (count, 1, 1))
+
+        self.ids = np.concatenate([self.ids, new_ids])
+        self.state = np.concatenate([self.state, state])
+        self.covariance = np.concatenate([self.covariance, covariance])
+        self.sizes = np.concatenate([self.sizes, np.asarray(sizes, dtype=np.float64).reshape(-1, 2)])
+        self.disappeared = np.concatenate([self.disappeared, np.zeros(count, dtype=np.int32)])
+        return new_ids
+
+    def deregister(self, object_id):
+        self.keep(self.ids != object_id)
+
+    def prune(self):
+        """Drop objects that have been missing for more than max_disappeared updates"""
+        stale = self.disappeared > self.max_disappeared
+        if stale.any():
+            self.keep(~stale)
+
+    def keep(self, mask):
+        self.ids = self.ids[mask]
+        self.state = self.state[mask]
+        self.covariance = self.covariance[mask]
+        self.sizes = self.sizes[mask]
+        self.disappeared = self.disappeared[mask]
@@ -1,20 +1,35 @@
 import cv2
-from ultralytics import YOLO
 import pandas as pd
 import numpy as np
 import os
 from datetime import datetime
 import time
 import json
-from collections import defaultdict
+from collections import Counter
 import math
+import argparse
+import sys
+from array import array
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from threaded_capture import ThreadedCapture, is_live_source
+from frame_sampler import FrameSampler
+from stage_metrics import StageMetrics
+from evidence_writer import EvidenceWriter
+from adaptive_tracker import AdaptiveTracker
+from detection_scheduler import DetectionScheduler
+from signal_cycle import SignalCycleModel
+from detector_backend import load_detector, resolve_backend
+from inference_server import InferenceClient, model_name
+from detection_record import class_ids, from_array, from_result, select, shift
 
 class AdaptiveTrafficMonitor:
-    def __init__(self, video_path, model_path=None):
-        # Initialize YOLO model
+    def __init__(self, video_path, model_path=None, headless=False, config_path=None):
+        self.headless = headless
+        
         if model_path is None:
             model_path = r"D:\PROJECTS\Traffic Detection using YOLO\yolov10n.pt"
-        self.model = YOLO(model_path)
+        self.model_path = model_path
         
         # Load class names
         try:
@@ -23,13 +38,19 @@ class AdaptiveTrafficMonitor:
         except:
             # Fallback to default COCO classes
             self.class_list = ['person', 'bicycle', 'car', 'motorcycle', 'airplane', 'bus', 'train', 'truck']
-        
-        # Video setup
-        self.cap = cv2.VideoCapture(video_path)
+        # Tracked classes as integer ids, so filtering needs no per-box string compare
+        self.vehicle_class_ids = class_ids(self.class_list, ['car', 'truck', 'bus', 'motorcycle'])
+        
+        # Video setup (decoding runs on its own thread, frames that are not analysed are only grabbed)
+        # The capture thread starts in open_capture(), once the run mode has set the sampling stride
+        self.sampler = FrameSampler(video_path)
+        self.live_source = is_live_source(video_path)
+        self.cap = None
         self.video_name = os.path.splitext(os.path.basename(video_path))[0]
+        self.config_file = config_path or f"config_{self.video_name}.json"
         
         # Get video properties
-        self.original_fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.original_fps = self.sampler.get(cv2.CAP_PROP_FPS)
         self.frame_delay = int(1000 / self.original_fps) if self.original_fps > 0 else 33
         
         # UI state
@@ -40,7 +61,6 @@ class AdaptiveTrafficMonitor:
         self.selecting_traffic_light = False
         
         # Detection and tracking
-        self.tracker = AdaptiveTracker()
         self.violation_list = []
         
         # Performance tracking
@@ -52,18 +72,56 @@ class AdaptiveTrafficMonitor:
         self.traffic_light_detector = TrafficLightDetector()
         self.current_light_state = "UNKNOWN"
         
+        # Per-stage latency histograms, snapshot in metrics/
+        self.metrics = StageMetrics(f"adaptive_traffic_monitor_{self.video_name}")
+        
         # Output setup
         self.setup_output_directory()
+        self.evidence_writer = None
         
         # Configuration
         self.config = {
             'process_every_n_frames': 2,  # Process every 2nd frame for better performance
+            'skip_decode': True,  # Headless fixed-stride runs grab() the frames between detections without decoding
+            'adaptive_scheduling': False,  # Opt-in: per-frame stride from scene activity (reads the light every frame)
+            'min_detection_stride': 1,
+            'max_detection_stride': 8,
             'resize_width': 800,
             'resize_height': 480,
             'detection_confidence': 0.5,
-            'track_distance_threshold': 50
+            'roi_inference': True,  # Run the detector on the polygon bounding box instead of the full frame
+            'roi_margin': 40,
+            'roi_imgsz': 320,
+            'roi_full_frame_interval': 10,  # Every Nth detection uses the full frame to pick up new tracks early
+            'track_distance_threshold': 50,
+            'use_kalman': True,  # Predict tracks on skipped frames so process_every_n_frames can be 4-6
+            'use_signal_cycle': True,  # Predict the light phase from the learned fixed-time plan
+            'evidence_format': 'jpg',  # jpg or webp
+            'evidence_quality': 90,
+            'evidence_crop_only': False,  # Save only the vehicle region instead of the full frame
+            'evidence_workers': 2,
+            'evidence_queue_size': 32,
+            'detector_backend': None,  # torch, onnx, openvino or auto; None uses DETECTOR_BACKEND (default auto)
+            'inference_server': os.environ.get('INFERENCE_SERVER'),  # Socket of inference_server.py shared by all cameras
+            'inference_model': None  # Model name on the server; None uses the weights file stem
         }
         
+        # Initialize YOLO model on the configured backend (or connect to the shared inference server)
+        self.model = None
+        self.inference_client = None
+        self.setup_detector()
+        
+        self.tracker = AdaptiveTracker(max_distance=self.config['track_distance_threshold'],
+                                       use_kalman=self.config['use_kalman'])
+        self.scheduler = None
+        self.traffic_light_detector.use_cycle_model = self.config['use_signal_cycle']
+        
+        # ROI inference counters
+        self.reset_roi_stats()
+        
+        if self.headless:
+            return
+        
         print("=== Adaptive Traffic Monitor ===")
         print("Instructions:")
         print("1. Press 'p' to start drawing violation area polygon")
@@ -83,6 +141,72 @@ class AdaptiveTrafficMonitor:
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
 
+    def start_evidence_writer(self):
+        """Start the background pool that encodes and writes violation images"""
+        if self.evidence_writer is None:
+            self.evidence_writer = EvidenceWriter(
+                self.output_dir,
+                num_workers=self.config['evidence_workers'],
+                max_queue=self.config['evidence_queue_size'],
+                image_format=self.config['evidence_format'],
+                quality=self.config['evidence_quality'],
+                crop_only=self.config['evidence_crop_only'],
+                metrics=self.metrics)
+        return self.evidence_writer
+
+    def stop_evidence_writer(self):
+        """Flush pending violation images and print writer metrics"""
+        if self.evidence_writer is None:
+            return None
+        self.evidence_writer.close()
+        self.evidence_writer.print_stats()
+        stats = self.evidence_writer.stats()
+        self.evidence_writer = None
+        return stats
+
+    def open_capture(self):
+        """Start decoding on a background thread (configure the sampler before this)"""
+        self.cap = ThreadedCapture(self.sampler, policy='drop_oldest' if self.live_source else 'block')
+        return self.cap
+
+    def start_scheduler(self):
+        """Create the adaptive detection scheduler if it is enabled in the configuration"""
+        if self.config['adaptive_scheduling']:
+            self.scheduler = DetectionScheduler(
+                (self.config['resize_width'], self.config['resize_height']),
+                min_stride=self.config['min_detection_stride'],
+                max_stride=self.config['max_detection_stride'],
+                default_stride=self.config['process_every_n_frames'],
+                log_path=os.path.join(self.output_dir, 'scheduler_decisions.csv'))
+        else:
+            self.scheduler = None
+        return self.scheduler
+
+    def video_time(self):
+        """Position of the current frame in video seconds (drives the learned signal cycle)"""
+        fps = self.original_fps if self.original_fps > 0 else 30.0
+        return self.cap.frame_index / fps
+
+    def schedule_detection(self, frame, count):
+        """Return True when vehicle detection should run on this frame"""
+        if self.scheduler is None:
+            return count % self.config['process_every_n_frames'] == 0
+
+        # The scheduler needs the light state on every frame, not only on detection frames
+        self.update_light_state(frame)
+        with self.metrics.stage('scheduling'):
+            self.scheduler.set_polygon(self.polygon_points if self.polygon_complete else [])
+            detect = self.scheduler.should_detect(frame, self.tracker, self.current_light_state, count)
+        self.metrics.set_gauge('detection_stride', self.scheduler.stride)
+        self.metrics.set_gauge('detection_calls_saved', self.scheduler.frames - self.scheduler.inference_calls)
+        return detect
+
+    def update_light_state(self, frame):
+        """Refresh current_light_state from the traffic light regions"""
+        with self.metrics.stage('light_detection'):
+            self.current_light_state = self.traffic_light_detector.detect_light_state(
+                frame, self.traffic_light_regions, self.video_time())
+
     def mouse_callback(self, event, x, y, flags, param):
         """Handle mouse events for polygon drawing and traffic light selection"""
         if self.drawing_polygon:
@@ -159,32 +283,106 @@ class AdaptiveTrafficMonitor:
             cv2.putText(frame, f'Monitoring active - Violations: {len(self.violation_list)}', 
                        (10, status_y), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
 
+    def inference_roi(self, frame):
+        """Polygon bounding box plus margin, or None when this detection should use the full frame"""
+        if not self.config['roi_inference'] or not self.polygon_complete or len(self.polygon_points) < 3:
+            return None
+        interval = self.config['roi_full_frame_interval']
+        if interval > 0 and self.detection_calls % interval == 0:
+            return None
+
+        height, width = frame.shape[:2]
+        x, y, w, h = cv2.boundingRect(np.array(self.polygon_points, np.int32))
+        margin = self.config['roi_margin']
+        x1, y1 = max(0, x - margin), max(0, y - margin)
+        x2, y2 = min(width, x + w + margin), min(height, y + h + margin)
+        
+        # Not worth cropping when the polygon covers most of the frame
+        if (x2 - x1) * (y2 - y1) > 0.8 * width * height:
+            return None
+        return x1, y1, x2, y2
+
+    def setup_detector(self):
+        """Use the inference server when one is configured, else load the model in this process"""
+        server = self.config['inference_server']
+        if server:
+            if self.inference_client is not None and self.inference_client.socket_path == server:
+                return
+            name = self.config['inference_model'] or model_name(self.model_path)
+            try:
+                self.inference_client = InferenceClient(name, server)
+                print(f"✓ Using inference server {server} (model {name})")
+                return
+            except (OSError, ValueError) as e:
+                print(f"⚠ Inference server {server} unavailable ({e}), loading the model locally")
+        self.close_inference_client()
+        if self.model is None or resolve_backend(self.config['detector_backend']) != self.model.backend:
+            self.model = load_detector(self.model_path, backend=self.config['detector_backend'])
+
+    def close_inference_client(self):
+        if self.inference_client is not None:
+            self.inference_client.close()
+            self.inference_client = None
+
+    def predict_detections(self, image, **kwargs):
+        """Detections of image as a structured record (see detection_record)"""
+        if self.inference_client is not None:
+            return from_array(self.inference_client.predict(image, **kwargs))
+        return from_result(self.model(image, verbose=not self.headless, **kwargs)[0])
+
     def detect_and_track_vehicles(self, frame):
         """Detect and track vehicles in the frame"""
-        results = self.model(frame, conf=self.config['detection_confidence'])
-        
-        if len(results[0].boxes) == 0:
-            return []
-
-        # Convert results to format for tracker
-        detections = []
-        detection_classes = []
-        
-        boxes_data = results[0].boxes.data.cpu().numpy()
-        for box_data in boxes_data:
-            x1, y1, x2, y2, conf, cls_id = box_data
-            cls_name = self.class_list[int(cls_id)] if int(cls_id) < len(self.class_list) else "unknown"
-            
-            # Only track vehicles
-            if cls_name in ['car', 'truck', 'bus', 'motorcycle']:
-                detections.append([int(x1), int(y1), int(x2), int(y2)])
-                detection_classes.append(cls_name)
+        roi = self.inference_roi(frame)
+        self.detection_calls += 1
+        self.pixels_full_frame += frame.shape[0] * frame.shape[1]
+        
+        if roi is None:
+            with self.metrics.stage('inference'):
+                detections = self.predict_detections(frame, conf=self.config['detection_confidence'])
+            self.pixels_processed += frame.shape[0] * frame.shape[1]
+        else:
+            x1, y1, x2, y2 = roi
+            with self.metrics.stage('inference'):
+                detections = self.predict_detections(frame[y1:y2, x1:x2], conf=self.config['detection_confidence'],
+                                                     imgsz=self.config['roi_imgsz'])
+            # Map crop boxes back to frame coordinates
+            detections = shift(detections, x1, y1)
+            self.roi_calls += 1
+            self.pixels_processed += (x2 - x1) * (y2 - y1)
+        
+        # Only track vehicles
+        detections = select(detections, self.vehicle_class_ids)
+        detection_classes = [self.class_list[c] for c in detections['cls']]
         
         # Update tracker
-        tracked_objects = self.tracker.update(detections)
+        with self.metrics.stage('tracking'):
+            tracked_objects = self.tracker.update(detections['xyxy'].astype(int).tolist())
         
         return tracked_objects, detection_classes
 
+    def reset_roi_stats(self):
+        self.detection_calls = 0
+        self.roi_calls = 0
+        self.pixels_processed = 0
+        self.pixels_full_frame = 0
+
+    def roi_stats(self):
+        """Share of frame pixels the detector actually processed"""
+        return {
+            'detection_calls': self.detection_calls,
+            'roi_calls': self.roi_calls,
+            'pixels_processed': self.pixels_processed,
+            'pixels_full_frame': self.pixels_full_frame,
+            'pixels_saved_pct': 100.0 * (1 - self.pixels_processed / self.pixels_full_frame)
+            if self.pixels_full_frame else 0.0
+        }
+
+    def print_roi_stats(self):
+        stats = self.roi_stats()
+        print(f"ROI inference: {stats['roi_calls']}/{stats['detection_calls']} detections on the polygon crop, "
+              f"{stats['pixels_saved_pct']:.1f}% fewer pixels than full-frame inference")
+        return stats
+
     def check_violations(self, frame, tracked_objects, detection_classes):
         """Check for traffic violations"""
         if not self.polygon_complete or len(self.polygon_points) < 3:
@@ -209,10 +407,13 @@ class AdaptiveTrafficMonitor:
                     if self.current_light_state == "RED" and obj_id not in self.violation_list:
                         # Record violation
                         self.violation_list.append(obj_id)
-                        self.save_violation_image(frame, obj_id, cls_name, cx, cy)
+                        self.save_violation_image(frame, obj_id, cls_name, cx, cy, (x1, y1, x2, y2))
                         violations.append((obj_id, cls_name, cx, cy))
                         print(f"VIOLATION DETECTED: {cls_name} ID:{obj_id} at ({cx}, {cy})")
                     
+                    if self.headless:
+                        continue
+                    
                     # Draw bounding box
                     color = (0, 0, 255) if self.current_light_state == "RED" else (0, 255, 0)
                     cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
@@ -220,20 +421,13 @@ class AdaptiveTrafficMonitor:
                                cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
                     cv2.circle(frame, (cx, cy), 4, color, -1)
 
-    def save_violation_image(self, frame, obj_id, cls_name, cx, cy):
-        """Save violation image with metadata"""
-        timestamp = datetime.now().strftime('%H-%M-%S-%f')[:-3]
-        filename = f"violation_{cls_name}_{obj_id}_{timestamp}.jpg"
-        filepath = os.path.join(self.output_dir, filename)
-        
-        # Add violation metadata to the image
-        violation_frame = frame.copy()
-        cv2.putText(violation_frame, f"VIOLATION: {cls_name} ID:{obj_id}", 
-                   (10, frame.shape[0] - 40), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-        cv2.putText(violation_frame, f"Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", 
-                   (10, frame.shape[0] - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
-        
-        cv2.imwrite(filepath, violation_frame)
+    def save_violation_image(self, frame, obj_id, cls_name, cx, cy, bbox=None):
+        """Queue violation image with metadata for the background evidence writer"""
+        now = datetime.now()
+        name = f"violation_{cls_name}_{obj_id}_{now.strftime('%H-%M-%S-%f')[:-3]}"
+        lines = [f"VIOLATION: {cls_name} ID:{obj_id}",
+                 f"Time: {now.strftime('%Y-%m-%d %H:%M:%S')}"]
+        self.start_evidence_writer().submit(frame, name, bbox, lines)
 
     def save_configuration(self):
         """Save current configuration to file"""
@@ -244,14 +438,14 @@ class AdaptiveTrafficMonitor:
             'config': self.config
         }
         
-        config_file = f"config_{self.video_name}.json"
+        config_file = self.config_file
         with open(config_file, 'w') as f:
             json.dump(config_data, f, indent=2)
         print(f"Configuration saved to {config_file}")
 
     def load_configuration(self):
         """Load configuration from file"""
-        config_file = f"config_{self.video_name}.json"
+        config_file = self.config_file
         try:
             with open(config_file, 'r') as f:
                 config_data = json.load(f)
@@ -259,6 +453,10 @@ class AdaptiveTrafficMonitor:
             self.polygon_points = config_data.get('polygon_points', [])
             self.traffic_light_regions = config_data.get('traffic_light_regions', [])
             self.config.update(config_data.get('config', {}))
+            self.tracker.max_distance = self.config['track_distance_threshold']
+            self.tracker.use_kalman = self.config['use_kalman']
+            self.traffic_light_detector.use_cycle_model = self.config['use_signal_cycle']
+            self.setup_detector()
             
             if len(self.polygon_points) > 2:
                 self.polygon_complete = True
@@ -276,6 +474,10 @@ class AdaptiveTrafficMonitor:
         
         # Try to load existing configuration
         self.load_configuration()
+        self.start_evidence_writer()
+        self.start_scheduler()
+        self.reset_roi_stats()
+        self.open_capture()
         
         count = 0
         monitoring_active = False
@@ -285,7 +487,8 @@ class AdaptiveTrafficMonitor:
         print("Setup phase - configure areas before monitoring")
         
         while True:
-            ret, frame = self.cap.read()
+            with self.metrics.stage('decode'):
+                ret, frame = self.cap.read()
             if not ret:
                 print("End of video or read error")
                 break
@@ -301,27 +504,36 @@ class AdaptiveTrafficMonitor:
                 self.start_time = end_time
             
             # Resize frame
-            frame = cv2.resize(frame, (self.config['resize_width'], self.config['resize_height']))
+            with self.metrics.stage('resize'):
+                frame = cv2.resize(frame, (self.config['resize_width'], self.config['resize_height']))
             
             # Only process detection every N frames when monitoring is active
-            if monitoring_active and count % self.config['process_every_n_frames'] == 0:
-                # Detect traffic light state
-                self.current_light_state = self.traffic_light_detector.detect_light_state(
-                    frame, self.traffic_light_regions)
+            if monitoring_active:
+                with self.metrics.stage('track_predict'):
+                    self.tracker.predict()
+            if monitoring_active and self.schedule_detection(frame, count):
+                # Detect traffic light state (already done per frame by the scheduler)
+                if self.scheduler is None:
+                    self.update_light_state(frame)
                 
                 # Detect and track vehicles
                 tracked_objects, detection_classes = self.detect_and_track_vehicles(frame)
                 
                 # Check for violations
-                self.check_violations(frame, tracked_objects, detection_classes)
+                with self.metrics.stage('zone_test'):
+                    self.check_violations(frame, tracked_objects, detection_classes)
             
             # Draw interface
-            self.draw_interface(frame)
-            
-            cv2.imshow('Traffic Monitor', frame)
+            with self.metrics.stage('drawing'):
+                self.draw_interface(frame)
             
             # Handle key presses
-            key = cv2.waitKey(self.frame_delay) & 0xFF
+            with self.metrics.stage('display'):
+                cv2.imshow('Traffic Monitor', frame)
+            # Playback delay, kept out of the display (render) stage
+            with self.metrics.stage('pacing'):
+                key = cv2.waitKey(self.frame_delay) & 0xFF
+            self.metrics.frame_done()
             
             if key == ord('q'):
                 break
@@ -366,122 +578,213 @@ class AdaptiveTrafficMonitor:
                 self.load_configuration()
         
         self.cap.release()
+        self.close_inference_client()
         cv2.destroyAllWindows()
         
         print(f"\nSession Summary:")
+        self.cap.print_stats()
+        if self.scheduler is not None:
+            self.scheduler.print_stats()
+            self.scheduler.close()
+        self.print_roi_stats()
+        self.traffic_light_detector.print_stats()
+        self.stop_evidence_writer()
+        self.metrics.print_summary()
         print(f"Total violations detected: {len(self.violation_list)}")
         print(f"Violations saved to: {self.output_dir}")
 
+    def run_headless(self, progress=None, progress_every=100):
+        """Process the whole video as fast as possible using the saved configuration.
+
+        progress, if given, is called every progress_every source frames with a
+        dict of frames, fps and violations so far (used by orchestrator.py).
+        """
+        if not self.load_configuration() or not self.polygon_complete:
+            print("Headless mode needs a saved configuration with a complete violation polygon")
+            self.sampler.release()
+            return None
+
+        total_frames = int(self.sampler.get(cv2.CAP_PROP_FRAME_COUNT))
+        print(f"\nVideo: {self.video_name} ({total_frames} frames @ {self.original_fps:.1f} FPS)")
+        print("Headless monitoring started")
+        self.start_evidence_writer()
+        self.start_scheduler()
+        self.reset_roi_stats()
+        # The adaptive scheduler needs the pixels of every frame; a fixed stride only the analysed ones
+        if self.scheduler is None and self.config['skip_decode']:
+            self.sampler.configure('stride', stride=self.config['process_every_n_frames'])
+        self.open_capture()
+
+        # Per-frame latencies in seconds (compact storage for overnight recordings)
+        frame_latencies = array('d')
+        processed_latencies = array('d')
+        count = 0
+        next_report = 1000
+        next_progress = progress_every
+        run_start = time.perf_counter()
 
-class AdaptiveTracker:
-    """Improved tracker that adapts to different scenarios"""
-    def __init__(self, max_disappeared=10, max_distance=50):
-        self.next_id = 0
-        self.objects = {}
-        self.disappeared = {}
-        self.max_disappeared = max_disappeared
-        self.max_distance = max_distance
-
-    def update(self, detections):
-        if len(detections) == 0:
-            # Mark existing objects as disappeared
-            for object_id in list(self.disappeared.keys()):
-                self.disappeared[object_id] += 1
-                if self.disappeared[object_id] > self.max_disappeared:
-                    self.deregister(object_id)
-            return []
-
-        input_centroids = []
-        for detection in detections:
-            x1, y1, x2, y2 = detection
-            cx = int((x1 + x2) / 2)
-            cy = int((y1 + y2) / 2)
-            input_centroids.append((cx, cy))
-
-        if len(self.objects) == 0:
-            for centroid in input_centroids:
-                self.register(centroid)
-        else:
-            object_centroids = list(self.objects.values())
-            
-            # Compute distance matrix
-            D = np.linalg.norm(np.array(object_centroids)[:, np.newaxis] - input_centroids, axis=2)
-            
-            # Find minimum distance matches
-            rows = D.min(axis=1).argsort()
-            cols = D.argmin(axis=1)[rows]
-            
-            used_row_indices = set()
-            used_col_indices = set()
-            
-            for (row, col) in zip(rows, cols):
-                if row in used_row_indices or col in used_col_indices:
-                    continue
-                
-                if D[row, col] <= self.max_distance:
-                    object_id = list(self.objects.keys())[row]
-                    self.objects[object_id] = input_centroids[col]
-                    if object_id in self.disappeared:
-                        del self.disappeared[object_id]
-                    
-                    used_row_indices.add(row)
-                    used_col_indices.add(col)
-
-            unused_row_indices = set(range(0, D.shape[0])).difference(used_row_indices)
-            unused_col_indices = set(range(0, D.shape[1])).difference(used_col_indices)
-
-            if D.shape[0] >= D.shape[1]:
-                for row in unused_row_indices:
-                    object_id = list(self.objects.keys())[row]
-                    self.disappeared.setdefault(object_id, 0)
-                    self.disappeared[object_id] += 1
-                    
-                    if self.disappeared[object_id] > self.max_disappeared:
-                        self.deregister(object_id)
-            else:
-                for col in unused_col_indices:
-                    self.register(input_centroids[col])
-
-        # Return tracked objects in bbox format
-        tracked_objects = []
-        for i, detection in enumerate(detections):
-            if i < len(input_centroids):
-                # Find which object this detection corresponds to
-                centroid = input_centroids[i]
-                object_id = None
-                min_dist = float('inf')
-                
-                for oid, obj_centroid in self.objects.items():
-                    dist = np.linalg.norm(np.array(centroid) - np.array(obj_centroid))
-                    if dist < min_dist and dist <= self.max_distance:
-                        min_dist = dist
-                        object_id = oid
-                
-                if object_id is not None:
-                    x1, y1, x2, y2 = detection
-                    tracked_objects.append([x1, y1, x2, y2, object_id])
+        while True:
+            frame_start = time.perf_counter()
+            with self.metrics.stage('decode'):
+                ret, frame = self.cap.read()
+            if not ret:
+                break
 
-        return tracked_objects
+            # Source position, so skipped (grabbed) frames still count
+            frames_advanced = self.cap.frame_index - count
+            count = self.cap.frame_index
+            with self.metrics.stage('resize'):
+                frame = cv2.resize(frame, (self.config['resize_width'], self.config['resize_height']))
+
+            # Tracks move every frame, detections only arrive every N frames
+            with self.metrics.stage('track_predict'):
+                self.tracker.predict(frames_advanced)
+            processed = self.schedule_detection(frame, count)
+            if processed:
+                if self.scheduler is None:
+                    self.update_light_state(frame)
+                tracked_objects, detection_classes = self.detect_and_track_vehicles(frame)
+                with self.metrics.stage('zone_test'):
+                    self.check_violations(frame, tracked_objects, detection_classes)
+
+            self.metrics.frame_done()
+            latency = time.perf_counter() - frame_start
+            frame_latencies.append(latency)
+            if processed:
+                processed_latencies.append(latency)
+
+            if progress is not None and count >= next_progress:
+                next_progress += progress_every
+                elapsed = time.perf_counter() - run_start
+                progress({'frames': count, 'total_frames': total_frames, 'fps': count / elapsed,
+                          'violations': len(self.violation_list)})
+            if count >= next_report:
+                next_report += 1000
+                elapsed = time.perf_counter() - run_start
+                print(f"Frame {count}/{total_frames}: {count / elapsed:.1f} FPS, "
+                      f"violations: {len(self.violation_list)}")
+
+        wall_time = time.perf_counter() - run_start
+        self.cap.release()
+        self.close_inference_client()
+
+        evidence_stats = self.stop_evidence_writer()
+
+        report = self.print_throughput_report(wall_time, count, frame_latencies, processed_latencies)
+        report['evidence'] = evidence_stats
+        if self.scheduler is not None:
+            report['scheduler'] = self.scheduler.print_stats()
+            self.scheduler.close()
+        report['roi'] = self.print_roi_stats()
+        report['traffic_light'] = self.traffic_light_detector.print_stats()
+        report['stages'] = self.metrics.print_summary()['stages']
+        return report
+
+    def print_throughput_report(self, wall_time, frames, frame_latencies, processed_latencies):
+        """Print throughput and latency percentiles of a headless run (frames = source frames covered)"""
+        report = {
+            'video_name': self.video_name,
+            'frames': frames,
+            'decoded_frames': len(frame_latencies),
+            'processed_frames': len(processed_latencies),
+            'wall_time_s': wall_time,
+            'fps': frames / wall_time if wall_time > 0 else 0.0,
+            'violations': len(self.violation_list)
+        }
+        report['realtime_factor'] = report['fps'] / self.original_fps if self.original_fps > 0 else 0.0
+
+        print(f"\n=== Throughput Report: {self.video_name} ===")
+        print(f"Frames read: {frames} (decoded: {len(frame_latencies)}, analysed: {len(processed_latencies)})")
+        print(f"Wall time: {wall_time:.1f}s")
+        print(f"Throughput: {report['fps']:.1f} FPS ({report['realtime_factor']:.1f}x real time)")
+        report['capture'] = self.cap.stats()
+        self.cap.print_stats()
+        report['sampler'] = self.sampler.stats()
+        self.sampler.print_stats()
+
+        for label, latencies in (('all frames', frame_latencies), ('analysed frames', processed_latencies)):
+            if len(latencies) == 0:
+                continue
+            p50, p95, p99 = np.percentile(np.frombuffer(latencies, dtype=np.float64), [50, 95, 99]) * 1000
+            report[label.replace(' ', '_') + '_latency_ms'] = {'p50': p50, 'p95': p95, 'p99': p99}
+            print(f"Latency {label}: p50={p50:.1f}ms p95={p95:.1f}ms p99={p99:.1f}ms")
 
-    def register(self, centroid):
-        self.objects[self.next_id] = centroid
-        self.disappeared[self.next_id] = 0
-        self.next_id += 1
+        print(f"Total violations detected: {len(self.violation_list)}")
+        print(f"Violations saved to: {self.output_dir}")
+        return report
+
+
+class LightPhase:
+    """Debounced phase state machine for one traffic light"""
+
+    # Legal phase order of a signal head
+    NEXT_PHASE = {"GREEN": "YELLOW", "YELLOW": "RED", "RED": "GREEN"}
+
+    def __init__(self, confirm_frames=3, illegal_confirm_frames=8):
+        self.confirm_frames = confirm_frames
+        self.illegal_confirm_frames = illegal_confirm_frames
+        self.state = "UNKNOWN"
+        self.candidate = None
+        self.candidate_count = 0
+        self.transitions = 0
+        self.flickers_rejected = 0
+
+        # Change-detection shortcut: thumbnail and raw reading of the last HSV evaluation
+        self.reference = None
+        self.last_reading = "UNKNOWN"
+
+    def observe(self, reading):
+        """Feed one raw per-frame reading and return the confirmed phase"""
+        if reading == "UNKNOWN":
+            return self.state
+
+        if reading == self.state:
+            if self.candidate is not None:
+                self.flickers_rejected += 1
+            self.candidate = None
+            self.candidate_count = 0
+            return self.state
+
+        if reading == self.candidate:
+            self.candidate_count += 1
+        else:
+            self.candidate = reading
+            self.candidate_count = 1
 
-    def deregister(self, object_id):
-        del self.objects[object_id]
-        if object_id in self.disappeared:
-            del self.disappeared[object_id]
+        # Out-of-order transitions (e.g. GREEN -> RED) need a longer confirmation
+        legal = self.state == "UNKNOWN" or self.NEXT_PHASE.get(self.state) == reading
+        required = self.confirm_frames if legal else self.illegal_confirm_frames
+        if self.candidate_count >= required:
+            self.state = reading
+            self.candidate = None
+            self.candidate_count = 0
+            self.transitions += 1
+        return self.state
 
 
 class TrafficLightDetector:
     """Adaptive traffic light detector"""
-    def __init__(self):
-        self.light_history = defaultdict(list)
-        self.history_length = 5
-
-    def detect_light_state(self, frame, regions):
-        """Detect traffic light state from specified regions"""
+    def __init__(self, confirm_frames=3, illegal_confirm_frames=8, change_threshold=4.0, thumbnail_size=(16, 16),
+                 use_cycle_model=True):
+        self.confirm_frames = confirm_frames
+        self.illegal_confirm_frames = illegal_confirm_frames
+        self.change_threshold = change_threshold
+        self.thumbnail_size = thumbnail_size
+        self.use_cycle_model = use_cycle_model
+        
+        # One phase state machine (and learned cycle) per light region
+        self.lights = {}
+        self.cycles = {}
+        self.evaluations = 0
+        self.skipped = 0
+        self.predicted = 0
+
+    def detect_light_state(self, frame, regions, timestamp=None):
+        """Detect traffic light state from specified regions.
+
+        With a video timestamp (seconds) and a learned signal cycle, the phase is
+        predicted and the pixels are only checked around expected transitions.
+        """
         if not regions:
             return "UNKNOWN"
         
@@ -491,17 +794,65 @@ class TrafficLightDetector:
             roi = frame[y1:y2, x1:x2]
             
             if roi.size > 0:
-                state = self.analyze_roi(roi)
+                key = tuple(region)
+                light = self.lights.get(key)
+                if light is None:
+                    light = self.lights[key] = LightPhase(self.confirm_frames, self.illegal_confirm_frames)
+                    self.cycles[key] = SignalCycleModel()
+                cycle = self.cycles[key] if self.use_cycle_model and timestamp is not None else None
+                
+                if cycle is not None and light.candidate is None and not cycle.needs_verification(timestamp):
+                    self.predicted += 1
+                    states.append(cycle.phase_at(timestamp))
+                    continue
+                
+                state = light.observe(self.read_light(light, roi))
+                if cycle is not None:
+                    cycle.update(timestamp, state)
                 states.append(state)
         
         # Return most common state
         if states:
-            from collections import Counter
             most_common = Counter(states).most_common(1)[0][0]
             return most_common
         
         return "UNKNOWN"
 
+    def read_light(self, light, roi):
+        """Raw reading of one light, reusing the last HSV result while the ROI has not changed"""
+        gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
+        thumbnail = cv2.resize(gray, self.thumbnail_size, interpolation=cv2.INTER_AREA)
+        
+        if light.reference is not None and \
+                cv2.mean(cv2.absdiff(thumbnail, light.reference))[0] < self.change_threshold:
+            self.skipped += 1
+            return light.last_reading
+        
+        light.reference = thumbnail
+        light.last_reading = self.analyze_roi(roi)
+        self.evaluations += 1
+        return light.last_reading
+
+    def stats(self):
+        reads = self.evaluations + self.skipped + self.predicted
+        return {
+            'hsv_evaluations': self.evaluations,
+            'unchanged_skips': self.skipped,
+            'cycle_predictions': self.predicted,
+            'skip_pct': 100.0 * (self.skipped + self.predicted) / reads if reads else 0.0,
+            'cycles': {str(list(key)): cycle.stats() for key, cycle in self.cycles.items()},
+            'transitions': sum(light.transitions for light in self.lights.values()),
+            'flickers_rejected': sum(light.flickers_rejected for light in self.lights.values())
+        }
+
+    def print_stats(self):
+        stats = self.stats()
+        print(f"Traffic light: HSV analysis on {stats['hsv_evaluations']} reads, "
+              f"{stats['unchanged_skips']} skipped as unchanged, {stats['cycle_predictions']} predicted "
+              f"from the signal cycle ({stats['skip_pct']:.1f}% without HSV), "
+              f"{stats['transitions']} phase changes, {stats['flickers_rejected']} flickers rejected")
+        return stats
+
     def analyze_roi(self, roi):
         """Analyze ROI to determine light state"""
         hsv = cv2.cvtColor(roi, cv2.COLOR_BGR2HSV)
@@ -545,7 +896,29 @@ class TrafficLightDetector:
         return "UNKNOWN"
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Adaptive Traffic Monitor")
+    parser.add_argument('--video', help="Video path (skips the interactive menu)")
+    parser.add_argument('--model', help="YOLO weights path")
+    parser.add_argument('--headless', action='store_true',
+                        help="Run without UI at full speed using config_<video>.json")
+    return parser.parse_args()
+
+
 def main():
+    args = parse_args()
+
+    if args.video:
+        if not os.path.exists(args.video):
+            print(f"Video not found: {args.video}")
+            return
+        monitor = AdaptiveTrafficMonitor(args.video, args.model, headless=args.headless)
+        if args.headless:
+            monitor.run_headless()
+        else:
+            monitor.run()
+        return
+
     print("=== Adaptive Traffic Monitor ===")
     print("Select video file:")
     
@@ -575,8 +948,11 @@ def main():
             return
         
         # Initialize and run monitor
-        monitor = AdaptiveTrafficMonitor(video_path)
-        monitor.run()
+        monitor = AdaptiveTrafficMonitor(video_path, args.model, headless=args.headless)
+        if args.headless:
+            monitor.run_headless()
+        else:
+            monitor.run()
         
     except (ValueError, KeyboardInterrupt):
         print("Cancelled or invalid input")
@@ -0,0 +1,73 @@
+"""
+Microbenchmark for AdaptiveTracker.update
+Đo thời gian update của tracker theo số lượng đối tượng trong khung hình
+
+Usage: python benchmark_tracker.py [--counts 10 50 100 200 400] [--frames 200] [--stride 1] [--no-kalman]
+
+--stride N runs detection every N frames (tracks are predicted in between);
+the 'ids' column counts IDs created, so ID switches show up as ids > objects.
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from adaptive_tracker import AdaptiveTracker
+
+
+def simulate_detections(rng, count, frames, width=800, height=480, box_size=30, step=4.0):
+    """Generate per-frame boxes for `count` objects moving with jitter and missed detections"""
+    positions = rng.uniform([0, 0], [width, height], size=(count, 2))
+    velocities = rng.uniform(-step, step, size=(count, 2))
+    sequence = []
+    for _ in range(frames):
+        positions = positions + velocities + rng.normal(0, 0.5, size=(count, 2))
+        # Bounce off the frame borders so objects stay in view
+        outside = (positions < 0) | (positions > [width, height])
+        velocities[outside] *= -1
+        positions = np.clip(positions, 0, [width, height])
+        visible = rng.random(count) > 0.05  # ~5% missed detections per frame
+        centers = positions[visible]
+        order = rng.permutation(len(centers))  # detector output order is arbitrary
+        centers = centers[order]
+        half = box_size / 2
+        boxes = np.column_stack([centers - half, centers + half]).astype(int)
+        sequence.append(boxes.tolist())
+    return sequence
+
+
+def benchmark(count, frames, stride=1, use_kalman=True, seed=0):
+    rng = np.random.default_rng(seed)
+    sequence = simulate_detections(rng, count, frames)[::stride]
+    tracker = AdaptiveTracker(max_distance=25, use_kalman=use_kalman)
+
+    timings = np.empty(len(sequence))
+    for i, detections in enumerate(sequence):
+        start = time.perf_counter()
+        tracker.update(detections, frames_elapsed=stride)
+        timings[i] = time.perf_counter() - start
+
+    # Skip warm-up updates where every detection is registered as new
+    timings = timings[min(5, len(timings) - 1):] * 1000
+    return np.mean(timings), np.percentile(timings, 95), len(tracker), tracker.next_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AdaptiveTracker update() microbenchmark")
+    parser.add_argument('--counts', type=int, nargs='+', default=[10, 25, 50, 100, 200, 400])
+    parser.add_argument('--frames', type=int, default=200)
+    parser.add_argument('--stride', type=int, default=1, help="Run detection every N frames")
+    parser.add_argument('--no-kalman', action='store_true', help="Disable the Kalman motion model")
+    args = parser.parse_args()
+
+    print(f"=== AdaptiveTracker.update benchmark (stride {args.stride}, "
+          f"kalman {'off' if args.no_kalman else 'on'}) ===")
+    print(f"{'objects':>8} {'mean ms':>9} {'p95 ms':>8} {'active':>7} {'ids':>6}")
+    for count in args.counts:
+        mean_ms, p95_ms, active, ids = benchmark(count, args.frames, args.stride, not args.no_kalman)
+        print(f"{count:>8} {mean_ms:>9.3f} {p95_ms:>8.3f} {active:>7} {ids:>6}")
+
+
+if __name__ == "__main__":
+    main()
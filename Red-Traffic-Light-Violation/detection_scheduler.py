@@ -0,0 +1,185 @@
+"""
+Scene-activity-adaptive detection scheduler
+Picks the YOLO detection stride per frame from cheap signals: frame-difference energy around the
+violation polygon, the number of active tracks, tracks approaching the polygon and the light state.
+"""
+
+import os
+from collections import Counter, deque
+
+import cv2
+import numpy as np
+
+
+class DetectionScheduler:
+    """Decides on every frame whether the vehicle detector should run.
+
+    With log_path, every stride change is appended to a CSV file (frame,
+    stride, reason and the signals behind it) so the decisions of a whole
+    run can be audited; stats() only keeps the most recent ones.
+    """
+
+    def __init__(self, frame_size, min_stride=1, max_stride=8, default_stride=2, diff_scale=0.25,
+                 motion_threshold=2.0, approach_distance=60, smoothing=0.3, log_path=None):
+        self.frame_width, self.frame_height = frame_size
+        self.min_stride = max(1, min_stride)
+        self.max_stride = max(self.min_stride, max_stride)
+        self.default_stride = int(np.clip(default_stride, self.min_stride, self.max_stride))
+        self.diff_scale = diff_scale
+        self.motion_threshold = motion_threshold
+        self.approach_distance = approach_distance
+        self.smoothing = smoothing
+
+        self.polygon = None
+        self.polygon_key = None
+        self.mask = None
+        self.previous_small = None
+        self.motion = 0.0
+
+        self.stride = self.default_stride
+        self.reason = 'startup'
+        self.frames_since_detection = self.max_stride  # detect on the first frame
+
+        # Counters
+        self.frames = 0
+        self.inference_calls = 0
+        self.reason_frames = Counter()
+        self.stride_changes = 0
+        self.decisions = deque(maxlen=200)  # (frame, stride, reason) of recent stride changes
+
+        self.log_path = log_path
+        self.log_file = None
+        if log_path:
+            directory = os.path.dirname(log_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.log_file = open(log_path, 'w', encoding='utf-8')
+            self.log_file.write('frame,stride,reason,motion,active_tracks,approaching,light_state\n')
+
+    def set_polygon(self, polygon_points):
+        """Rebuild the downscaled motion mask only when the polygon changes"""
+        key = tuple(tuple(p) for p in polygon_points)
+        if key == self.polygon_key:
+            return
+        self.polygon_key = key
+        if len(polygon_points) < 3:
+            self.polygon = None
+            self.mask = None
+            return
+
+        self.polygon = np.array(polygon_points, np.int32)
+        small_w = max(1, int(self.frame_width * self.diff_scale))
+        small_h = max(1, int(self.frame_height * self.diff_scale))
+        self.mask = np.zeros((small_h, small_w), np.uint8)
+        small_polygon = np.round(self.polygon * self.diff_scale).astype(np.int32)
+        cv2.fillPoly(self.mask, [small_polygon], 255)
+
+        # Grow the mask by the approach distance so vehicles heading for the stop area count as activity
+        radius = max(1, int(self.approach_distance * self.diff_scale))
+        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2 * radius + 1, 2 * radius + 1))
+        self.mask = cv2.dilate(self.mask, kernel)
+
+    def measure_motion(self, frame):
+        """Smoothed mean absolute frame difference inside the (grown) polygon mask"""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        small = cv2.resize(gray, (self.mask.shape[1], self.mask.shape[0]), interpolation=cv2.INTER_AREA)
+        if self.previous_small is not None:
+            energy = cv2.mean(cv2.absdiff(small, self.previous_small), mask=self.mask)[0]
+            self.motion += self.smoothing * (energy - self.motion)
+        self.previous_small = small
+        return self.motion
+
+    def count_approaching(self, tracker):
+        """Tracks inside or within approach_distance of the polygon, now or after max_stride frames"""
+        if len(tracker) == 0:
+            return 0
+        centroids = tracker.state[:, :2]
+        ahead = centroids + tracker.state[:, 2:] * self.max_stride
+        approaching = 0
+        for current, future in zip(centroids.tolist(), ahead.tolist()):
+            distance = max(cv2.pointPolygonTest(self.polygon, (current[0], current[1]), True),
+                           cv2.pointPolygonTest(self.polygon, (future[0], future[1]), True))
+            if distance >= -self.approach_distance:
+                approaching += 1
+        return approaching
+
+    def choose_stride(self, motion, active_tracks, approaching, light_state):
+        """Map the scene signals to a detection stride and the reason for it"""
+        if light_state == "RED" and approaching > 0:
+            return self.min_stride, 'red_approach'
+        moving = motion >= self.motion_threshold
+        if not moving and active_tracks == 0:
+            return self.max_stride, 'static'
+        if not moving:
+            # Vehicles present but standing still (e.g. queued at the light)
+            return max(self.default_stride, (self.min_stride + self.max_stride) // 2), 'stationary'
+        if light_state == "RED":
+            return max(self.min_stride, self.default_stride // 2), 'red_motion'
+        return self.default_stride, 'motion'
+
+    def should_detect(self, frame, tracker, light_state, frame_number=None):
+        """Update the signals for this frame and return True when the detector should run"""
+        self.frames += 1
+        if frame_number is None:
+            frame_number = self.frames
+
+        motion, approaching = 0.0, 0
+        if self.mask is None:
+            stride, reason = self.default_stride, 'no_polygon'
+        else:
+            motion = self.measure_motion(frame)
+            approaching = self.count_approaching(tracker)
+            stride, reason = self.choose_stride(motion, len(tracker), approaching, light_state)
+
+        if (stride, reason) != (self.stride, self.reason):
+            self.decisions.append((frame_number, stride, reason))
+            self.stride_changes += 1
+            self.stride, self.reason = stride, reason
+            if self.log_file is not None:
+                self.log_file.write(f"{frame_number},{stride},{reason},{motion:.2f},{len(tracker)},"
+                                    f"{approaching},{light_state}\n")
+
+        self.reason_frames[reason] += 1
+        self.frames_since_detection += 1
+        if self.frames_since_detection >= self.stride:
+            self.frames_since_detection = 0
+            self.inference_calls += 1
+            return True
+        return False
+
+    def stats(self, fixed_stride=None):
+        """Inference calls made and saved compared to every-frame and fixed-stride detection"""
+        fixed_stride = fixed_stride or self.default_stride
+        fixed_calls = self.frames // fixed_stride
+        return {
+            'frames': self.frames,
+            'inference_calls': self.inference_calls,
+            'saved_vs_every_frame': self.frames - self.inference_calls,
+            'saved_vs_fixed_stride': fixed_calls - self.inference_calls,
+            'fixed_stride': fixed_stride,
+            'frames_by_reason': dict(self.reason_frames),
+            'stride_changes': self.stride_changes,
+            'recent_decisions': [{'frame': f, 'stride': s, 'reason': r} for f, s, r in self.decisions],
+            'decision_log': self.log_path
+        }
+
+    def print_stats(self, fixed_stride=None):
+        stats = self.stats(fixed_stride)
+        print(f"Scheduler: {stats['inference_calls']} detector calls for {stats['frames']} frames "
+              f"(saved {stats['saved_vs_every_frame']} vs every frame, "
+              f"{stats['saved_vs_fixed_stride']} vs fixed stride {stats['fixed_stride']}), "
+              f"{stats['stride_changes']} stride changes")
+        reasons = ', '.join(f"{reason} {count}" for reason, count in self.reason_frames.most_common())
+        print(f"Scheduler frames by reason: {reasons}")
+        if self.decisions:
+            recent = ', '.join(f"{f}: {s} ({r})" for f, s, r in list(self.decisions)[-5:])
+            print(f"Scheduler last stride changes (frame: stride): {recent}")
+        if self.log_path:
+            print(f"Scheduler decision log: {self.log_path}")
+        return stats
+
+    def close(self):
+        """Flush and close the decision log"""
+        if self.log_file is not None:
+            self.log_file.close()
+            self.log_file = None
@@ -0,0 +1,151 @@
+"""
+Asynchronous violation evidence writer
+Encodes and saves violation images on a background worker pool so the detection loop never waits on disk
+"""
+
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+
+class EvidenceWriter:
+    """Worker pool that annotates, encodes and writes evidence images from a bounded queue"""
+
+    FORMATS = {
+        'jpg': cv2.IMWRITE_JPEG_QUALITY,
+        'webp': cv2.IMWRITE_WEBP_QUALITY
+    }
+
+    def __init__(self, output_dir, num_workers=2, max_queue=32, image_format='jpg',
+                 quality=90, crop_only=False, crop_margin=40, metrics=None):
+        image_format = image_format.lower().lstrip('.')
+        if image_format == 'jpeg':
+            image_format = 'jpg'
+        if image_format not in self.FORMATS:
+            raise ValueError(f"Unsupported evidence format: {image_format} (expected jpg or webp)")
+
+        self.output_dir = output_dir
+        self.image_format = image_format
+        self.encode_params = [self.FORMATS[image_format], int(quality)]
+        self.crop_only = crop_only
+        self.crop_margin = crop_margin
+        self.metrics = metrics  # optional StageMetrics, records the 'disk_io' stage
+        os.makedirs(output_dir, exist_ok=True)
+
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.stats_lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.max_queue_depth = 0
+        self.write_latencies = deque(maxlen=1000)
+
+        self.workers = []
+        for i in range(max(1, num_workers)):
+            worker = threading.Thread(target=self._worker_loop, name=f"evidence-writer-{i}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def submit(self, frame, name, bbox=None, lines=()):
+        """Queue one evidence image without blocking. Returns False if it had to be dropped"""
+        if self.crop_only and bbox is not None:
+            image, bbox = self.crop(frame, bbox)
+        else:
+            image = frame.copy()
+
+        try:
+            self.queue.put_nowait((image, name, bbox, list(lines)))
+        except queue.Full:
+            with self.stats_lock:
+                self.dropped += 1
+            print(f"Evidence queue full - dropped {name}")
+            return False
+
+        with self.stats_lock:
+            self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+        return True
+
+    def crop(self, frame, bbox):
+        """Copy the vehicle region plus margin, returning the crop and the bbox in crop coordinates"""
+        height, width = frame.shape[:2]
+        x1, y1, x2, y2 = [int(v) for v in bbox]
+        cx1 = max(0, x1 - self.crop_margin)
+        cy1 = max(0, y1 - self.crop_margin)
+        cx2 = min(width, x2 + self.crop_margin)
+        cy2 = min(height, y2 + self.crop_margin)
+        return frame[cy1:cy2, cx1:cx2].copy(), (x1 - cx1, y1 - cy1, x2 - cx1, y2 - cy1)
+
+    def _worker_loop(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                self.queue.task_done()
+                break
+
+            image, name, bbox, lines = job
+            start = time.perf_counter()
+            try:
+                self.annotate(image, bbox, lines)
+                path = os.path.join(self.output_dir, f"{name}.{self.image_format}")
+                ok = cv2.imwrite(path, image, self.encode_params)
+            except Exception as e:
+                print(f"Error writing evidence {name}: {e}")
+                ok = False
+            elapsed = time.perf_counter() - start
+            if self.metrics is not None:
+                self.metrics.record('disk_io', elapsed)
+
+            with self.stats_lock:
+                if ok:
+                    self.written += 1
+                    self.write_latencies.append(elapsed)
+                else:
+                    self.failed += 1
+            self.queue.task_done()
+
+    def annotate(self, image, bbox, lines):
+        """Draw the violating vehicle box and metadata lines at the bottom of the image"""
+        height, width = image.shape[:2]
+        if bbox is not None:
+            x1, y1, x2, y2 = [int(v) for v in bbox]
+            cv2.rectangle(image, (x1, y1), (x2, y2), (0, 0, 255), 2)
+
+        scale = min(1.0, width / 800)
+        y = height - 10
+        for line in reversed(lines):
+            cv2.putText(image, line, (10, y), cv2.FONT_HERSHEY_SIMPLEX, 0.6 * scale, (0, 0, 255), 2)
+            y -= max(12, int(30 * scale))
+
+    def close(self):
+        """Write out everything still queued and stop the workers"""
+        for _ in self.workers:
+            self.queue.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+
+    def stats(self):
+        with self.stats_lock:
+            latencies = np.array(self.write_latencies) * 1000
+            return {
+                'written': self.written,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'queue_depth': self.queue.qsize(),
+                'max_queue_depth': self.max_queue_depth,
+                'avg_write_ms': float(latencies.mean()) if len(latencies) else 0.0,
+                'p95_write_ms': float(np.percentile(latencies, 95)) if len(latencies) else 0.0,
+                'max_write_ms': float(latencies.max()) if len(latencies) else 0.0
+            }
+
+    def print_stats(self):
+        stats = self.stats()
+        print(f"Evidence writer: written {stats['written']}, dropped {stats['dropped']}, "
+              f"failed {stats['failed']}, max queue depth {stats['max_queue_depth']}, "
+              f"write latency avg {stats['avg_write_ms']:.1f}ms p95 {stats['p95_write_ms']:.1f}ms "
+              f"max {stats['max_write_ms']:.1f}ms")
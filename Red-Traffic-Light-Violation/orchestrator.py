@@ -0,0 +1,288 @@
+"""
+Multi-camera orchestrator for the headless traffic monitor
+Chạy mỗi camera trong một process riêng, gán cố định một nhóm core CPU và số luồng torch, tự khởi động lại khi lỗi và tổng hợp throughput
+
+Usage: python orchestrator.py cameras.json [--cores-per-camera N] [--max-restarts 5] [--log-dir orchestrator_logs]
+
+cameras.json:
+{
+  "env": {"DETECTOR_BACKEND": "openvino"},
+  "cameras": [
+    {"name": "cam1", "video": "cam1.mp4", "config": "config_cam1.json"},
+    {"name": "gate", "video": "rtsp://10.0.0.5/stream", "cores": [4, 5], "model": "yolov10n.pt",
+     "env": {"INFERENCE_SERVER": "/tmp/smart_traffic_inference.sock"}}
+  ]
+}
+"config" defaults to config_<video name>.json; "cores" overrides the automatic partition.
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import queue
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from threaded_capture import is_live_source
+
+# Thread pools that would otherwise each start one thread per core in every process
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'NUMEXPR_NUM_THREADS')
+
+# Exit code of a camera whose configuration is unusable (no restart)
+EXIT_CONFIG_ERROR = 2
+
+
+def available_cores():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def partition_cores(cameras, cores, cores_per_camera=None):
+    """CPU list per camera: explicit 'cores' first, the rest split into contiguous equal slices"""
+    automatic = [c for c in cameras if not c.get('cores')]
+    per_camera = cores_per_camera or max(1, len(cores) // max(1, len(automatic)))
+    if per_camera * len(automatic) > len(cores):
+        print(f"⚠ {len(automatic)} cameras x {per_camera} cores > {len(cores)} cores, slices will overlap")
+
+    assignment = {}
+    offset = 0
+    for camera in cameras:
+        if camera.get('cores'):
+            assignment[camera['name']] = list(camera['cores'])
+            continue
+        assignment[camera['name']] = [cores[(offset + i) % len(cores)] for i in range(per_camera)]
+        offset += per_camera
+    return assignment
+
+
+def pin_process(cores):
+    """Pin the current process to cores and size the thread pools to match (call before importing torch)"""
+    threads = str(len(cores))
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = threads
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+    else:
+        try:
+            import psutil
+            psutil.Process().cpu_affinity(cores)
+        except ImportError:
+            print("⚠ psutil chưa được cài, không gán được CPU affinity trên hệ điều hành này")
+
+    import cv2
+    cv2.setNumThreads(len(cores))
+    try:
+        import torch
+        torch.set_num_threads(len(cores))
+        torch.set_num_interop_threads(1)
+    except ImportError:
+        pass
+
+
+def run_camera(camera, cores, env, log_dir, events):
+    """Child process: one headless monitor for one camera"""
+    name = camera['name']
+    os.environ.update({k: str(v) for k, v in env.items()})
+    os.environ.update({k: str(v) for k, v in camera.get('env', {}).items()})
+    if log_dir:
+        log = open(os.path.join(log_dir, f"{name}.log"), 'a', encoding='utf-8', buffering=1)
+        sys.stdout = sys.stderr = log
+
+    pin_process(cores)
+    print(f"=== {name}: pid {os.getpid()}, cores {cores} ===")
+
+    from adaptive_traffic_monitor import AdaptiveTrafficMonitor
+
+    monitor = AdaptiveTrafficMonitor(camera['video'], camera.get('model'), headless=True,
+                                     config_path=camera.get('config'))
+    report = monitor.run_headless(progress=lambda p: events.put((name, 'progress', p)))
+    if report is None:
+        events.put((name, 'error', 'missing or incomplete configuration'))
+        sys.exit(EXIT_CONFIG_ERROR)
+    events.put((name, 'done', report))
+
+
+class CameraProcess:
+    """Supervision state of one camera"""
+
+    def __init__(self, camera, cores):
+        self.camera = camera
+        self.name = camera['name']
+        self.cores = cores
+        self.process = None
+        self.restarts = 0
+        self.next_start = 0.0
+        self.state = 'pending'
+        self.progress = {}
+        self.report = None
+        self.error = None
+
+
+class Orchestrator:
+    """Starts one monitor process per camera and restarts failed ones with exponential backoff"""
+
+    def __init__(self, cameras, env=None, cores_per_camera=None, max_restarts=5, backoff=2.0, max_backoff=60.0,
+                 log_dir='orchestrator_logs', report_interval=10.0):
+        cores = partition_cores(cameras, available_cores(), cores_per_camera)
+        self.cameras = [CameraProcess(camera, cores[camera['name']]) for camera in cameras]
+        self.env = env or {}
+        self.max_restarts = max_restarts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.log_dir = log_dir
+        self.report_interval = report_interval
+        # spawn: children start clean instead of inheriting the parent's thread pools
+        self.context = mp.get_context('spawn')
+        self.events = self.context.Queue()
+        self.start_time = None
+
+    def start(self, camera):
+        camera.process = self.context.Process(target=run_camera, name=f"monitor-{camera.name}",
+                                              args=(camera.camera, camera.cores, self.env, self.log_dir, self.events))
+        camera.process.start()
+        camera.state = 'running'
+        print(f"✓ {camera.name}: started (pid {camera.process.pid}, cores {camera.cores})")
+
+    def handle_event(self, name, kind, payload):
+        camera = next(c for c in self.cameras if c.name == name)
+        if kind == 'progress':
+            camera.progress = payload
+        elif kind == 'done':
+            camera.report = payload
+            print(f"✓ {camera.name}: {payload['frames']} frames at {payload['fps']:.1f} FPS, "
+                  f"{payload['violations']} violations")
+        elif kind == 'error':
+            camera.error = payload
+
+    def supervise(self, camera):
+        """Check one camera process; schedule a restart when it died"""
+        now = time.time()
+        if camera.state == 'waiting' and now >= camera.next_start:
+            self.start(camera)
+            return
+        if camera.state != 'running' or camera.process.is_alive():
+            return
+
+        exitcode = camera.process.exitcode
+        # A recorded video ends normally; a live stream that stops is treated as a failure
+        if exitcode == 0 and not is_live_source(camera.camera['video']):
+            camera.state = 'finished'
+        elif exitcode == EXIT_CONFIG_ERROR:
+            camera.state = 'failed'
+            print(f"✗ {camera.name}: {camera.error or 'configuration error'}, not restarted")
+        elif camera.restarts >= self.max_restarts:
+            camera.state = 'failed'
+            print(f"✗ {camera.name}: exited with code {exitcode}, gave up after {camera.restarts} restarts")
+        else:
+            delay = min(self.max_backoff, self.backoff ** camera.restarts)
+            camera.restarts += 1
+            camera.state = 'waiting'
+            camera.next_start = now + delay
+            print(f"⚠ {camera.name}: exited with code {exitcode}, restart {camera.restarts}/{self.max_restarts} "
+                  f"in {delay:.0f}s")
+
+    def run(self):
+        if self.log_dir:
+            os.makedirs(self.log_dir, exist_ok=True)
+        self.start_time = time.time()
+        for camera in self.cameras:
+            self.start(camera)
+
+        last_report = time.time()
+        try:
+            while any(c.state in ('running', 'waiting') for c in self.cameras):
+                try:
+                    self.handle_event(*self.events.get(timeout=0.5))
+                    while True:
+                        self.handle_event(*self.events.get_nowait())
+                except queue.Empty:
+                    pass
+                for camera in self.cameras:
+                    self.supervise(camera)
+                if time.time() - last_report >= self.report_interval:
+                    last_report = time.time()
+                    self.print_status()
+        except KeyboardInterrupt:
+            print("\nStopping all cameras")
+            for camera in self.cameras:
+                if camera.process is not None and camera.process.is_alive():
+                    camera.process.terminate()
+        finally:
+            for camera in self.cameras:
+                if camera.process is not None:
+                    camera.process.join(timeout=10)
+        return self.summary()
+
+    def print_status(self):
+        total = sum(c.progress.get('fps', 0.0) for c in self.cameras if c.state == 'running')
+        parts = [f"{c.name} {c.progress.get('fps', 0.0):.1f}" for c in self.cameras if c.state == 'running']
+        print(f"[{time.time() - self.start_time:6.0f}s] {total:.1f} FPS total | " + ", ".join(parts))
+
+    def summary(self):
+        """Per-camera results and the aggregate throughput"""
+        rows = []
+        for camera in self.cameras:
+            source = camera.report or camera.progress
+            rows.append({
+                'name': camera.name,
+                'state': camera.state,
+                'cores': camera.cores,
+                'restarts': camera.restarts,
+                'frames': source.get('frames', 0),
+                'fps': source.get('fps', 0.0),
+                'violations': source.get('violations', 0),
+                'report': camera.report
+            })
+        summary = {
+            'cameras': rows,
+            'wall_time_s': time.time() - self.start_time,
+            'total_fps': sum(row['fps'] for row in rows),
+            'total_frames': sum(row['frames'] for row in rows)
+        }
+
+        print(f"\n=== Orchestrator: {len(rows)} cameras ===")
+        print(f"{'camera':<16} {'state':<9} {'cores':>5} {'restarts':>8} {'frames':>8} {'FPS':>7} {'violations':>10}")
+        for row in rows:
+            print(f"{row['name']:<16} {row['state']:<9} {len(row['cores']):>5} {row['restarts']:>8} "
+                  f"{row['frames']:>8} {row['fps']:>7.1f} {row['violations']:>10}")
+        print(f"Total: {summary['total_fps']:.1f} FPS over {summary['total_frames']} frames "
+              f"in {summary['wall_time_s']:.0f}s")
+        return summary
+
+
+def load_profiles(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    cameras = data['cameras'] if isinstance(data, dict) else data
+    for camera in cameras:
+        camera.setdefault('name', os.path.splitext(os.path.basename(camera['video']))[0])
+    names = [camera['name'] for camera in cameras]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Camera names must be unique: {names}")
+    return cameras, data.get('env', {}) if isinstance(data, dict) else {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run one headless monitor process per camera")
+    parser.add_argument('profiles', help="JSON file with the camera list")
+    parser.add_argument('--cores-per-camera', type=int, help="Default: available cores / cameras")
+    parser.add_argument('--max-restarts', type=int, default=5)
+    parser.add_argument('--log-dir', default='orchestrator_logs', help="Per-camera logs ('' = console)")
+    parser.add_argument('--report-interval', type=float, default=10.0, help="Seconds between status lines")
+    parser.add_argument('--output', default='orchestrator_report.json')
+    args = parser.parse_args()
+
+    cameras, env = load_profiles(args.profiles)
+    orchestrator = Orchestrator(cameras, env, args.cores_per_camera, args.max_restarts,
+                                log_dir=args.log_dir, report_interval=args.report_interval)
+    summary = orchestrator.run()
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2, default=str)
+    print(f"✓ Report saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
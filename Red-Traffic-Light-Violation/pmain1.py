@@ -1,15 +1,23 @@
 import cv2
-from ultralytics import YOLO
-import pandas as pd
 import numpy as np
 from test1 import process_frame
 import os
-from tracker import*
 from datetime import datetime
 import time
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from threaded_capture import ThreadedCapture
+from frame_sampler import FrameSampler
+from stage_metrics import StageMetrics
+from evidence_writer import EvidenceWriter
+from adaptive_tracker import AdaptiveTracker
+from signal_cycle import SignalCycleModel
+from detector_backend import load_detector
+from detection_record import from_result
 
 # Use smaller, faster model for better FPS
-model = YOLO(r"D:\PROJECTS\Traffic Detection using YOLO\yolov10n.pt")  # nano model for speed  
+model = load_detector(r"D:\PROJECTS\Traffic Detection using YOLO\yolov10n.pt")  # nano model for speed  
 
 def RGB(event, x, y, flags, param):
     if event == cv2.EVENT_MOUSEMOVE:
@@ -19,12 +27,21 @@ def RGB(event, x, y, flags, param):
 cv2.namedWindow('RGB')
 cv2.setMouseCallback('RGB', RGB)
 
-cap = cv2.VideoCapture(r'D:\PROJECTS\Traffic Detection using YOLO\Red-Traffic-Light-Violation\tr.mp4')
-# cap = cv2.VideoCapture(r'D:\PROJECTS\Traffic Detection using YOLO\Red-Traffic-Light-Violation\16h15.5.9.22.mp4')
+# Detection runs on every DETECTION_STRIDE-th frame. With SHOW_ALL_FRAMES off the frames in
+# between are only grabbed (never decoded) and playback shows the analysed frames only
+DETECTION_STRIDE = 3
+SHOW_ALL_FRAMES = False
+
+# Decode on a background thread so slow detection frames do not stall reading
+sampler = FrameSampler(r'D:\PROJECTS\Traffic Detection using YOLO\Red-Traffic-Light-Violation\tr.mp4',
+                       stride=1 if SHOW_ALL_FRAMES else DETECTION_STRIDE)
+# sampler = FrameSampler(r'D:\PROJECTS\Traffic Detection using YOLO\Red-Traffic-Light-Violation\16h15.5.9.22.mp4')
+cap = ThreadedCapture(sampler)
 my_file = open(r"D:\PROJECTS\Traffic Detection using YOLO\Red-Traffic-Light-Violation\coco.txt", "r")
 data = my_file.read()
 class_list = data.split("\n")
-tracker=Tracker()
+# Kalman tracker keeps IDs stable while detection only runs every few frames
+tracker = AdaptiveTracker(max_distance=35)
 count = 0
 # Adjusted area coordinates for 800x480 resolution
 area = [(254, 250), (222, 299), (670, 314), (678, 258)]
@@ -36,6 +53,16 @@ if not os.path.exists(output_dir):
     os.makedirs(output_dir)
 list1=[]
 
+# Learned light cycle: the pixels are only checked around expected phase changes
+signal_cycle = SignalCycleModel()
+video_fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+
+# Per-stage latency histograms, snapshot in metrics/pmain1.json
+metrics = StageMetrics('pmain1')
+
+# Violation images are encoded and written by a background pool
+evidence_writer = EvidenceWriter(output_dir, metrics=metrics)
+
 # FPS tracking
 fps_counter = 0
 start_time = time.time()
@@ -46,11 +73,14 @@ detected_label = None
 current_detections = []
 current_detection_data = []
 while True:
-    ret, frame = cap.read()
-    count += 1
+    with metrics.stage('decode'):
+        ret, frame = cap.read()
     # Process every frame for real-time playback, but optimize processing
     if not ret:
         break
+    # Source frame position (grabbed frames included)
+    frames_advanced = cap.frame_index - count
+    count = cap.frame_index
 
     # FPS calculation
     fps_counter += 1
@@ -60,40 +90,42 @@ while True:
         start_time = end_time
 
     # Resize to smaller size for faster processing
-    frame = cv2.resize(frame, (800, 480))  # Smaller resolution for better FPS
+    with metrics.stage('resize'):
+        frame = cv2.resize(frame, (800, 480))  # Smaller resolution for better FPS
+    with metrics.stage('track_predict'):
+        tracker.predict(frames_advanced)
+    
+    # Light state from the learned cycle, verified against the pixels when needed
+    video_time = cap.frame_index / video_fps
+    with metrics.stage('light_detection'):
+        if signal_cycle.needs_verification(video_time):
+            frame, light_reading = process_frame(frame)
+            signal_cycle.update(video_time, light_reading)
+            detected_label = light_reading
+        else:
+            detected_label = signal_cycle.phase_at(video_time)
     
     # Only run detection every 3rd frame to save processing power
-    # but display all frames for smooth video
-    if count % 3 == 0:
-        processed_frame, detected_label = process_frame(frame)
-        results = model(frame)
-        a = results[0].boxes.data
+    if count % DETECTION_STRIDE == 0:
+        with metrics.stage('inference'):
+            results = model(frame)
+        # One GPU -> CPU copy of all boxes as a structured record
+        detections = from_result(results[0])
         
         # Store detection results for use in other frames
         current_detections = []
         current_detection_data = []
-        if len(a) > 0:
-            # Convert tensor from GPU to CPU then to numpy
-            a_cpu = a.cpu().numpy() if hasattr(a, 'cpu') else a
-            px = pd.DataFrame(a_cpu).astype("float")
-            list=[]
-            detection_data = []  # Store both bbox and class info
-            for index, row in px.iterrows():
-                x1 = int(row[0])
-                y1 = int(row[1])
-                x2 = int(row[2])
-                y2 = int(row[3])
-                
-                d = int(row[5])
-                c = class_list[d]
-                list.append([x1,y1,x2,y2])
-                detection_data.append(c)
+        if len(detections) > 0:
+            boxes = detections['xyxy'].astype(int).tolist()
+            detection_data = [class_list[d] for d in detections['cls']]  # Store both bbox and class info
                 
-            bbox_idx=tracker.update(list)
+            with metrics.stage('tracking'):
+                bbox_idx=tracker.update(boxes)
             current_detections = bbox_idx
             current_detection_data = detection_data
     
     # Check if there are any detections to display
+    zone_start = time.perf_counter()
     if len(current_detections) == 0:
         cv2.polylines(frame, [np.array(area, np.int32)], True, (0, 255, 0), 2)
         # Display FPS even when no detections
@@ -121,26 +153,36 @@ while True:
                     
                     # Save the image with red label
                     timestamp = datetime.now().strftime('%H-%M-%S-%f')[:-3]  # Include milliseconds
-                    image_filename = f"violation_{id}_{timestamp}.jpg"
-                    output_path = os.path.join(output_dir, image_filename)
+                    image_name = f"violation_{id}_{timestamp}"
                     if list1.count(id)==0:
                        list1.append(id)
-                       cv2.imwrite(output_path, frame)
+                       evidence_writer.submit(frame, image_name, (x3, y3, x4, y4))
                else:     
                     cv2.putText(frame, f'{id}', (x3, y3-10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
                     cv2.rectangle(frame, (x3, y3), (x4, y4), (0, 255, 0), 2)
 
+    metrics.record('zone_test', time.perf_counter() - zone_start)
+    
     cv2.polylines(frame, [np.array(area, np.int32)], True, (0, 255, 0), 2)
     
     # Display FPS
     cv2.putText(frame, f'FPS: {fps_display:.1f}', (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
     cv2.putText(frame, f'Light: {detected_label}', (10, 70), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
     
-    cv2.imshow("RGB", frame)
-    
-    # Add proper delay for real-time playback (30 FPS = ~33ms delay)
-    if cv2.waitKey(33) & 0xFF == ord('q'):
+    with metrics.stage('display'):
+        cv2.imshow("RGB", frame)
+        
+    # Add proper delay for real-time playback (30 FPS = ~33ms delay per source frame)
+    with metrics.stage('pacing'):
+        key = cv2.waitKey(33 * frames_advanced) & 0xFF
+    metrics.frame_done()
+    if key == ord('q'):
         break
 
 cap.release()
 cv2.destroyAllWindows()
+cap.print_stats()
+sampler.print_stats()
+evidence_writer.close()
+evidence_writer.print_stats()
+metrics.print_summary()
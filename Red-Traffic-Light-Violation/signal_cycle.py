@@ -0,0 +1,156 @@
+"""
+Learned fixed-time signal cycle model
+Learns a light's cycle period and phase durations from observed transitions, predicts the phase at any
+video time and asks for pixel verification only around expected transitions plus a sparse sanity check.
+"""
+
+from collections import deque
+
+import numpy as np
+
+
+class SignalCycleModel:
+    """Cycle model for one fixed-time traffic light (times are video seconds, i.e. frame / fps)"""
+
+    def __init__(self, min_cycles=2, min_phase_duration=1.0, verify_window=1.5, sanity_interval=10.0,
+                 drift_mismatches=3, history=24):
+        self.min_cycles = min_cycles
+        self.min_phase_duration = min_phase_duration
+        self.verify_window = verify_window
+        self.sanity_interval = sanity_interval
+        self.drift_mismatches = drift_mismatches
+
+        # Observed phase onsets as (time, phase), oldest first
+        self.onsets = deque(maxlen=history)
+        self.current_phase = None
+        self.pending = None  # (time, phase) of a change not confirmed yet
+
+        # Learned plan
+        self.locked = False
+        self.period = None
+        self.phase_order = []
+        self.durations = {}
+        self.anchor = None  # time at which phase_order[0] last started
+
+        self.last_check = None
+        self.mismatches = 0
+        self.drift_events = 0
+
+    def update(self, t, phase):
+        """Feed a verified phase reading taken at video time t"""
+        if phase not in ("RED", "YELLOW", "GREEN"):
+            return
+        self.last_check = t
+
+        if self.locked:
+            expected = self.phase_at(t)
+            if expected != phase and self.distance_to_transition(t) > self.verify_window:
+                self.mismatches += 1
+                if self.mismatches >= self.drift_mismatches:
+                    self.flag_drift(t, expected, phase)
+            else:
+                self.mismatches = 0
+
+        if phase == self.current_phase:
+            self.pending = None  # the other reading was flicker
+            return
+        if self.current_phase is None:
+            # Joined mid-phase: the true onset of this phase is unknown
+            self.current_phase = phase
+            return
+
+        # A new phase only counts once it has lasted min_phase_duration
+        if self.pending is None or self.pending[1] != phase:
+            self.pending = (t, phase)
+        if t - self.pending[0] >= self.min_phase_duration:
+            self.onsets.append(self.pending)
+            self.current_phase = phase
+            self.pending = None
+            self.learn()
+
+    def learn(self):
+        """Estimate period, phase order and durations from the onset history"""
+        times = np.array([t for t, _ in self.onsets])
+        phases = [p for _, p in self.onsets]
+
+        # Period: median gap between consecutive onsets of the same phase
+        gaps = []
+        for phase in set(phases):
+            phase_times = times[[p == phase for p in phases]]
+            gaps.extend(np.diff(phase_times).tolist())
+        if len(gaps) < self.min_cycles:
+            return
+
+        period = float(np.median(gaps))
+        cycle = []
+        for phase in reversed(phases):
+            if phase in cycle:
+                break
+            cycle.insert(0, phase)
+
+        durations = {}
+        for phase in cycle:
+            lengths = [times[i + 1] - times[i] for i in range(len(phases) - 1) if phases[i] == phase]
+            if not lengths:
+                return
+            durations[phase] = float(np.median(lengths))
+
+        # Scale durations so a full cycle matches the period exactly
+        scale = period / sum(durations.values())
+        self.durations = {phase: d * scale for phase, d in durations.items()}
+        self.period = period
+        self.phase_order = cycle
+        anchors = [t for t, p in self.onsets if p == cycle[0]]
+        self.anchor = anchors[-1]
+        if not self.locked:
+            print(f"Signal cycle learned: period {period:.1f}s, "
+                  + ", ".join(f"{p} {self.durations[p]:.1f}s" for p in cycle))
+        self.locked = True
+
+    def cycle_offset(self, t):
+        return (t - self.anchor) % self.period
+
+    def phase_at(self, t):
+        """Predicted phase at video time t, or None while the cycle is not learned yet"""
+        if not self.locked:
+            return None
+        offset = self.cycle_offset(t)
+        for phase in self.phase_order:
+            offset -= self.durations[phase]
+            if offset < 0:
+                return phase
+        return self.phase_order[-1]
+
+    def distance_to_transition(self, t):
+        """Seconds between t and the nearest expected phase change"""
+        if not self.locked:
+            return 0.0
+        offset = self.cycle_offset(t)
+        boundaries = np.cumsum([0.0] + [self.durations[p] for p in self.phase_order])
+        return float(np.abs(boundaries - offset).min())
+
+    def needs_verification(self, t):
+        """True when the pixels should be checked at time t"""
+        if not self.locked or self.mismatches > 0 or self.pending is not None or self.last_check is None:
+            return True
+        if self.distance_to_transition(t) <= self.verify_window:
+            return True
+        return t - self.last_check >= self.sanity_interval
+
+    def flag_drift(self, t, expected, observed):
+        """The light no longer follows the learned plan: drop it and relearn"""
+        self.drift_events += 1
+        print(f"Signal cycle drift at {t:.1f}s: expected {expected}, observed {observed} - relearning")
+        self.locked = False
+        self.mismatches = 0
+        self.onsets.clear()
+        self.current_phase = observed
+        self.pending = None
+
+    def stats(self):
+        return {
+            'locked': self.locked,
+            'period_s': self.period,
+            'durations_s': dict(self.durations),
+            'drift_events': self.drift_events
+        }
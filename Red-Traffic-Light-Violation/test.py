@@ -1,8 +1,13 @@
 import cv2
 import numpy as np
+import os
+import sys
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from frame_sampler import FrameSampler
 
-cap = cv2.VideoCapture('tr.mp4')
+# Only every 3rd frame is decoded, the others are grabbed and skipped
+cap = FrameSampler('tr.mp4', stride=3)
 
 def process_frame(frame):
     # Define the color ranges
@@ -59,16 +64,8 @@ def process_frame(frame):
     
     return frame,detected_label
 
-count = 0
-
-
-
-
 while True:
     ret, frame = cap.read()
-    count += 1
-    if count % 3 != 0:
-        continue
     if not ret:
         break
 
@@ -82,4 +79,5 @@ while True:
         break
 
 cap.release()
-cv2.destroyAllWindows()
\ No newline at end of file
+cv2.destroyAllWindows()
+cap.print_stats()
\ No newline at end of file
@@ -0,0 +1,529 @@
+"""
+Single-pass multi-analytics pipeline
+Mỗi frame chỉ decode, detect và track một lần; các analyzer (vượt đèn đỏ, tốc độ, mật độ vùng, mũ bảo hiểm) dùng chung kết quả
+
+Usage: python analytics_pipeline.py --video cam1.mp4 --model yolov10n.pt --red-light config_cam1.json
+                                    --speed-line 20,400,1000,400 --zones zones.json --helmet-model helmet.pt
+                                    [--cache-dir detection_cache]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT, 'Red-Traffic-Light-Violation'))
+from adaptive_tracker import AdaptiveTracker
+from detection_cache import DetectionCache
+from detection_record import NO_TRACK, class_ids, from_result, select, to_rows
+from detector_backend import load_detector
+from frame_sampler import FrameSampler
+from stage_metrics import StageMetrics
+from threaded_capture import ThreadedCapture, is_live_source
+
+VEHICLE_LABELS = ('car', 'truck', 'bus', 'motorcycle')
+# Confidence floor of cached detections; any --conf at or above it replays the same cache
+CACHE_CONF = 0.05
+
+
+class FrameContext:
+    """Shared per-frame input of every analyzer.
+
+    detections is the structured record of detection_record with track_id
+    filled in by the tracker; live_ids are the ids the tracker still keeps
+    (including tracks not matched on this frame). frame_size is the (width,
+    height) the boxes refer to, also known when frame is None (cache replay).
+    """
+
+    __slots__ = ('frame', 'index', 'timestamp', 'detections', 'names', 'live_ids', 'frame_size')
+
+    def __init__(self, frame, index, timestamp, detections, names, live_ids, frame_size):
+        self.frame = frame
+        self.index = index
+        self.timestamp = timestamp
+        self.detections = detections
+        self.names = names
+        self.live_ids = live_ids
+        self.frame_size = frame_size
+
+    @property
+    def tracks(self):
+        return self.detections[self.detections['track_id'] != NO_TRACK]
+
+    def labels(self, detections=None):
+        detections = self.detections if detections is None else detections
+        return [self.names[int(c)] for c in detections['cls']]
+
+
+class Analyzer:
+    """Base class of the analytics that subscribe to the shared detections"""
+
+    name = 'analyzer'
+    # False when the analyzer only reads detections/tracks, so cached runs can skip decoding
+    needs_frames = True
+
+    def process(self, context):
+        raise NotImplementedError
+
+    def draw(self, frame, context):
+        pass
+
+    def stats(self):
+        return {}
+
+    def close(self):
+        pass
+
+
+class RedLightAnalyzer(Analyzer):
+    """Red-light violations (AdaptiveTrafficMonitor.check_violations) from a monitor configuration file.
+
+    The polygon and light regions are stored in the monitor's resized frame
+    space and are scaled to the pipeline's frame size on the first frame.
+    """
+
+    name = 'red_light'
+
+    def __init__(self, config_path, output_dir='adaptive_violations', labels=VEHICLE_LABELS):
+        from adaptive_traffic_monitor import TrafficLightDetector
+        from evidence_writer import EvidenceWriter
+
+        with open(config_path, 'r') as f:
+            config_data = json.load(f)
+        self.config = config_data.get('config', {})
+        self.polygon_points = config_data.get('polygon_points', [])
+        self.light_regions = config_data.get('traffic_light_regions', [])
+        if len(self.polygon_points) < 3:
+            raise ValueError(f"{config_path} has no complete violation polygon")
+        self.labels = labels
+
+        self.traffic_light_detector = TrafficLightDetector(use_cycle_model=self.config.get('use_signal_cycle', True))
+        video_name = config_data.get('video_name') or os.path.splitext(os.path.basename(config_path))[0]
+        self.evidence_writer = EvidenceWriter(
+            os.path.join(output_dir, video_name, time.strftime('%Y-%m-%d')),
+            num_workers=self.config.get('evidence_workers', 2),
+            max_queue=self.config.get('evidence_queue_size', 32),
+            image_format=self.config.get('evidence_format', 'jpg'),
+            quality=self.config.get('evidence_quality', 90),
+            crop_only=self.config.get('evidence_crop_only', False))
+
+        self.polygon = None
+        self.regions = None
+        self.light_state = "UNKNOWN"
+        self.violations = []
+
+    def scale_to(self, frame):
+        height, width = frame.shape[:2]
+        sx = width / self.config.get('resize_width', width)
+        sy = height / self.config.get('resize_height', height)
+        self.polygon = np.array([[x * sx, y * sy] for x, y in self.polygon_points], np.int32)
+        self.regions = [[int(x1 * sx), int(y1 * sy), int(x2 * sx), int(y2 * sy)]
+                        for x1, y1, x2, y2 in self.light_regions]
+
+    def process(self, context):
+        if self.polygon is None:
+            self.scale_to(context.frame)
+        self.light_state = self.traffic_light_detector.detect_light_state(context.frame, self.regions,
+                                                                          context.timestamp)
+        if self.light_state != "RED":
+            return
+
+        seen = {v['track_id'] for v in self.violations}
+        tracks = context.tracks
+        for (x1, y1, x2, y2), track_id, label in zip(tracks['xyxy'].astype(int).tolist(),
+                                                     tracks['track_id'].tolist(), context.labels(tracks)):
+            if label not in self.labels or track_id in seen:
+                continue
+            cx, cy = (x1 + x2) // 2, (y1 + y2) // 2
+            if cv2.pointPolygonTest(self.polygon, (cx, cy), False) < 0:
+                continue
+            seen.add(track_id)
+            self.violations.append({'track_id': track_id, 'label': label, 'frame': context.index,
+                                    'time': context.timestamp, 'center': [cx, cy]})
+            print(f"VIOLATION DETECTED: {label} ID:{track_id} at ({cx}, {cy})")
+            self.evidence_writer.submit(context.frame, f"violation_{label}_{track_id}_{context.index}",
+                                        (x1, y1, x2, y2),
+                                        [f"VIOLATION: {label} ID:{track_id}", f"Frame: {context.index}"])
+
+    def draw(self, frame, context):
+        color = (0, 0, 255) if self.light_state == "RED" else (0, 255, 0)
+        cv2.polylines(frame, [self.polygon], True, color, 2)
+        cv2.putText(frame, f"Light: {self.light_state}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
+
+    def stats(self):
+        return {'violations': len(self.violations), 'events': self.violations,
+                'traffic_light': self.traffic_light_detector.stats()}
+
+    def close(self):
+        self.evidence_writer.close()
+        self.evidence_writer.print_stats()
+        print(f"Red light: {len(self.violations)} violations")
+
+
+class SpeedAnalyzer(Analyzer):
+    """Per-track speed from yolov10_speed_detection/speed_new.SpeedEstimator (IPM calibration), on video time.
+
+    The IPM points are calibrated on frame_width x frame_height (1020x500)
+    frames like yolotrack1.py uses, so boxes are scaled to that size first;
+    reg_pts are in the same calibration frame.
+    """
+
+    name = 'speed'
+    needs_frames = False
+
+    def __init__(self, names, reg_pts=None, labels=VEHICLE_LABELS):
+        sys.path.append(os.path.join(ROOT, 'yolov10_speed_detection'))
+        from speed_new import SpeedEstimator
+
+        self.estimator = SpeedEstimator(names, reg_pts=reg_pts)
+        self.labels = labels
+        self.speeds = {}
+        self.max_speeds = {}
+
+    def process(self, context):
+        tracks = context.tracks
+        keep = [label in self.labels for label in context.labels(tracks)]
+        tracks = tracks[np.asarray(keep, dtype=bool)]
+        width, height = context.frame_size
+        scale = np.array([self.estimator.frame_width / width, self.estimator.frame_height / height] * 2,
+                         dtype=np.float32)
+        self.speeds = self.estimator.update(tracks['xyxy'] * scale, tracks['track_id'].tolist(), context.timestamp)
+        for track_id, speed in self.speeds.items():
+            self.max_speeds[track_id] = max(self.max_speeds.get(track_id, 0.0), float(speed))
+        self.estimator.forget(context.live_ids)
+
+    def draw(self, frame, context):
+        tracks = context.tracks
+        for (x1, y1, x2, y2), track_id in zip(tracks['xyxy'].astype(int).tolist(), tracks['track_id'].tolist()):
+            if track_id in self.speeds:
+                cv2.putText(frame, f"{int(self.speeds[track_id])} km/h", (x1, y2 + 15),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 255), 2)
+
+    def stats(self):
+        measured = [s for s in self.max_speeds.values() if s > 0]
+        return {'tracks_measured': len(measured),
+                'mean_max_speed_kmh': float(np.mean(measured)) if measured else 0.0,
+                'top_speed_kmh': max(measured, default=0.0)}
+
+    def close(self):
+        s = self.stats()
+        print(f"Speed: {s['tracks_measured']} tracks measured, mean max {s['mean_max_speed_kmh']:.1f} km/h, "
+              f"top {s['top_speed_kmh']:.1f} km/h")
+
+
+class ZoneCountAnalyzer(Analyzer):
+    """Per-zone vehicle density (draw_count_video_stable.count_vehicles_in_polygons, COCO vehicle classes)"""
+
+    name = 'zones'
+    needs_frames = False
+
+    def __init__(self, polygons):
+        import draw_count_video_stable
+        self.count_vehicles_in_polygons = draw_count_video_stable.count_vehicles_in_polygons
+        self.polygons = [[tuple(p) for p in polygon] for polygon in polygons]
+        self.counts = []
+        self.totals = np.zeros(len(self.polygons), dtype=np.int64)
+        self.peaks = np.zeros(len(self.polygons), dtype=np.int64)
+        self.frames = 0
+
+    def process(self, context):
+        self.counts = self.count_vehicles_in_polygons(to_rows(context.detections), self.polygons, context.names)
+        current = np.array([c['total'] for c in self.counts], dtype=np.int64)
+        self.totals += current
+        self.peaks = np.maximum(self.peaks, current)
+        self.frames += 1
+
+    def draw(self, frame, context):
+        for polygon, counts in zip(self.polygons, self.counts):
+            points = np.array(polygon, np.int32)
+            cv2.polylines(frame, [points], True, counts['color'], 2)
+            cv2.putText(frame, f"{counts['total']} {counts['status']}", tuple(points[0]),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, counts['color'], 2)
+
+    def stats(self):
+        return {'zones': [{'mean_vehicles': float(total / self.frames) if self.frames else 0.0, 'peak': int(peak)}
+                          for total, peak in zip(self.totals, self.peaks)]}
+
+    def close(self):
+        for i, zone in enumerate(self.stats()['zones']):
+            print(f"Zone {i + 1}: mean {zone['mean_vehicles']:.1f} vehicles, peak {zone['peak']}")
+
+
+class HelmetAnalyzer(Analyzer):
+    """Helmet checks on the shared motorbike tracks (helmet model on bike crops, HelmetDetector status rules)"""
+
+    name = 'helmet'
+
+    def __init__(self, helmet_model, bike_label='motorcycle', conf=0.25, backend=None):
+        from helmet_cascade import HelmetCascade
+        from helmet_detection import classify_helmet
+
+        detector = load_detector(helmet_model, backend=backend)
+        self.cascade = HelmetCascade(detector, conf=conf, bike_label=bike_label,
+                                     labels=tuple(detector.names.values()))
+        self.classify = classify_helmet
+        self.status = {}
+        self.helmets = []
+
+    def process(self, context):
+        detections = context.detections
+        self.helmets = self.cascade.detect(context.frame, to_rows(detections), context.names)
+        for helmet in self.helmets:
+            helmet['status'] = self.classify(helmet['label'])
+            track_id = int(detections['track_id'][helmet['bike']])
+            # One status per bike: a no-helmet reading on any frame is kept
+            if track_id != NO_TRACK and self.status.get(track_id) != 'no_helmet':
+                self.status[track_id] = helmet['status']
+
+    def draw(self, frame, context):
+        for helmet in self.helmets:
+            x1, y1, x2, y2 = helmet['box']
+            color = (0, 255, 0) if helmet['status'] == 'helmet' else (0, 0, 255)
+            cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+
+    def stats(self):
+        stats = self.cascade.stats()
+        stats.update({'bikes': len(self.status),
+                      'no_helmet': sum(1 for s in self.status.values() if s == 'no_helmet')})
+        return stats
+
+    def close(self):
+        self.cascade.print_stats()
+        s = self.stats()
+        print(f"Helmet: {s['no_helmet']}/{s['bikes']} tracked bikes without helmet")
+
+
+class AnalyticsPipeline:
+    """source -> detector -> tracker -> analyzers, one detection per analysed frame for all analyzers.
+
+    stride > 1 only grabs the frames in between (see FrameSampler); the
+    tracker predicts over the skipped frames like the headless monitor.
+    With cache_dir, the raw detections of a recorded video (every class,
+    down to CACHE_CONF) are stored on the first run and replayed afterwards:
+    the detector is not loaded, and frames are not even decoded when no
+    analyzer needs pixels. conf, the tracked classes and the tracker are
+    applied to the records on every run, so changing them reuses the cache.
+    """
+
+    def __init__(self, source, model_path, analyzers=(), conf=0.5, stride=1, resize=None, track_labels=VEHICLE_LABELS,
+                 max_distance=50, backend=None, cache_dir=None):
+        self.source = source
+        self.source_name = os.path.splitext(os.path.basename(str(source)))[0]
+        self.live = is_live_source(source)
+        self.stride = stride
+        self.conf = conf
+        self.resize = resize
+        self.sampler = None
+        self.cap = None
+        self.fps = 30.0
+        self.frame_size = None
+
+        # Everything that changes the raw detections is part of the cache key; conf, classes and
+        # tracking are applied after the cache
+        self.cache = None
+        self.detect_conf = conf
+        if cache_dir and not self.live:
+            self.detect_conf = min(conf, CACHE_CONF)
+            self.cache = DetectionCache(cache_dir, source, model_path, {
+                'conf_floor': self.detect_conf, 'stride': stride,
+                'resize': list(resize) if resize else None, 'backend': backend})
+
+        self.model = None
+        if self.cache is not None and self.cache.load():
+            self.cache.print_info()
+            self.names = self.cache.names
+            self.fps = self.cache.fps
+            self.frame_size = self.cache.frame_size
+        else:
+            self.model = load_detector(model_path, backend=backend)
+            self.names = self.model.names
+        self.track_class_ids = class_ids(self.names, track_labels) if track_labels else None
+        self.tracker = AdaptiveTracker(max_distance=max_distance, use_kalman=True)
+        self.analyzers = list(analyzers)
+        self.metrics = StageMetrics(f"analytics_pipeline_{self.source_name}")
+
+    @property
+    def replay(self):
+        return self.model is None
+
+    def add(self, analyzer):
+        self.analyzers.append(analyzer)
+        return analyzer
+
+    def detect(self, frame):
+        """Raw detections of frame: every class, down to the cache floor when caching"""
+        with self.metrics.stage('inference'):
+            return from_result(self.model.predict(frame, conf=self.detect_conf, verbose=False, save=False)[0])
+
+    def track(self, detections, frames_advanced):
+        """Detections above conf of the tracked classes, with the tracker's ids in track_id"""
+        detections = detections[detections['conf'] >= self.conf]
+        if self.track_class_ids is not None:
+            detections = select(detections, self.track_class_ids)
+        with self.metrics.stage('track_predict'):
+            self.tracker.predict(frames_advanced)
+        with self.metrics.stage('tracking'):
+            tracked = self.tracker.update(detections['xyxy'].astype(int).tolist())
+            detections['track_id'] = [t[4] for t in tracked]
+        return detections
+
+    def decoded_frames(self):
+        """(frame_index, frames_advanced, frame) of the analysed frames"""
+        self.sampler = FrameSampler(self.source, stride=self.stride)
+        self.cap = ThreadedCapture(self.sampler, policy='drop_oldest' if self.live else 'block')
+        if not self.replay:
+            self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        count = 0
+        try:
+            while True:
+                with self.metrics.stage('decode'):
+                    ret, frame = self.cap.read()
+                if not ret:
+                    return
+                frames_advanced = self.cap.frame_index - count
+                count = self.cap.frame_index
+                if self.resize is not None:
+                    with self.metrics.stage('resize'):
+                        frame = cv2.resize(frame, self.resize)
+                self.frame_size = (frame.shape[1], frame.shape[0])
+                yield count, frames_advanced, frame
+        finally:
+            self.cap.release()
+
+    def cached_frames(self):
+        """Frame indices of the cache without decoding (frame is None)"""
+        count = 0
+        for frame_index in self.cache.columns['frame_index'].tolist():
+            yield frame_index, frame_index - count, None
+            count = frame_index
+
+    def run(self, display=False, report_every=1000):
+        needs_frames = display or any(analyzer.needs_frames for analyzer in self.analyzers)
+        source = self.decoded_frames() if needs_frames or not self.replay else self.cached_frames()
+        writer = self.cache.writer(self.names) if self.cache is not None and not self.replay else None
+
+        run_start = time.perf_counter()
+        count = 0
+        frames = 0
+        next_report = report_every
+        completed = False
+        try:
+            for count, frames_advanced, frame in source:
+                if self.replay:
+                    with self.metrics.stage('cache_read'):
+                        cached_index, detections = self.cache.frame(frames)
+                    if cached_index != count:
+                        raise RuntimeError(f"Detection cache does not match the video at frame {count}")
+                else:
+                    detections = self.detect(frame)
+                    if writer is not None:
+                        writer.append(count, detections)
+                detections = self.track(detections, frames_advanced)
+                live_ids = set(self.tracker.ids.tolist())
+                frames += 1
+
+                # Video time for recorded files, so speeds and the signal cycle do not depend on throughput
+                timestamp = time.time() if self.live else count / self.fps
+                context = FrameContext(frame, count, timestamp, detections, self.names, live_ids,
+                                       self.frame_size)
+                for analyzer in self.analyzers:
+                    with self.metrics.stage(analyzer.name):
+                        analyzer.process(context)
+                self.metrics.frame_done()
+
+                if display:
+                    for analyzer in self.analyzers:
+                        analyzer.draw(frame, context)
+                    cv2.imshow('Analytics Pipeline', frame)
+                    if cv2.waitKey(1) & 0xFF == ord('q'):
+                        break
+                if count >= next_report:
+                    next_report += report_every
+                    print(f"Frame {count}: {count / (time.perf_counter() - run_start):.1f} FPS")
+            else:
+                completed = True
+        finally:
+            source.close()
+            if display:
+                cv2.destroyAllWindows()
+            for analyzer in self.analyzers:
+                analyzer.close()
+            # Only a run over the whole video becomes a cache
+            if writer is not None:
+                if completed:
+                    writer.commit(self.fps, self.frame_size)
+                else:
+                    writer.abort()
+
+        wall_time = time.perf_counter() - run_start
+        report = {
+            'source': self.source_name,
+            'frames': count,
+            'analysed_frames': frames,
+            'wall_time_s': wall_time,
+            'fps': count / wall_time if wall_time > 0 else 0.0,
+            'from_cache': self.replay,
+            'decoded': needs_frames or not self.replay,
+            'analyzers': {analyzer.name: analyzer.stats() for analyzer in self.analyzers}
+        }
+        print(f"\n=== Analytics pipeline: {self.source_name} ===")
+        print(f"Frames: {count} (analysed: {frames}) in {wall_time:.1f}s, {report['fps']:.1f} FPS, "
+              f"one detection per analysed frame for {len(self.analyzers)} analyzers"
+              + (" (from cache)" if self.replay else ""))
+        if self.sampler is not None:
+            self.sampler.print_stats()
+        report['stages'] = self.metrics.print_summary()['stages']
+        return report
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Red light, speed, zone and helmet analytics on one detection pass")
+    parser.add_argument('--video', required=True, help="Video file, stream URL or camera index")
+    parser.add_argument('--model', default='yolov10n.pt', help="Vehicle detector weights (COCO classes)")
+    parser.add_argument('--backend', default=None, help="torch, onnx, openvino or auto (default DETECTOR_BACKEND)")
+    parser.add_argument('--conf', type=float, default=0.5)
+    parser.add_argument('--stride', type=int, default=1, help="Analyse every Nth frame (the others are only grabbed)")
+    parser.add_argument('--resize', help="WxH, e.g. 800x480 to match adaptive_traffic_monitor configurations")
+    parser.add_argument('--red-light', metavar='CONFIG', help="adaptive_traffic_monitor configuration file")
+    parser.add_argument('--speed-line', help="x1,y1,x2,y2 speed line in the 1020x500 calibration frame "
+                                             "(enables speed estimation)")
+    parser.add_argument('--zones', help="JSON file with a list of polygons for zone counting")
+    parser.add_argument('--helmet-model', help="Helmet model weights (enables helmet checks on motorbikes)")
+    parser.add_argument('--cache-dir', help="Store/replay detections here (e.g. detection_cache) to re-run "
+                                            "analytics without inference")
+    parser.add_argument('--display', action='store_true')
+    parser.add_argument('--output', default='analytics_report.json')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    resize = tuple(int(v) for v in args.resize.lower().split('x')) if args.resize else None
+    pipeline = AnalyticsPipeline(args.video, args.model, conf=args.conf, stride=args.stride, resize=resize,
+                                 backend=args.backend, cache_dir=args.cache_dir)
+    if args.red_light:
+        pipeline.add(RedLightAnalyzer(args.red_light))
+    if args.speed_line:
+        x1, y1, x2, y2 = (int(v) for v in args.speed_line.split(','))
+        pipeline.add(SpeedAnalyzer(pipeline.names, reg_pts=[(x1, y1), (x2, y2)]))
+    if args.zones:
+        with open(args.zones, 'r', encoding='utf-8') as f:
+            pipeline.add(ZoneCountAnalyzer(json.load(f)))
+    if args.helmet_model:
+        pipeline.add(HelmetAnalyzer(args.helmet_model, backend=args.backend))
+    if not pipeline.analyzers:
+        print("⚠ No analyzer enabled (--red-light, --speed-line, --zones, --helmet-model)")
+
+    report = pipeline.run(display=args.display)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"✓ Report saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Compare detector backends on the validation set
+So sánh độ trễ (latency) và mAP giữa PyTorch, ONNX Runtime và OpenVINO trên cùng dữ liệu của validate.py
+"""
+
+import argparse
+import glob
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+import yaml
+
+from detector_backend import BACKENDS, load_detector, module_available
+
+DEFAULT_WEIGHTS = r"D:/JUPYTER NOTEBOOK/Traffic Detection using YOLO/runs/train/exp/weights/best.pt"
+DEFAULT_DATA = r"D:/JUPYTER NOTEBOOK/Traffic Detection using YOLO/data.yaml"
+
+
+def val_images(data, limit):
+    """First `limit` image paths of the val split listed in a dataset yaml"""
+    with open(data, encoding='utf-8') as f:
+        config = yaml.safe_load(f)
+    val = config['val']
+    if not os.path.isabs(val) and config.get('path'):
+        val = os.path.join(config['path'], val)
+    images = []
+    for pattern in ('*.jpg', '*.jpeg', '*.png', '*.bmp'):
+        images.extend(glob.glob(os.path.join(val, pattern)))
+    return sorted(images)[:limit]
+
+
+def measure_latency(detector, images, warmup=3, imgsz=640):
+    """Per-image predict latency in ms (mean / p50 / p95), images preloaded so disk I/O is excluded"""
+    frames = [cv2.imread(path) for path in images]
+    frames = [frame for frame in frames if frame is not None]
+    if not frames:
+        return {}
+    for frame in frames[:warmup]:
+        detector.predict(frame, imgsz=imgsz, verbose=False)
+
+    latencies = []
+    for frame in frames:
+        start = time.perf_counter()
+        detector.predict(frame, imgsz=imgsz, verbose=False)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies = np.array(latencies)
+    return {
+        'images': len(latencies),
+        'mean_ms': float(latencies.mean()),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+        'fps': float(1000 / latencies.mean())
+    }
+
+
+def measure_accuracy(detector, data, imgsz=640):
+    metrics = detector.val(data=data, imgsz=imgsz, batch=1, verbose=False, plots=False)
+    return {'map50': float(metrics.box.map50), 'map50_95': float(metrics.box.map)}
+
+
+def model_size_mb(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, name))
+                   for root, _, files in os.walk(path) for name in files) / 1e6
+    return os.path.getsize(path) / 1e6 if os.path.exists(path) else 0.0
+
+
+def print_report(rows, baseline='torch'):
+    base = next((row for row in rows if row['backend'] == baseline), rows[0])
+    print(f"\n{'backend':<14} {'size MB':>8} {'mean ms':>9} {'p95 ms':>8} {'FPS':>7} {'speedup':>8} "
+          f"{'mAP50':>7} {'mAP50-95':>9} {'ΔmAP50-95':>10}")
+    for row in rows:
+        speedup = base['mean_ms'] / row['mean_ms'] if row.get('mean_ms') else 0.0
+        delta = row.get('map50_95', 0.0) - base.get('map50_95', 0.0)
+        print(f"{row['backend']:<14} {row['size_mb']:>8.1f} {row.get('mean_ms', 0):>9.1f} {row.get('p95_ms', 0):>8.1f} "
+              f"{row.get('fps', 0):>7.1f} {speedup:>7.2f}x {row.get('map50', 0):>7.3f} "
+              f"{row.get('map50_95', 0):>9.3f} {delta:>+10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency and mAP parity of detector backends")
+    parser.add_argument('--weights', default=DEFAULT_WEIGHTS)
+    parser.add_argument('--data', default=DEFAULT_DATA, help="Dataset yaml (same as validate.py)")
+    parser.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--images', type=int, default=100, help="Val images used for the latency test")
+    parser.add_argument('--skip-map', action='store_true', help="Latency only")
+    parser.add_argument('--output', default='backend_report.json')
+    args = parser.parse_args()
+
+    images = val_images(args.data, args.images)
+    print(f"✓ {len(images)} val images for latency")
+
+    rows = []
+    for backend in args.backends:
+        if backend == 'onnx' and not module_available('onnxruntime'):
+            print("⚠ onnxruntime chưa được cài, bỏ qua backend onnx")
+            continue
+        if backend == 'openvino' and not module_available('openvino'):
+            print("⚠ openvino chưa được cài, bỏ qua backend openvino")
+            continue
+
+        detector = load_detector(args.weights, backend=backend, imgsz=args.imgsz)
+        if detector.backend != backend:
+            continue
+        row = {'backend': backend, 'path': detector.path, 'size_mb': model_size_mb(detector.path)}
+        row.update(measure_latency(detector, images, imgsz=args.imgsz))
+        if not args.skip_map:
+            row.update(measure_accuracy(detector, args.data, imgsz=args.imgsz))
+        rows.append(row)
+
+    if not rows:
+        print("✗ Không có backend nào chạy được")
+        return
+    print_report(rows)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({'weights': args.weights, 'data': args.data, 'imgsz': args.imgsz, 'results': rows}, f, indent=2)
+    print(f"✓ Report saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Batched inference on object crops
+Gom tất cả crop (vd. xe máy) trong một frame, letterbox về cùng kích thước nhỏ và chạy detector một lần cho cả batch
+"""
+
+import time
+
+import cv2
+import numpy as np
+
+
+def letterbox(image, size):
+    """Resize keeping aspect ratio and pad to size x size; returns (canvas, ratio, (left, top))"""
+    height, width = image.shape[:2]
+    ratio = min(size / height, size / width)
+    new_w, new_h = max(1, int(round(width * ratio))), max(1, int(round(height * ratio)))
+    resized = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    canvas = np.full((size, size, 3), 114, dtype=np.uint8)
+    top, left = (size - new_h) // 2, (size - new_w) // 2
+    canvas[top:top + new_h, left:left + new_w] = resized
+    return canvas, ratio, (left, top)
+
+
+class CropBatcher:
+    """Runs a Detector on many crops of one frame in as few calls as possible.
+
+    Every crop is letterboxed to crop_size, so the whole set is one fixed-shape
+    batch (split into batch_size chunks). Boxes found in a crop are mapped back
+    to frame coordinates and tagged with the index of the crop they came from.
+    """
+
+    def __init__(self, detector, crop_size=320, batch_size=32, padding=0.0, min_crop=8):
+        self.detector = detector
+        self.crop_size = crop_size
+        self.batch_size = batch_size
+        self.padding = padding
+        self.min_crop = min_crop
+
+        self.crops_run = 0
+        self.calls = 0
+        self.frames = 0
+        self.busy_time = 0.0
+
+    def crop_regions(self, frame_shape, boxes):
+        """Integer (x1, y1, x2, y2) crop of every box, padded and clipped to the frame (None if too small)"""
+        height, width = frame_shape[:2]
+        regions = []
+        for box in boxes:
+            x1, y1, x2, y2 = box[:4]
+            pad_x, pad_y = (x2 - x1) * self.padding, (y2 - y1) * self.padding
+            x1, y1 = max(0, int(x1 - pad_x)), max(0, int(y1 - pad_y))
+            x2, y2 = min(width, int(x2 + pad_x)), min(height, int(y2 + pad_y))
+            regions.append((x1, y1, x2, y2) if x2 - x1 >= self.min_crop and y2 - y1 >= self.min_crop else None)
+        return regions
+
+    def detect(self, frame, boxes, conf=0.25, classes=None, **kwargs):
+        """Detections inside the boxes as an (N, 7) array of [x1, y1, x2, y2, class_id, confidence, crop_index]"""
+        start = time.perf_counter()
+        self.frames += 1
+        regions = self.crop_regions(frame.shape, boxes)
+        indices = [i for i, region in enumerate(regions) if region is not None]
+        if not indices:
+            return np.zeros((0, 7), dtype=np.float32)
+
+        images, transforms = [], []
+        for i in indices:
+            x1, y1, x2, y2 = regions[i]
+            canvas, ratio, (left, top) = letterbox(frame[y1:y2, x1:x2], self.crop_size)
+            images.append(canvas)
+            transforms.append((ratio, left, top, x1, y1))
+
+        parts = []
+        # Exports with a static batch (e.g. older OpenVINO INT8 models) take fewer images per call
+        batch_size = min(self.batch_size, getattr(self.detector, 'max_batch', None) or self.batch_size)
+        for offset in range(0, len(images), batch_size):
+            results = self.detector.predict(images[offset:offset + batch_size], imgsz=self.crop_size,
+                                            conf=conf, classes=classes, verbose=False, save=False, **kwargs)
+            self.calls += 1
+            for n, result in enumerate(results):
+                if result.boxes is None or len(result.boxes) == 0:
+                    continue
+                ratio, left, top, x0, y0 = transforms[offset + n]
+                xyxy = (result.boxes.xyxy.cpu().numpy() - (left, top, left, top)) / ratio + (x0, y0, x0, y0)
+                parts.append(np.column_stack([xyxy, result.boxes.cls.cpu().numpy(), result.boxes.conf.cpu().numpy(),
+                                              np.full(len(xyxy), indices[offset + n])]))
+
+        self.crops_run += len(images)
+        self.busy_time += time.perf_counter() - start
+        if not parts:
+            return np.zeros((0, 7), dtype=np.float32)
+        return np.concatenate(parts).astype(np.float32)
+
+    def stats(self):
+        return {
+            'crops': self.crops_run,
+            'calls': self.calls,
+            'crops_per_frame': self.crops_run / self.frames if self.frames else 0.0,
+            'crops_per_s': self.crops_run / self.busy_time if self.busy_time > 0 else 0.0
+        }
+
+    def print_stats(self, label='Crop batch'):
+        s = self.stats()
+        print(f"{label}: {s['crops']} crops in {s['calls']} calls ({s['crops_per_frame']:.1f}/frame), "
+              f"{s['crops_per_s']:.0f} crops/s")
@@ -0,0 +1,202 @@
+"""
+Persistent detection cache
+Lưu detection thô của từng frame theo video, model và tham số suy luận dưới dạng cột .npy memory-map, để chạy lại analytics mà không cần suy luận
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+from detection_record import DETECTION_DTYPE, NO_TRACK
+
+CACHE_VERSION = 3
+
+# Columns of the per-detection and per-frame data (ragged rows are addressed by offsets)
+DETECTION_COLUMNS = ('xyxy', 'conf', 'cls')
+RAW_COLUMNS = {
+    'xyxy': (np.float32, (4,)),
+    'conf': (np.float32, ()),
+    'cls': (np.int32, ()),
+    'frame_index': (np.int64, ()),
+    'counts': (np.int32, ())
+}
+
+
+def video_hash(path, samples=64, chunk=1 << 16):
+    """SHA-1 of the file size and evenly spaced chunks (a full hash of an overnight recording takes minutes)"""
+    size = os.path.getsize(path)
+    digest = hashlib.sha1(str(size).encode())
+    with open(path, 'rb') as f:
+        for i in range(samples):
+            f.seek(size * i // samples)
+            digest.update(f.read(chunk))
+        f.seek(max(0, size - chunk))
+        digest.update(f.read(chunk))
+    return digest.hexdigest()
+
+
+def model_hash(weights):
+    """SHA-1 of the weights file (of the name when ultralytics resolves it, e.g. 'yolov10n.pt')"""
+    if not os.path.isfile(weights):
+        return hashlib.sha1(weights.encode()).hexdigest()
+    digest = hashlib.sha1()
+    with open(weights, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DetectionCache:
+    """Raw per-frame detections of one video for one model and one set of inference parameters.
+
+    A cache is a directory root/<video>-<key> of .npy columns, memory-mapped
+    on load; key hashes the video, the weights and params (confidence floor,
+    stride, resize, ...), so changing any of them starts a new cache.
+    Records are stored before the class filter and the tracker, so callers
+    apply their own threshold, classes and tracking on replay.
+    The detections of cached frame i are rows offsets[i]:offsets[i + 1].
+    """
+
+    def __init__(self, root, video_path, model_path, params):
+        self.params = params
+        self.video_hash = video_hash(video_path)
+        self.model_hash = model_hash(model_path)
+        key = json.dumps({'version': CACHE_VERSION, 'video': self.video_hash, 'model': self.model_hash,
+                          'params': params}, sort_keys=True)
+        self.key = hashlib.sha1(key.encode()).hexdigest()[:16]
+        self.video_name = os.path.splitext(os.path.basename(video_path))[0]
+        self.path = os.path.join(root, f"{self.video_name}-{self.key}")
+        self.meta = None
+        self.columns = {}
+
+    @property
+    def names(self):
+        return {int(k): v for k, v in self.meta['names'].items()}
+
+    @property
+    def fps(self):
+        return self.meta['fps']
+
+    @property
+    def frame_size(self):
+        """(width, height) of the frames the cached boxes refer to"""
+        return tuple(self.meta['frame_size'])
+
+    def load(self):
+        """Memory-map a complete cache; False when there is none for this key"""
+        meta_path = os.path.join(self.path, 'meta.json')
+        if not os.path.exists(meta_path):
+            return False
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        for name in DETECTION_COLUMNS + ('frame_index', 'offsets'):
+            self.columns[name] = np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode='r')
+        return True
+
+    def __len__(self):
+        return len(self.columns['frame_index']) if self.columns else 0
+
+    def frame(self, position):
+        """(frame_index, detections) of the position-th cached frame, without track ids"""
+        start, end = self.columns['offsets'][position:position + 2]
+        detections = np.empty(end - start, dtype=DETECTION_DTYPE)
+        for name in DETECTION_COLUMNS:
+            detections[name] = self.columns[name][start:end]
+        detections['track_id'] = NO_TRACK
+        return int(self.columns['frame_index'][position]), detections
+
+    def writer(self, names):
+        return CacheWriter(self, names)
+
+    def print_info(self):
+        print(f"✓ Detection cache: {len(self)} frames, {int(self.columns['offsets'][-1])} detections "
+              f"({self.path})")
+
+
+class CacheWriter:
+    """Streams the frames of one run to raw column files; commit() turns them into the cache.
+
+    Nothing is visible under the cache path until commit(), so an
+    interrupted run never leaves a partial cache behind.
+    """
+
+    def __init__(self, cache, names):
+        self.cache = cache
+        self.names = {int(k): v for k, v in dict(names).items()}
+        self.tmp_path = cache.path + '.tmp'
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+        os.makedirs(self.tmp_path)
+        self.files = {name: open(os.path.join(self.tmp_path, f"{name}.bin"), 'wb') for name in RAW_COLUMNS}
+        self.frames = 0
+        self.detections = 0
+        self.start = time.time()
+
+    def _write(self, name, values):
+        dtype, _ = RAW_COLUMNS[name]
+        self.files[name].write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+
+    def append(self, frame_index, detections):
+        for name in DETECTION_COLUMNS:
+            self._write(name, detections[name])
+        self._write('frame_index', [frame_index])
+        self._write('counts', [len(detections)])
+        self.frames += 1
+        self.detections += len(detections)
+
+    def _to_npy(self, name, rows):
+        """Raw column file -> .npy, copied through memory maps (no full column in RAM)"""
+        dtype, shape = RAW_COLUMNS[name]
+        raw_path = os.path.join(self.tmp_path, f"{name}.bin")
+        column = np.lib.format.open_memmap(os.path.join(self.tmp_path, f"{name}.npy"), mode='w+',
+                                           dtype=dtype, shape=(rows,) + shape)
+        if rows:
+            column[:] = np.memmap(raw_path, dtype=dtype, mode='r', shape=(rows,) + shape)
+        column.flush()
+        del column
+        os.remove(raw_path)
+
+    def _offsets(self, counts_name, offsets_name):
+        counts = np.fromfile(os.path.join(self.tmp_path, f"{counts_name}.bin"), dtype=np.int32)
+        offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        np.save(os.path.join(self.tmp_path, f"{offsets_name}.npy"), offsets)
+        os.remove(os.path.join(self.tmp_path, f"{counts_name}.bin"))
+
+    def commit(self, fps, frame_size):
+        """Finish the cache; fps converts cached frame indices back to video time"""
+        for f in self.files.values():
+            f.close()
+        for name in DETECTION_COLUMNS:
+            self._to_npy(name, self.detections)
+        self._to_npy('frame_index', self.frames)
+        self._offsets('counts', 'offsets')
+
+        meta = {
+            'version': CACHE_VERSION,
+            'video': self.cache.video_name,
+            'video_hash': self.cache.video_hash,
+            'model_hash': self.cache.model_hash,
+            'params': self.cache.params,
+            'names': self.names,
+            'fps': fps,
+            'frame_size': list(frame_size),
+            'frames': self.frames,
+            'detections': self.detections,
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'build_time_s': time.time() - self.start
+        }
+        with open(os.path.join(self.tmp_path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+        shutil.rmtree(self.cache.path, ignore_errors=True)
+        os.replace(self.tmp_path, self.cache.path)
+        print(f"✓ Detection cache saved: {self.frames} frames, {self.detections} detections ({self.cache.path})")
+        return self.cache.load()
+
+    def abort(self):
+        for f in self.files.values():
+            f.close()
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
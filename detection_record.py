@@ -0,0 +1,76 @@
+"""
+Structured detection records
+Chuyển kết quả model sang một mảng NumPy có cấu trúc (xyxy, conf, cls, track_id) trong một lần copy, lọc lớp bằng tập ID số nguyên
+"""
+
+import numpy as np
+
+DETECTION_DTYPE = np.dtype([
+    ('xyxy', np.float32, (4,)),
+    ('conf', np.float32),
+    ('cls', np.int32),
+    ('track_id', np.int32)
+])
+NO_TRACK = -1
+
+
+def empty_detections():
+    return np.zeros(0, dtype=DETECTION_DTYPE)
+
+
+def from_array(data, track_ids=None):
+    """Record from an (N, 6) [x1, y1, x2, y2, conf, class_id] array (the layout of boxes.data)"""
+    data = np.asarray(data, dtype=np.float32).reshape(-1, 6)
+    detections = np.empty(len(data), dtype=DETECTION_DTYPE)
+    detections['xyxy'] = data[:, :4]
+    detections['conf'] = data[:, 4]
+    detections['cls'] = data[:, 5]
+    detections['track_id'] = NO_TRACK if track_ids is None else track_ids
+    return detections
+
+
+def from_result(result):
+    """Record of one ultralytics result; boxes.data is copied off the device once.
+
+    boxes.data holds [x1, y1, x2, y2, conf, cls] or, with tracking,
+    [x1, y1, x2, y2, track_id, conf, cls].
+    """
+    boxes = result.boxes
+    if boxes is None or len(boxes) == 0:
+        return empty_detections()
+    data = boxes.data
+    data = data.cpu().numpy() if hasattr(data, 'cpu') else np.asarray(data)
+    if data.shape[1] == 7:
+        return from_array(data[:, [0, 1, 2, 3, 5, 6]], data[:, 4].astype(np.int32))
+    return from_array(data)
+
+
+def from_results(results):
+    """Records of every result of a predict() call"""
+    return [from_result(result) for result in results]
+
+
+def class_ids(names, wanted):
+    """Integer ids of the class names in `wanted` (names is a model.names dict or a class list)"""
+    items = names.items() if isinstance(names, dict) else enumerate(names)
+    return np.array(sorted(int(i) for i, name in items if name in wanted), dtype=np.int32)
+
+
+def select(detections, ids):
+    """Detections whose class id is in ids"""
+    return detections[np.isin(detections['cls'], ids)]
+
+
+def shift(detections, dx, dy):
+    """Copy of detections with boxes moved by (dx, dy), e.g. from crop to frame coordinates"""
+    shifted = detections.copy()
+    shifted['xyxy'] += np.array([dx, dy, dx, dy], dtype=np.float32)
+    return shifted
+
+
+def to_rows(detections, confidence=True):
+    """(N, 6) float array [x1, y1, x2, y2, class_id, conf] (without conf: (N, 5))"""
+    columns = [detections['xyxy'], detections['cls'][:, None]]
+    if confidence:
+        columns.append(detections['conf'][:, None])
+    return np.hstack(columns).astype(np.float64) if len(detections) else np.zeros((0, 5 + confidence))
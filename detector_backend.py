@@ -0,0 +1,174 @@
+"""
+Interchangeable detector backends (PyTorch / ONNX Runtime / OpenVINO)
+Tự động export model .pt sang ONNX hoặc OpenVINO, lưu cache cạnh file weights và chạy cùng API predict() của ultralytics
+Model INT8 (tạo bởi quantize.py) được chọn qua DETECTOR_PRECISION=int8
+"""
+
+import importlib.util
+import json
+import os
+
+import torch
+from ultralytics import YOLO
+
+BACKENDS = ('torch', 'onnx', 'openvino')
+PRECISIONS = ('fp32', 'int8')
+
+
+def module_available(name):
+    return importlib.util.find_spec(name) is not None
+
+
+def resolve_backend(backend=None):
+    """Backend name from the argument, else DETECTOR_BACKEND, else 'auto'.
+
+    'auto' keeps PyTorch when a GPU is available; on CPU-only machines it picks
+    OpenVINO, then ONNX Runtime, whichever is installed.
+    """
+    backend = (backend or os.environ.get('DETECTOR_BACKEND') or 'auto').lower()
+    if backend == 'auto':
+        if torch.cuda.is_available():
+            return 'torch'
+        if module_available('openvino'):
+            return 'openvino'
+        if module_available('onnxruntime'):
+            return 'onnx'
+        return 'torch'
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown detector backend '{backend}', expected one of {BACKENDS} or 'auto'")
+    return backend
+
+
+def resolve_precision(precision=None):
+    """Precision from the argument, else DETECTOR_PRECISION, else fp32"""
+    precision = (precision or os.environ.get('DETECTOR_PRECISION') or 'fp32').lower()
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown detector precision '{precision}', expected one of {PRECISIONS}")
+    return precision
+
+
+def artefact_path(weights, backend, int8=False):
+    """Where the exported model of weights lives (next to the .pt file)"""
+    stem, _ = os.path.splitext(weights)
+    if backend == 'onnx':
+        return stem + ('_int8.onnx' if int8 else '.onnx')
+    if backend == 'openvino':
+        return stem + ('_int8_openvino_model' if int8 else '_openvino_model')
+    return weights
+
+
+def export_model(weights, backend, imgsz=640, force=False):
+    """Export weights for backend unless an up-to-date export is cached; returns the artefact path"""
+    if backend == 'torch':
+        return weights
+    path = artefact_path(weights, backend)
+    # Sidecar with the export settings: re-export when the weights or imgsz change
+    info_path = path + '.export.json'
+    info = {'imgsz': imgsz, 'weights_mtime': os.path.getmtime(weights) if os.path.exists(weights) else None}
+
+    if not force and os.path.exists(path) and os.path.exists(info_path):
+        with open(info_path, encoding='utf-8') as f:
+            if json.load(f) == info:
+                return path
+
+    print(f"Exporting {weights} -> {backend} (imgsz={imgsz})...")
+    # Dynamic input shape so ROI crops and other imgsz values work with one export
+    path = str(YOLO(weights).export(format=backend, imgsz=imgsz, dynamic=True))
+    with open(path + '.export.json', 'w', encoding='utf-8') as f:
+        json.dump(info, f)
+    print(f"✓ Exported model cached at {path}")
+    return path
+
+
+def static_batch(path, backend):
+    """Fixed batch size of an OpenVINO model (None when dynamic or unknown), e.g. an older INT8 export"""
+    if backend != 'openvino' or not module_available('openvino'):
+        return None
+    try:
+        import openvino as ov
+        xml = path if path.endswith('.xml') else next(os.path.join(path, f) for f in sorted(os.listdir(path))
+                                                      if f.endswith('.xml'))
+        dim = ov.Core().read_model(xml).inputs[0].get_partial_shape()[0]
+        return dim.get_length() if dim.is_static else None
+    except Exception:
+        return None
+
+
+class Detector:
+    """YOLO detector on a selectable backend with the ultralytics predict() interface.
+
+    Without a GPU (and always for exported backends) inference runs on the CPU
+    whatever device the caller passes, so scripts written for device=0 keep
+    working on edge boxes.
+    """
+
+    def __init__(self, weights, backend=None, imgsz=640, task='detect', precision=None):
+        self.weights = weights
+        self.backend = resolve_backend(backend)
+        self.imgsz = imgsz
+        self.precision = resolve_precision(precision)
+
+        path = weights
+        if self.precision == 'int8':
+            # INT8 models are produced offline by quantize.py (they need calibration images)
+            path = artefact_path(weights, self.backend, int8=True)
+            if self.backend == 'torch' or not os.path.exists(path):
+                print(f"⚠ No INT8 {self.backend} model for {weights} (run quantize.py), using FP32")
+                self.precision = 'fp32'
+                path = weights
+        if self.backend != 'torch' and self.precision == 'fp32':
+            try:
+                path = export_model(weights, self.backend, imgsz)
+            except Exception as e:
+                print(f"⚠ Export to {self.backend} failed ({e}), using PyTorch")
+                self.backend = 'torch'
+        self.path = path
+        self.model = YOLO(path, task=task)
+        self.names = self.model.names
+        # Largest list predict() accepts (None = any); TiledDetector and CropBatcher split their batches by it
+        self.max_batch = static_batch(path, self.backend)
+        if self.max_batch is not None:
+            print(f"⚠ {path} has a static batch of {self.max_batch}, batched inference is split accordingly")
+
+        if self.backend == 'torch' and torch.cuda.is_available():
+            self.device = 0
+        else:
+            self.device = 'cpu'
+
+    def _device(self, kwargs):
+        if self.device == 'cpu' or kwargs.get('device') is None:
+            kwargs['device'] = self.device
+        return kwargs
+
+    def predict(self, source=None, **kwargs):
+        return self.model.predict(source=source, **self._device(kwargs))
+
+    def __call__(self, source=None, **kwargs):
+        return self.predict(source, **kwargs)
+
+    def track(self, source=None, **kwargs):
+        return self.model.track(source=source, **self._device(kwargs))
+
+    def val(self, **kwargs):
+        kwargs.setdefault('imgsz', self.imgsz)
+        return self.model.val(**self._device(kwargs))
+
+    def to_cpu(self):
+        """Move off the GPU onto the fastest installed CPU backend instead of PyTorch on CPU"""
+        if self.device == 'cpu':
+            return self
+        backend = 'openvino' if module_available('openvino') else 'onnx' if module_available('onnxruntime') else 'torch'
+        detector = Detector(self.weights, backend=backend, imgsz=self.imgsz, precision=self.precision)
+        detector.device = 'cpu'
+        print(f"✓ Detector backend: {detector.backend} ({detector.path}, device=cpu)")
+        return detector
+
+    def __repr__(self):
+        return f"Detector({self.path!r}, backend={self.backend!r}, precision={self.precision!r}, device={self.device!r})"
+
+
+def load_detector(weights, backend=None, imgsz=640, **kwargs):
+    """Detector for weights on the configured backend, with a one-line status print"""
+    detector = Detector(weights, backend=backend, imgsz=imgsz, **kwargs)
+    print(f"✓ Detector backend: {detector.backend} {detector.precision.upper()} ({detector.path}, device={detector.device})")
+    return detector
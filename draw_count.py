@@ -1,6 +1,8 @@
-from ultralytics import YOLO
+from detector_backend import load_detector
 import cv2
 import numpy as np
+from zone_index import ZoneIndex
+from detection_record import from_result, to_rows
 import torch
 import os
 
@@ -9,6 +11,7 @@ polygons = []  # Lưu danh sách các đa giác (mỗi đa giác là danh sách
 current_polygon = []  # Lưu các điểm của đa giác đang vẽ
 drawing = False
 current_frame = None  # Biến lưu frame hiện tại
+zone_index = ZoneIndex()  # Bitmask các đa giác, chỉ vẽ lại khi đa giác thay đổi
 
 def draw_polygon(event, x, y, flags, param):
     global drawing, current_polygon, polygons, current_frame
@@ -33,28 +36,14 @@ def draw_polygon(event, x, y, flags, param):
         cv2.polylines(img_copy, [np.array(polygons[-1])], True, (0, 255, 0), 2)
         cv2.imshow('Frame', img_copy)
 
-def is_vehicle_in_polygon(box, polygon):
-    """Kiểm tra xem tâm của bounding box có nằm trong đa giác hay không"""
-    box_center_x = (box[0] + box[2]) / 2
-    box_center_y = (box[1] + box[3]) / 2
-    polygon_np = np.array(polygon, dtype=np.int32)
-    return cv2.pointPolygonTest(polygon_np, (box_center_x, box_center_y), False) >= 0
-
 def count_vehicles_in_polygons(boxes, polygons, class_names):
-    """Đếm số lượng xe trong từng đa giác"""
-    polygon_counts = []
-    for polygon in polygons:
-        counts = {'bike': 0, 'car': 0}
-        for box in boxes:
-            if is_vehicle_in_polygon(box, polygon):
-                class_id = int(box[4])
-                class_name = class_names[class_id]
-                if class_name == 'bike':
-                    counts['bike'] += 1
-                elif class_name == 'car':
-                    counts['car'] += 1
-        polygon_counts.append(counts)
-    return polygon_counts
+    """Đếm số lượng xe trong từng đa giác (tra tâm box trên bitmask của zone_index)"""
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 5)
+    per_class = zone_index.count(boxes, boxes[:, 4].astype(int), polygons, minlength=len(class_names))
+    names = [class_names[i] for i in range(len(class_names))]
+    bike = [i for i, name in enumerate(names) if name == 'bike']
+    car = [i for i, name in enumerate(names) if name == 'car']
+    return [{'bike': int(row[bike].sum()), 'car': int(row[car].sum())} for row in per_class]
 
 def save_predictions(polygons, polygon_counts, filename='predict.txt'):
     """Lưu tọa độ đa giác và số lượng xe vào file"""
@@ -69,11 +58,10 @@ def main():
 
     # Kiểm tra GPU
     if not torch.cuda.is_available():
-        print("GPU không khả dụng. Vui lòng kiểm tra cài đặt CUDA!")
-        exit()
+        print("⚠ GPU không khả dụng, chạy trên CPU (backend chọn qua DETECTOR_BACKEND)")
 
     # Load model YOLO
-    model = YOLO(r"D:\PROJECTS\Traffic Detection using YOLO\runs\train\exp\weights\best.pt")
+    model = load_detector(r"D:\PROJECTS\Traffic Detection using YOLO\runs\train\exp\weights\best.pt")
     # model = YOLO(r"D:\JUPYTER NOTEBOOK\Traffic Detection using YOLO\runs\train_bike\exp_bike\weights\best.pt")
     
     # Đường dẫn đến ảnh hoặc video
@@ -114,12 +102,7 @@ def main():
 
             # Dự đoán với YOLO
             results = model.predict(source=current_frame, device=0, save=False)
-            boxes = []
-            for result in results:
-                for box in result.boxes:
-                    x_min, y_min, x_max, y_max = box.xyxy[0].tolist()
-                    class_id = box.cls[0].item()
-                    boxes.append([x_min, y_min, x_max, y_max, class_id])
+            boxes = to_rows(from_result(results[0]), confidence=False)
 
             # Vẽ bounding box của xe
             for box in boxes:
@@ -172,12 +155,7 @@ def main():
     else:
         # Xử lý ảnh tĩnh
         results = model.predict(source=current_frame, device=0, save=False)
-        boxes = []
-        for result in results:
-            for box in result.boxes:
-                x_min, y_min, x_max, y_max = box.xyxy[0].tolist()
-                class_id = box.cls[0].item()
-                boxes.append([x_min, y_min, x_max, y_max, class_id])
+        boxes = to_rows(from_result(results[0]), confidence=False)
 
         while True:
             # Vẽ bounding box của xe
@@ -1,10 +1,14 @@
-from ultralytics import YOLO
+from detector_backend import load_detector
 import cv2
 import numpy as np
 import torch
 import time
-import threading
-from queue import Queue
+from stage_metrics import StageMetrics
+from pipeline_executor import StagedPipeline
+from frame_sampler import FrameSampler
+from zone_rollups import ZoneRollups
+from zone_index import ZoneIndex
+from detection_record import from_result, to_rows
 
 # Biến toàn cục
 polygons = []  # Lưu danh sách các đa giác (mỗi đa giác là danh sách các điểm)
@@ -12,7 +16,7 @@ current_polygon = []  # Lưu các điểm của đa giác đang vẽ
 drawing = False
 current_frame = None  # Biến lưu frame hiện tại
 frame_with_overlay = None  # Frame đã vẽ overlay
-frame_queue = Queue(maxsize=5)  # Queue để xử lý frame bất đồng bộ
+zone_index = ZoneIndex()  # Bitmask các đa giác, chỉ vẽ lại khi đa giác thay đổi
 
 def draw_polygon(event, x, y, flags, param):
     global drawing, current_polygon, polygons, current_frame, frame_with_overlay
@@ -30,33 +34,17 @@ def draw_polygon(event, x, y, flags, param):
         current_polygon.clear()
         print(f"Đã tạo đa giác thứ {len(polygons)} với {len(polygons[-1])} điểm")
 
-def is_vehicle_in_polygon(box, polygon):
-    """Kiểm tra xem tâm của bounding box có nằm trong đa giác hay không"""
-    if len(polygon) < 3:
-        return False
-    
-    box_center_x = (box[0] + box[2]) / 2
-    box_center_y = (box[1] + box[3]) / 2
-    polygon_np = np.array(polygon, dtype=np.int32)
-    return cv2.pointPolygonTest(polygon_np, (box_center_x, box_center_y), False) >= 0
-
 def count_vehicles_in_polygons(boxes, polygons, class_names):
-    """Đếm số lượng xe trong từng đa giác"""
-    polygon_counts = []
-    for polygon in polygons:
-        counts = {'bike': 0, 'car': 0, 'total': 0}
-        for box in boxes:
-            if is_vehicle_in_polygon(box, polygon):
-                class_id = int(box[4])
-                if class_id < len(class_names):
-                    class_name = class_names[class_id]
-                    if class_name in ['bike', 'motorcycle']:
-                        counts['bike'] += 1
-                    elif class_name in ['car', 'truck', 'bus']:
-                        counts['car'] += 1
-                    counts['total'] += 1
-        polygon_counts.append(counts)
-    return polygon_counts
+    """Đếm số lượng xe trong từng đa giác (tra tâm box trên bitmask của zone_index)"""
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 6)
+    class_ids = boxes[:, 4].astype(int)
+    known = class_ids < len(class_names)
+    per_class = zone_index.count(boxes[known], class_ids[known], polygons, minlength=len(class_names))
+    names = [class_names[i] for i in range(len(class_names))]
+    bike = [i for i, name in enumerate(names) if name in ['bike', 'motorcycle']]
+    car = [i for i, name in enumerate(names) if name in ['car', 'truck', 'bus']]
+    return [{'bike': int(row[bike].sum()), 'car': int(row[car].sum()), 'total': int(row.sum())}
+            for row in per_class]
 
 def save_predictions(polygons, polygon_counts, filename='predict_video.txt'):
     """Lưu tọa độ đa giác và số lượng xe vào file"""
@@ -81,33 +69,6 @@ def save_predictions(polygons, polygon_counts, filename='predict_video.txt'):
         f.write(f"Tổng ô tô: {total_cars}\n")
         f.write(f"Tổng phương tiện: {total_bikes + total_cars}\n")
 
-def process_frame_thread(model, class_names):
-    """Thread xử lý frame để tối ưu hiệu suất"""
-    global frame_queue
-    
-    while True:
-        if not frame_queue.empty():
-            frame_data = frame_queue.get()
-            if frame_data is None:  # Signal to stop
-                break
-                
-            frame, frame_id = frame_data
-            
-            # Dự đoán với YOLO
-            results = model.predict(source=frame, device=0, save=False, verbose=False, conf=0.3)
-            
-            boxes = []
-            for result in results:
-                if result.boxes is not None:
-                    for box in result.boxes:
-                        x_min, y_min, x_max, y_max = box.xyxy[0].tolist()
-                        class_id = box.cls[0].item()
-                        confidence = box.conf[0].item()
-                        boxes.append([x_min, y_min, x_max, y_max, class_id, confidence])
-            
-            # Lưu kết quả vào frame_data
-            frame_data.append(boxes)
-
 def draw_overlay(frame, boxes, polygons, current_polygon, polygon_counts, class_names, fps, processing_time):
     """Vẽ tất cả overlay lên frame"""
     height, width = frame.shape[:2]
@@ -222,7 +183,7 @@ def main():
     # Load model YOLO
     print("Đang tải model YOLO...")
     try:
-        model = YOLO(r"D:\PROJECTS\Traffic Detection using YOLO\runs\train\exp\weights\best.pt")
+        model = load_detector(r"D:\PROJECTS\Traffic Detection using YOLO\runs\train\exp\weights\best.pt")
         print("✓ Model đã được tải thành công")
     except Exception as e:
         print(f"✗ Lỗi tải model: {e}")
@@ -273,10 +234,12 @@ def main():
     print(f"✓ Classes: {class_names}")
     
     # Biến theo dõi hiệu suất
+    metrics = StageMetrics('draw_count_video')
+    # Chuỗi thời gian số xe theo vùng (1s / 1 phút / 15 phút) ghi vào thư mục rollups
+    rollups = ZoneRollups(['bike', 'car'], prefix='draw_count_video')
     fps_counter = 0
     fps_start_time = time.time()
     current_fps = 0
-    last_frame_time = time.time()
     
     print("\n=== BẮT ĐẦU XỬ LÝ VIDEO ===")
     print("Hướng dẫn:")
@@ -285,62 +248,67 @@ def main():
     print("- Nhấn 'S' để lưu kết quả")
     print("- Nhấn 'Q' để thoát")
     
+    # Giảm skip frames để video không bị tua nhanh
+    skip_frames = max(1, int(original_fps / target_fps)) if original_fps > target_fps else 1
+    print(f"✓ Skip frames: {skip_frames}")
+    
+    # Các stage chạy trên luồng riêng: decode -> inference -> đếm -> vẽ, main thread chỉ hiển thị
+    state = {'fps': 0.0}
+    # Frame bị skip chỉ grab() chứ không giải mã (chỉ skip khi FPS gốc cao hơn target)
+    sampler = FrameSampler(cap, stride=skip_frames)
+    
+    def decode_stage():
+        ret, frame = sampler.read()
+        if not ret:
+            print("Hết video hoặc lỗi đọc frame")
+            return None
+        return {'frame_id': sampler.frame_index, 'frame': frame, 'start': time.time()}
+    
+    def inference_stage(item):
+        # Dự đoán với YOLO - tăng confidence để giảm tải
+        results = model.predict(source=item['frame'], device=device, save=False,
+                              verbose=False, conf=0.3, iou=0.5)
+        item['boxes'] = to_rows(from_result(results[0]))
+        return item
+    
+    def count_stage(item):
+        # Đọc đa giác tại thời điểm đếm để đa giác mới vẽ có hiệu lực ngay
+        item['polygons'] = [list(polygon) for polygon in polygons]
+        item['counts'] = count_vehicles_in_polygons(item['boxes'], item['polygons'], class_names)
+        item['processing_time'] = (time.time() - item['start']) * 1000
+        return item
+    
+    def render_stage(item):
+        item['overlay'] = draw_overlay(item['frame'], item['boxes'], item['polygons'], list(current_polygon),
+                                       item['counts'], class_names, state['fps'], item['processing_time'])
+        return item
+    
+    pipeline = StagedPipeline(decode_stage, [
+        ('inference', inference_stage),
+        ('zone_test', count_stage),
+        ('drawing', render_stage)
+    ], queue_size=4, metrics=metrics, name='draw_count_video')
+    polygon_counts = []
+    
     try:
-        frame_id = 0
-        # Giảm skip frames để video không bị tua nhanh
-        skip_frames = max(1, int(original_fps / target_fps)) if original_fps > target_fps else 1
-        print(f"✓ Skip frames: {skip_frames}")
-        
-        while cap.isOpened():
+        for item in pipeline:
             current_time = time.time()
-            
-            # Đọc frame
-            ret, frame = cap.read()
-            if not ret:
-                print("Hết video hoặc lỗi đọc frame")
-                break
-            
-            frame_id += 1
-            
-            # Chỉ skip frames khi FPS gốc cao hơn target
-            if skip_frames > 1 and frame_id % skip_frames != 0:
-                continue
-            
-            current_frame = frame.copy()
-            
-            # Tính thời gian xử lý
-            process_start = time.time()
-            
-            # Dự đoán với YOLO - tăng confidence để giảm tải
-            results = model.predict(source=current_frame, device=device, save=False, 
-                                  verbose=False, conf=0.3, iou=0.5)
-            
-            # Trích xuất boxes
-            boxes = []
-            for result in results:
-                if result.boxes is not None:
-                    for box in result.boxes:
-                        x_min, y_min, x_max, y_max = box.xyxy[0].tolist()
-                        class_id = box.cls[0].item()
-                        confidence = box.conf[0].item()
-                        boxes.append([x_min, y_min, x_max, y_max, class_id, confidence])
-            
-            # Đếm xe trong các đa giác
-            polygon_counts = count_vehicles_in_polygons(boxes, polygons, class_names)
-            
-            processing_time = (time.time() - process_start) * 1000
-            
-            # Vẽ overlay
-            frame_with_overlay = draw_overlay(current_frame, boxes, polygons, current_polygon, 
-                                            polygon_counts, class_names, current_fps, processing_time)
+            current_frame = item['frame']
+            frame_with_overlay = item['overlay']
+            polygon_counts = item['counts']
+            with metrics.stage('rollups'):
+                rollups.update(item['frame_id'] / original_fps, polygon_counts)
             
             # Hiển thị frame
-            cv2.imshow('Traffic Detection - Video', frame_with_overlay)
+            with metrics.stage('display'):
+                cv2.imshow('Traffic Detection - Video', frame_with_overlay)
+            metrics.frame_done()
             
             # Tính FPS thực tế
             fps_counter += 1
             if time.time() - fps_start_time >= 1.0:
                 current_fps = fps_counter / (time.time() - fps_start_time)
+                state['fps'] = current_fps
                 fps_counter = 0
                 fps_start_time = time.time()
             
@@ -385,13 +353,18 @@ def main():
     except Exception as e:
         print(f"Lỗi: {e}")
     finally:
-        cap.release()
+        pipeline.stop()
+        sampler.release()
         cv2.destroyAllWindows()
+        sampler.print_stats()
+        pipeline.print_stats()
+        metrics.print_summary()
+        rollups.close()
+        rollups.print_stats()
         
-        # Tự động lưu kết quả cuối cùng nếu có đa giác
+        # Tự động lưu kết quả cuối cùng nếu có đa giác (số xe của frame cuối cùng)
         if polygons:
             print("Đang tự động lưu kết quả cuối cùng...")
-            polygon_counts = count_vehicles_in_polygons([], polygons, class_names)
             save_predictions(polygons, polygon_counts)
             print("✓ Đã lưu kết quả cuối cùng")
         
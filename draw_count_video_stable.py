@@ -1,14 +1,22 @@
-from ultralytics import YOLO
+from detector_backend import load_detector
 import cv2
 import numpy as np
 import torch
 import time
+from threaded_capture import ThreadedCapture
+from stage_metrics import StageMetrics
+from zone_index import ZoneIndex
+from occupancy_heatmap import OccupancyHeatmap
+from zone_rollups import ZoneRollups
+from tiled_inference import TiledDetector
+from detection_record import from_result, select, to_rows
 
 # Biến toàn cục
 polygons = []
 current_polygon = []
 drawing = False
 current_frame = None
+zone_index = ZoneIndex()  # Bitmask các đa giác, chỉ vẽ lại khi đa giác thay đổi
 
 def draw_polygon(event, x, y, flags, param):
     global drawing, current_polygon, polygons, current_frame
@@ -26,14 +34,6 @@ def draw_polygon(event, x, y, flags, param):
         current_polygon.clear()
         print(f"Đã tạo đa giác thứ {len(polygons)} với {len(polygons[-1])} điểm")
 
-def is_vehicle_in_polygon(box, polygon):
-    if len(polygon) < 3:
-        return False
-    box_center_x = (box[0] + box[2]) / 2
-    box_center_y = (box[1] + box[3]) / 2
-    polygon_np = np.array(polygon, dtype=np.int32)
-    return cv2.pointPolygonTest(polygon_np, (box_center_x, box_center_y), False) >= 0
-
 def get_density_color(total_vehicles):
     """Trả về màu và trạng thái dựa trên mật độ xe"""
     if total_vehicles <= 5:
@@ -65,42 +65,54 @@ def draw_heatmap_on_polygon(frame, polygon, density_info):
     if len(polygon) < 3:
         return
     
-    # Tạo mask cho polygon
-    mask = np.zeros(frame.shape[:2], dtype=np.uint8)
+    # Chỉ xử lý trong bounding box của polygon thay vì cả frame
     pts = np.array(polygon, dtype=np.int32)
-    cv2.fillPoly(mask, [pts], 255)
+    x, y, w, h = cv2.boundingRect(pts)
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + w, frame.shape[1]), min(y + h, frame.shape[0])
+    if x1 <= x0 or y1 <= y0:
+        return
+    roi = frame[y0:y1, x0:x1]
+    
+    # Tạo mask cho polygon
+    mask = np.zeros(roi.shape[:2], dtype=np.uint8)
+    cv2.fillPoly(mask, [pts - (x0, y0)], 255)
     
     # Tạo overlay với màu tương ứng
-    overlay = frame.copy()
-    color = density_info['color']
-    overlay[mask == 255] = color
+    overlay = np.empty_like(roi)
+    overlay[:] = density_info['color']
     
     # Áp dụng độ trong suốt (alpha blending)
     alpha = 0.3  # Độ trong suốt 30%
-    cv2.addWeighted(overlay, alpha, frame, 1 - alpha, 0, frame)
+    blended = cv2.addWeighted(overlay, alpha, roi, 1 - alpha, 0)
+    cv2.copyTo(blended, mask, roi)
+
+def detect_vehicles(model, tiler, frame, device):
+    """Boxes [x1, y1, x2, y2, class_id, confidence] của các phương tiện giao thông"""
+    vehicle_classes = get_vehicle_classes()
+    
+    # Nguồn 4K: suy luận theo tile (bỏ tile ngoài các vùng) để không mất xe ở xa
+    if tiler.enabled_for(frame):
+        detections = tiler.detect(frame, polygons, conf=0.3, classes=list(vehicle_classes))
+        return [[x1, y1, x2, y2, int(class_id), conf] for x1, y1, x2, y2, class_id, conf in detections.tolist()]
+    
+    results = model.predict(source=frame, device=device, save=False, verbose=False, conf=0.3)
+    # Chỉ lấy các phương tiện giao thông (lọc theo ID lớp trên cả mảng)
+    return to_rows(select(from_result(results[0]), list(vehicle_classes)))
 
 def count_vehicles_in_polygons(boxes, polygons, class_names):
     vehicle_classes = get_vehicle_classes()
     polygon_counts = []
     
-    for polygon in polygons:
-        counts = {
-            'car': 0,
-            'motorcycle': 0, 
-            'bus': 0,
-            'truck': 0,
-            'total': 0
-        }
-        
-        for box in boxes:
-            if is_vehicle_in_polygon(box, polygon):
-                class_id = int(box[4])
-                
-                # Chỉ đếm các phương tiện giao thông
-                if class_id in vehicle_classes:
-                    vehicle_type = vehicle_classes[class_id]
-                    counts[vehicle_type] += 1
-                    counts['total'] += 1
+    # Một lần tra bitmask cho tất cả box, đếm theo (zone, class)
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 6)
+    per_class = zone_index.count(boxes, boxes[:, 4].astype(int), polygons,
+                                 minlength=max(vehicle_classes) + 1)
+    
+    for row in per_class:
+        # Chỉ đếm các phương tiện giao thông
+        counts = {vehicle_type: int(row[class_id]) for class_id, vehicle_type in vehicle_classes.items()}
+        counts['total'] = sum(counts.values())
         
         # Thêm thông tin mật độ và màu
         color, status = get_density_color(counts['total'])
@@ -120,14 +132,16 @@ def main():
     if torch.cuda.is_available():
         print(f"✓ GPU available: {torch.cuda.get_device_name()}")
         print("⚠ Using CPU for stability (avoiding CUDA/torchvision compatibility issues)")
-        device = 'cpu'  # Force CPU cho ổn định
     else:
         print("⚠ Sử dụng CPU")
-        device = 'cpu'
     
     # Load YOLOv8 pre-trained model (thay vì custom model)
     try:
-        model = YOLO('yolo12n.pt')  # Sử dụng YOLOv8 nano - tự động download nếu chưa có
+        model = load_detector('yolo12n.pt')  # Sử dụng YOLOv8 nano - tự động download nếu chưa có
+        # Force CPU cho ổn định - chuyển sang backend CPU nhanh nhất (OpenVINO/ONNX Runtime)
+        model = model.to_cpu()
+        device = model.device
+        tiler = TiledDetector(model)
         print("✓ YOLOv12 model loaded")
     except Exception as e:
         print(f"✗ Model error: {e}")
@@ -137,8 +151,8 @@ def main():
     video_path = input("Video path (hoặc '0' cho webcam): ").strip()
     source = 0 if video_path == "0" else video_path
     
-    # Open video
-    cap = cv2.VideoCapture(source)
+    # Open video - decode trên luồng riêng (webcam: bỏ frame cũ nhất khi buffer đầy)
+    cap = ThreadedCapture(source)
     if not cap.isOpened():
         print("✗ Không thể mở video!")
         return
@@ -153,6 +167,10 @@ def main():
     
     print(f"✓ Video: {width}x{height} @ {original_fps:.1f} FPS")
     
+    # Heatmap chiếm chỗ theo thời gian, xuất .npy/.png mỗi 60s video vào thư mục heatmaps
+    heatmap = OccupancyHeatmap((width, height), default_dt=1.0 / original_fps, export_dir='heatmaps')
+    heatmap_mode = True
+    
     # Set target FPS - GIẢM ĐỂ TRÁNH TUA NHANH
     TARGET_FPS = 15  # Cố định 15 FPS
     frame_time = 1.0 / TARGET_FPS
@@ -168,6 +186,9 @@ def main():
     class_names = model.names
     
     # Performance tracking
+    metrics = StageMetrics('draw_count_video_stable')
+    # Chuỗi thời gian số xe theo vùng (1s / 1 phút / 15 phút) ghi vào thư mục rollups
+    rollups = ZoneRollups(get_vehicle_classes().values(), prefix='draw_count_video_stable')
     fps_counter = 0
     fps_start = time.time()
     current_fps = 0
@@ -175,8 +196,9 @@ def main():
     print("\n=== STARTED ===")
     print("Controls: Q-Quit | S-Save | C-Clear | Left click-Add point | Right click-Finish")
     print("Vehicle Detection: Car (Red) | Motorcycle (Yellow) | Truck (Purple) | Bus (Blue)")
-    print("Heatmap: Green=Stable (≤5 vehicles) | Red=Congested (>5 vehicles)")
-    print("Density is calculated per zone and visualized with transparent color overlay")
+    print("Heatmap: M-Toggle occupancy/status heatmap | E-Export heatmap")
+    print("Status: Green=Stable (≤5 vehicles) | Red=Congested (>5 vehicles)")
+    print("Occupancy heatmap accumulates vehicle footprints over time (half-life 10s) inside the zones")
     
     frame_count = 0
     last_time = time.time()
@@ -186,7 +208,8 @@ def main():
             loop_start = time.time()
             
             # Read frame
-            ret, frame = cap.read()
+            with metrics.stage('decode'):
+                ret, frame = cap.read()
             if not ret:
                 print("Video ended")
                 break
@@ -195,40 +218,42 @@ def main():
             current_frame = frame.copy()
             
             # YOLO prediction với error handling
+            inference_start = time.perf_counter()
             try:
-                results = model.predict(source=current_frame, device=device, 
-                                      save=False, verbose=False, conf=0.3)
+                boxes = detect_vehicles(model, tiler, current_frame, device)
             except Exception as e:
                 print(f"⚠ GPU Error: {e}")
                 print("🔄 Switching to CPU...")
-                device = 'cpu'
-                model = model.to('cpu')
-                results = model.predict(source=current_frame, device=device, 
-                                      save=False, verbose=False, conf=0.3)
+                model = model.to_cpu()
+                device = model.device
+                tiler.detector = model
+                boxes = detect_vehicles(model, tiler, current_frame, device)
             
-            # Extract boxes - chỉ lấy phương tiện giao thông
-            vehicle_classes = get_vehicle_classes()
-            boxes = []
-            for result in results:
-                if result.boxes is not None:
-                    for box in result.boxes:
-                        class_id = int(box.cls[0].item())
-                        # Chỉ lấy các phương tiện giao thông
-                        if class_id in vehicle_classes:
-                            x_min, y_min, x_max, y_max = box.xyxy[0].tolist()
-                            confidence = box.conf[0].item()
-                            boxes.append([x_min, y_min, x_max, y_max, class_id, confidence])
+            metrics.record('inference', time.perf_counter() - inference_start)
             
             # Count vehicles
-            polygon_counts = count_vehicles_in_polygons(boxes, polygons, class_names)
+            with metrics.stage('zone_test'):
+                polygon_counts = count_vehicles_in_polygons(boxes, polygons, class_names)
+            
+            # Vị trí frame trong nguồn (frame bị drop_oldest bỏ qua vẫn được tính) để thời gian không bị trôi
+            video_time = cap.frame_index / original_fps
+            with metrics.stage('heatmap'):
+                heatmap.update(boxes, video_time)
+            
+            with metrics.stage('rollups'):
+                rollups.update(video_time, polygon_counts)
             
             # Draw everything
+            drawing_start = time.perf_counter()
             display_frame = current_frame.copy()
             
             # Vẽ heatmap trước (dưới cùng)
-            for i, (polygon, counts) in enumerate(zip(polygons, polygon_counts)):
-                if len(polygon) >= 3:
-                    draw_heatmap_on_polygon(display_frame, polygon, counts)
+            if heatmap_mode:
+                heatmap.render(display_frame, polygons)
+            else:
+                for i, (polygon, counts) in enumerate(zip(polygons, polygon_counts)):
+                    if len(polygon) >= 3:
+                        draw_heatmap_on_polygon(display_frame, polygon, counts)
             
             # Draw bounding boxes với màu theo loại phương tiện
             vehicle_classes = get_vehicle_classes()
@@ -351,8 +376,12 @@ def main():
             cv2.putText(display_frame, f"Zones: {len(polygons)}", 
                       (width - 120, 80), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
             
+            metrics.record('drawing', time.perf_counter() - drawing_start)
+            
             # Show frame
-            cv2.imshow('Traffic Detection', display_frame)
+            with metrics.stage('display'):
+                cv2.imshow('Traffic Detection', display_frame)
+            metrics.frame_done()
             
             # Calculate FPS
             fps_counter += 1
@@ -406,6 +435,14 @@ def main():
                 polygons.clear()
                 current_polygon.clear()
                 print("✓ Cleared all zones")
+            elif key == ord('m'):
+                heatmap_mode = not heatmap_mode
+                print(f"✓ Heatmap: {'occupancy' if heatmap_mode else 'status'}")
+            elif key == ord('e'):
+                filename = f"heatmaps/heatmap_{int(time.time())}"
+                heatmap.export(filename + '.npy')
+                heatmap.export(filename + '.png')
+                print(f"✓ Heatmap saved to {filename}.npy/.png")
     
     except KeyboardInterrupt:
         print("\nUser interrupted")
@@ -414,6 +451,11 @@ def main():
     finally:
         cap.release()
         cv2.destroyAllWindows()
+        cap.print_stats()
+        tiler.print_stats()
+        metrics.print_summary()
+        rollups.close()
+        rollups.print_stats()
         print("=== FINISHED ===")
 
 if __name__ == "__main__":
@@ -0,0 +1,178 @@
+"""
+Frame sampler that skips decoding of unused frames
+Chỉ giải mã (retrieve) những frame sẽ được phân tích, các frame bị bỏ qua chỉ grab() để tiết kiệm CPU
+"""
+
+import time
+
+import cv2
+
+
+class FrameSampler:
+    """Capture-like wrapper that returns only the sampled frames of a source.
+
+    Modes:
+      'stride'    - every stride-th frame (index % stride == 0, like `count % n == 0`)
+      'time'      - one frame every `interval` video seconds
+      'keyframes' - only the keyframes of a file (needs PyAV), else one frame
+                    per `interval` (default 1s) as a fallback
+
+    Skipped frames are advanced with cap.grab() and never retrieved, so the
+    colour conversion and copy of the frame are avoided (with PyAV keyframes
+    the non-key frames are not decoded at all). frame_index is the 1-based
+    position of the last returned frame in the source, so video time stays
+    correct when frames are skipped. Wraps into ThreadedCapture unchanged.
+    """
+
+    MODES = ('stride', 'time', 'keyframes')
+
+    def __init__(self, source, mode='stride', stride=1, interval=None):
+        self.source = source
+        # Accept a path/index or an already opened capture-like object
+        if isinstance(source, (str, int)):
+            self.cap = cv2.VideoCapture(int(source) if isinstance(source, str) and source.isdigit() else source)
+        else:
+            self.cap = source
+        self.container = None
+        self.stream = None
+        self.keyframes = None
+
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.fps = fps if fps and fps > 0 else 30.0
+
+        # Counters
+        self.frame_index = 0
+        self.frames_decoded = 0
+        self.frames_skipped = 0
+        self.read_time = 0.0
+        self.grab_time = 0.0
+
+        self.configure(mode, stride, interval)
+
+    def configure(self, mode='stride', stride=1, interval=None):
+        """Change the sampling mode; takes effect from the next frame"""
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown sampling mode: {mode} (expected one of {self.MODES})")
+        self.stride = max(1, int(stride))
+        self.interval = interval
+        self.next_time = self.frame_index / self.fps
+
+        if mode == 'keyframes' and self.container is None and not self.open_keyframes():
+            print("⚠ PyAV chưa được cài hoặc nguồn không phải file, lấy mẫu 1 frame mỗi "
+                  f"{interval or 1.0:g}s thay cho keyframes")
+            mode = 'time'
+            self.interval = interval or 1.0
+        if mode == 'time' and not self.interval:
+            raise ValueError("Time-based sampling needs an interval in seconds")
+        self.mode = mode
+
+    def open_keyframes(self):
+        """Decode only keyframes with PyAV, positioned at the current frame"""
+        if not isinstance(self.source, str) or self.source.isdigit():
+            return False
+        try:
+            import av
+        except ImportError:
+            return False
+        self.container = av.open(self.source)
+        self.stream = self.container.streams.video[0]
+        # The codec drops non-key frames before decoding them
+        self.stream.codec_context.skip_frame = 'NONKEY'
+        self.stream.thread_type = 'AUTO'
+        if self.frame_index:
+            self.container.seek(int(self.frame_index / self.fps / self.stream.time_base), stream=self.stream)
+        self.keyframes = self.container.decode(self.stream)
+        return True
+
+    def wanted(self, index):
+        """True when the frame at 1-based source index is sampled"""
+        if self.mode == 'stride':
+            return index % self.stride == 0
+        timestamp = (index - 1) / self.fps
+        if timestamp + 1e-6 < self.next_time:
+            return False
+        while self.next_time <= timestamp + 1e-6:
+            self.next_time += self.interval
+        return True
+
+    def read(self):
+        """Return (ret, frame) for the next sampled frame like cv2.VideoCapture.read()"""
+        if self.mode == 'keyframes':
+            return self.read_keyframe()
+
+        while True:
+            index = self.frame_index + 1
+            start = time.perf_counter()
+            if self.wanted(index):
+                ret, frame = self.cap.read()
+                self.read_time += time.perf_counter() - start
+                if not ret:
+                    return False, None
+                self.frame_index = index
+                self.frames_decoded += 1
+                return True, frame
+
+            ret = self.cap.grab()
+            self.grab_time += time.perf_counter() - start
+            if not ret:
+                return False, None
+            self.frame_index = index
+            self.frames_skipped += 1
+
+    def read_keyframe(self):
+        start = time.perf_counter()
+        try:
+            frame = next(self.keyframes)
+        except StopIteration:
+            return False, None
+        image = frame.to_ndarray(format='bgr24')
+        self.read_time += time.perf_counter() - start
+
+        index = self.frame_index + 1 if frame.time is None else int(round(frame.time * self.fps)) + 1
+        index = max(index, self.frame_index + 1)
+        self.frames_skipped += index - self.frame_index - 1
+        self.frames_decoded += 1
+        self.frame_index = index
+        return True, image
+
+    def grab(self):
+        """Advance one source frame without retrieving it"""
+        ret = self.cap.grab()
+        if ret:
+            self.frame_index += 1
+            self.frames_skipped += 1
+        return ret
+
+    def get(self, prop_id):
+        return self.cap.get(prop_id)
+
+    def set(self, prop_id, value):
+        return self.cap.set(prop_id, value)
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def release(self):
+        if self.container is not None:
+            self.container.close()
+            self.container = None
+        self.cap.release()
+
+    def stats(self):
+        """Sampling counters as a dict"""
+        seen = self.frames_decoded + self.frames_skipped
+        return {
+            'mode': self.mode,
+            'frames_seen': seen,
+            'frames_decoded': self.frames_decoded,
+            'decodes_avoided': self.frames_skipped,
+            'avoided_pct': 100.0 * self.frames_skipped / seen if seen else 0.0,
+            'avg_read_ms': self.read_time / self.frames_decoded * 1000 if self.frames_decoded else 0.0,
+            'avg_grab_ms': self.grab_time / self.frames_skipped * 1000 if self.frames_skipped else 0.0
+        }
+
+    def print_stats(self):
+        stats = self.stats()
+        print(f"Sampler ({stats['mode']}): seen {stats['frames_seen']}, decoded {stats['frames_decoded']}, "
+              f"decodes avoided {stats['decodes_avoided']} ({stats['avoided_pct']:.0f}%), "
+              f"read {stats['avg_read_ms']:.1f} ms vs grab {stats['avg_grab_ms']:.1f} ms")
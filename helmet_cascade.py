@@ -0,0 +1,41 @@
+"""
+Helmet cascade on motorbike crops
+Phát hiện mũ bảo hiểm trên tất cả xe máy của một frame bằng một lần gọi model (batch crop) thay vì gọi từng xe
+"""
+
+from crop_batch import CropBatcher
+
+HELMET_LABELS = ('Helmet', 'Non_helmet')
+
+
+class HelmetCascade:
+    """Second stage that looks for Helmet / Non_helmet boxes inside the bike boxes of a frame"""
+
+    def __init__(self, detector, crop_size=320, batch_size=32, conf=0.25, bike_label='bike',
+                 labels=HELMET_LABELS):
+        self.batcher = CropBatcher(detector, crop_size=crop_size, batch_size=batch_size)
+        self.conf = conf
+        self.bike_label = bike_label
+        self.names = detector.names
+        self.classes = [i for i, name in self.names.items() if name in labels]
+
+    def detect(self, frame, vehicle_boxes, vehicle_names):
+        """Helmets of every bike in vehicle_boxes ([x1, y1, x2, y2, class_id, ...] rows).
+
+        Returns dicts with label, confidence, box (frame coordinates) and the
+        index of the bike in vehicle_boxes.
+        """
+        bikes = [i for i, box in enumerate(vehicle_boxes) if vehicle_names[int(box[4])] == self.bike_label]
+        if not bikes or not self.classes:
+            return []
+        detections = self.batcher.detect(frame, [vehicle_boxes[i] for i in bikes], conf=self.conf,
+                                         classes=self.classes)
+        return [{'label': self.names[int(class_id)], 'confidence': float(confidence),
+                 'box': [int(x1), int(y1), int(x2), int(y2)], 'bike': bikes[int(crop)]}
+                for x1, y1, x2, y2, class_id, confidence, crop in detections]
+
+    def stats(self):
+        return self.batcher.stats()
+
+    def print_stats(self):
+        self.batcher.print_stats('Helmet cascade')
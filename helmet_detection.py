@@ -1,14 +1,28 @@
-from ultralytics import YOLO
+from detector_backend import load_detector
 import cv2
 import numpy as np
 import torch
 import time
 import os
+from threaded_capture import ThreadedCapture
+from stage_metrics import StageMetrics
+from tiled_inference import TiledDetector
+from detection_record import from_result, to_rows
+
+def classify_helmet(class_name):
+    """'helmet', 'no_helmet' or 'unknown' for a helmet model class name"""
+    name = class_name.lower()
+    if 'no' in name or 'without' in name:
+        return 'no_helmet'
+    if 'helmet' in name:
+        return 'helmet'
+    return 'unknown'
 
 class HelmetDetector:
     def __init__(self):
         self.model_path = r"D:\PROJECTS\Traffic Detection using YOLO\runs\train_helmet\exp_helmet\weights\best.pt"
         self.model = None
+        self.tiler = None  # Tiled inference for 4K sources
         self.class_names = None
         self.fps_counter = 0
         self.fps_start_time = time.time()
@@ -17,6 +31,9 @@ class HelmetDetector:
         self.helmet_count = 0
         self.no_helmet_count = 0
         
+        # Per-stage latency histograms, snapshot in metrics/helmet_detection.json
+        self.metrics = StageMetrics('helmet_detection')
+        
         self.load_model()
     
     def load_model(self):
@@ -33,7 +50,9 @@ class HelmetDetector:
                 print(f"✗ Model not found: {self.model_path}")
                 return False
                 
-            self.model = YOLO(self.model_path)
+            self.model = load_detector(self.model_path)
+            self.device = self.model.device
+            self.tiler = TiledDetector(self.model)
             self.class_names = self.model.names
             print(f"✓ Model loaded successfully")
             print(f"✓ Classes: {self.class_names}")
@@ -46,43 +65,42 @@ class HelmetDetector:
     def detect_helmets(self, image, conf_threshold=0.5):
         if self.model is None:
             return [], []
-        results = self.model.predict(source=image, device=self.device, 
-                                   save=False, verbose=False, 
-                                   conf=conf_threshold, iou=0.5)
+        with self.metrics.stage('inference'):
+            if self.tiler.enabled_for(image):
+                # Small heads in 4K frames: overlapping tiles instead of one 640px downscale
+                rows = self.tiler.detect(image, conf=conf_threshold).tolist()
+            else:
+                results = self.model.predict(source=image, device=self.device, 
+                                           save=False, verbose=False, 
+                                           conf=conf_threshold, iou=0.5)
+                rows = to_rows(from_result(results[0])).tolist()
         
         detections = []
         helmet_status = []
         
-        for result in results:
-            if result.boxes is not None:
-                for box in result.boxes:
-                    x_min, y_min, x_max, y_max = box.xyxy[0].tolist()
-                    class_id = int(box.cls[0].item())
-                    confidence = box.conf[0].item()
-                    
-                    if class_id < len(self.class_names):
-                        class_name = self.class_names[class_id]
-                        
-                        detection = {
-                            'bbox': [int(x_min), int(y_min), int(x_max), int(y_max)],
-                            'class': class_name,
-                            'class_id': class_id,
-                            'confidence': confidence
-                        }
-                        
-                        detections.append(detection)
-                        
-                        # Determine helmet status
-                        if 'helmet' in class_name.lower():
-                            helmet_status.append('helmet')
-                            self.helmet_count += 1
-                        elif 'no' in class_name.lower() or 'without' in class_name.lower():
-                            helmet_status.append('no_helmet')
-                            self.no_helmet_count += 1
-                        else:
-                            helmet_status.append('unknown')
-                        
-                        self.total_detections += 1
+        for x_min, y_min, x_max, y_max, class_id, confidence in rows:
+            class_id = int(class_id)
+            if class_id < len(self.class_names):
+                class_name = self.class_names[class_id]
+                
+                detection = {
+                    'bbox': [int(x_min), int(y_min), int(x_max), int(y_max)],
+                    'class': class_name,
+                    'class_id': class_id,
+                    'confidence': confidence
+                }
+                
+                detections.append(detection)
+                
+                # Determine helmet status
+                status = classify_helmet(class_name)
+                helmet_status.append(status)
+                if status == 'helmet':
+                    self.helmet_count += 1
+                elif status == 'no_helmet':
+                    self.no_helmet_count += 1
+                
+                self.total_detections += 1
         
         return detections, helmet_status
     
@@ -237,8 +255,8 @@ class HelmetDetector:
         """Process video (file or webcam)"""
         print(f"Processing video: {video_source}")
         
-        # Open video
-        cap = cv2.VideoCapture(video_source)
+        # Open video (decoded on a background thread, drop-oldest for webcam)
+        cap = ThreadedCapture(video_source)
         if not cap.isOpened():
             print(f"✗ Cannot open video: {video_source}")
             return
@@ -280,7 +298,8 @@ class HelmetDetector:
                     loop_start = time.time()
                     
                     # Read frame
-                    ret, frame = cap.read()
+                    with self.metrics.stage('decode'):
+                        ret, frame = cap.read()
                     if not ret:
                         print("End of video or read error")
                         break
@@ -291,13 +310,16 @@ class HelmetDetector:
                     detections, helmet_status = self.detect_helmets(frame, conf_threshold=0.3)
                     
                     # Draw results
-                    result_frame = self.draw_detections(frame, detections, helmet_status)
+                    with self.metrics.stage('drawing'):
+                        result_frame = self.draw_detections(frame, detections, helmet_status)
                     
                     # Update FPS
                     self.update_fps()
                     
                     # Show frame
-                    cv2.imshow('Helmet Detection - Video', result_frame)
+                    with self.metrics.stage('display'):
+                        cv2.imshow('Helmet Detection - Video', result_frame)
+                    self.metrics.frame_done()
                     
                     # FPS control
                     elapsed = time.time() - loop_start
@@ -340,6 +362,9 @@ class HelmetDetector:
             # Final statistics
             print(f"\n=== PROCESSING COMPLETED ===")
             print(f"Total frames processed: {frame_id}")
+            cap.print_stats()
+            self.tiler.print_stats()
+            self.metrics.print_summary()
             print(f"Total detections: {self.total_detections}")
             print(f"With helmet: {self.helmet_count}")
             print(f"No helmet: {self.no_helmet_count}")
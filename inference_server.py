@@ -0,0 +1,361 @@
+"""
+Local inference server with dynamic batching
+Nạp mỗi model một lần cho mọi camera trên máy; client gửi frame qua Unix socket, pixel nằm trong shared memory, server gom batch theo hạn chờ tối đa
+"""
+
+import argparse
+import json
+import os
+import queue
+import signal
+import socket
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+DEFAULT_SOCKET = '/tmp/smart_traffic_inference.sock'
+HEADER = struct.Struct('!I')
+
+
+def send_message(sock, header, payload=b''):
+    """Length-prefixed JSON header followed by an optional binary payload"""
+    header = dict(header, payload=len(payload))
+    data = json.dumps(header).encode('utf-8')
+    sock.sendall(HEADER.pack(len(data)) + data + payload)
+
+
+def recv_exact(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:], size - received)
+        if n == 0:
+            raise ConnectionError("Socket closed")
+        received += n
+    return bytes(buffer)
+
+
+def recv_message(sock):
+    """Return (header dict, payload bytes) sent by send_message()"""
+    (size,) = HEADER.unpack(recv_exact(sock, HEADER.size))
+    header = json.loads(recv_exact(sock, size).decode('utf-8'))
+    payload = recv_exact(sock, header['payload']) if header.get('payload') else b''
+    return header, payload
+
+
+def attach_shared_memory(name):
+    """Attach to a client's segment without letting this process unlink it on exit"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 registers every attached segment with the resource tracker
+        shm = shared_memory.SharedMemory(name=name)
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+class _Request:
+    __slots__ = ('frame', 'options', 'reply', 'received')
+
+    def __init__(self, frame, options, reply):
+        self.frame = frame
+        self.options = options
+        self.reply = reply
+        self.received = time.perf_counter()
+
+
+class ModelWorker:
+    """One loaded model and the thread that batches its requests.
+
+    The first waiting request opens a batch; it is run when max_batch requests
+    are queued or max_wait_ms after it arrived, whichever comes first.
+    Requests with different predict options (conf, imgsz, classes) are run in
+    separate batches.
+    """
+
+    def __init__(self, name, detector, max_batch=16, max_wait_ms=5.0):
+        self.name = name
+        self.detector = detector
+        # Never more than a static-batch export accepts
+        self.max_batch = min(max_batch, getattr(detector, 'max_batch', None) or max_batch)
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.Queue()
+        self.requests = 0
+        self.batches = 0
+        self.queue_wait = 0.0
+        self.inference_time = 0.0
+        self.thread = threading.Thread(target=self._run, name=f"batch-{name}", daemon=True)
+        self.thread.start()
+
+    def submit(self, request):
+        self.queue.put(request)
+
+    def _collect(self):
+        batch = [self.queue.get()]
+        if batch[0] is None:
+            return None
+        deadline = batch[0].received + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            try:
+                request = self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                self.queue.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            groups = {}
+            for request in batch:
+                key = json.dumps(request.options, sort_keys=True)
+                groups.setdefault(key, []).append(request)
+            for requests in groups.values():
+                self._predict(requests)
+
+    def _predict(self, requests):
+        start = time.perf_counter()
+        try:
+            results = self.detector.predict([r.frame for r in requests], verbose=False, save=False,
+                                            **requests[0].options)
+            outputs = [result.boxes.data.cpu().numpy().astype(np.float32) if result.boxes is not None
+                       else np.zeros((0, 6), dtype=np.float32) for result in results]
+            error = None
+        except Exception as e:
+            outputs, error = [None] * len(requests), str(e)
+        self.inference_time += time.perf_counter() - start
+        self.batches += 1
+        self.requests += len(requests)
+        for request, output in zip(requests, outputs):
+            self.queue_wait += start - request.received
+            request.reply(output, error)
+
+    def stop(self):
+        self.queue.put(None)
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'batches': self.batches,
+            'mean_batch': self.requests / self.batches if self.batches else 0.0,
+            'mean_queue_wait_ms': self.queue_wait / self.requests * 1000 if self.requests else 0.0,
+            'mean_batch_ms': self.inference_time / self.batches * 1000 if self.batches else 0.0
+        }
+
+
+class InferenceServer:
+    """Serves detections for the loaded models to local clients over a Unix socket.
+
+    Request:  {'op': 'predict', 'model', 'shm', 'shape', 'options'} with the
+              BGR frame in the client's shared memory segment 'shm'
+    Response: {'ok', 'rows'} + float32 payload of rows x [x1, y1, x2, y2, conf, class_id]
+    """
+
+    def __init__(self, models, socket_path=DEFAULT_SOCKET, max_batch=16, max_wait_ms=5.0):
+        self.socket_path = socket_path
+        self.workers = {name: ModelWorker(name, detector, max_batch, max_wait_ms)
+                        for name, detector in models.items()}
+        self.sock = None
+        self.stopped = False
+        self.clients = 0
+
+    def serve_forever(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.socket_path)
+        self.sock.listen(64)
+        print(f"✓ Inference server listening on {self.socket_path} (models: {', '.join(self.workers)})")
+        try:
+            while not self.stopped:
+                try:
+                    conn, _ = self.sock.accept()
+                except OSError:
+                    break
+                threading.Thread(target=self._serve_client, args=(conn,), daemon=True).start()
+        finally:
+            self.close()
+
+    def _serve_client(self, conn):
+        self.clients += 1
+        segments = {}
+        done = threading.Event()
+        reply_state = {}
+
+        def reply(output, error):
+            reply_state['output'], reply_state['error'] = output, error
+            done.set()
+
+        try:
+            while True:
+                header, _ = recv_message(conn)
+                op = header.get('op')
+                if op == 'stats':
+                    send_message(conn, {'ok': True, 'stats': self.stats()})
+                    continue
+                if op == 'models':
+                    send_message(conn, {'ok': True, 'models': {name: {int(k): v for k, v in w.detector.names.items()}
+                                                               for name, w in self.workers.items()}})
+                    continue
+                worker = self.workers.get(header.get('model'))
+                if op != 'predict' or worker is None:
+                    send_message(conn, {'ok': False, 'error': f"Unknown op/model: {op} {header.get('model')}"})
+                    continue
+
+                # The client reuses one segment per frame size, attach it once
+                name = header['shm']
+                if name not in segments:
+                    segments[name] = attach_shared_memory(name)
+                frame = np.ndarray(header['shape'], dtype=np.uint8, buffer=segments[name].buf)
+
+                # The client blocks until the reply, so the frame can be read in place
+                done.clear()
+                worker.submit(_Request(frame, header.get('options', {}), reply))
+                done.wait()
+                output = reply_state['output']
+                if output is None:
+                    send_message(conn, {'ok': False, 'error': reply_state['error']})
+                else:
+                    send_message(conn, {'ok': True, 'rows': len(output)}, output.tobytes())
+                del frame
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            for segment in segments.values():
+                try:
+                    segment.close()
+                except BufferError:
+                    pass
+            conn.close()
+            self.clients -= 1
+
+    def stats(self):
+        return {'clients': self.clients, 'models': {name: w.stats() for name, w in self.workers.items()}}
+
+    def close(self):
+        self.stopped = True
+        for worker in self.workers.values():
+            worker.stop()
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+class InferenceClient:
+    """Client of one model on an InferenceServer.
+
+    predict() copies the frame into a shared memory segment owned by the
+    client (reused while the frame size stays the same) and returns the
+    detections as an (N, 6) float32 array of [x1, y1, x2, y2, conf, class_id].
+    """
+
+    def __init__(self, model, socket_path=DEFAULT_SOCKET, timeout=30.0):
+        self.model = model
+        self.socket_path = socket_path
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(socket_path)
+        self.shm = None
+        self.shm_frame = None
+
+        send_message(self.sock, {'op': 'models'})
+        header, _ = recv_message(self.sock)
+        if model not in header['models']:
+            self.close()
+            raise ValueError(f"Model '{model}' is not served (available: {list(header['models'])})")
+        self.names = {int(k): v for k, v in header['models'][model].items()}
+
+    def _buffer(self, frame):
+        if self.shm is None or self.shm_frame.shape != frame.shape:
+            self._release_shm()
+            self.shm = shared_memory.SharedMemory(create=True, size=max(frame.nbytes, 1))
+            self.shm_frame = np.ndarray(frame.shape, dtype=np.uint8, buffer=self.shm.buf)
+        return self.shm_frame
+
+    def predict(self, frame, **options):
+        """Detections of frame; options are passed to the server's predict (conf, imgsz, classes, iou)"""
+        frame = np.ascontiguousarray(frame, dtype=np.uint8)
+        np.copyto(self._buffer(frame), frame)
+        send_message(self.sock, {'op': 'predict', 'model': self.model, 'shm': self.shm.name,
+                                 'shape': list(frame.shape), 'options': options})
+        header, payload = recv_message(self.sock)
+        if not header.get('ok'):
+            raise RuntimeError(f"Inference server error: {header.get('error')}")
+        return np.frombuffer(payload, dtype=np.float32).reshape(header['rows'], 6)
+
+    def server_stats(self):
+        send_message(self.sock, {'op': 'stats'})
+        header, _ = recv_message(self.sock)
+        return header['stats']
+
+    def _release_shm(self):
+        if self.shm is not None:
+            self.shm_frame = None
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def close(self):
+        try:
+            self.sock.close()
+        finally:
+            self._release_shm()
+
+
+def model_name(weights):
+    """Default served name of a weights path: its file stem (Windows paths too)"""
+    return os.path.splitext(os.path.basename(weights.replace('\\', '/').rstrip('/')))[0]
+
+
+def parse_model(spec):
+    """'name=weights' or just 'weights' (name = file stem)"""
+    if '=' in spec:
+        return tuple(spec.split('=', 1))
+    return model_name(spec), spec
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared local inference server with dynamic batching")
+    parser.add_argument('--model', action='append', required=True,
+                        help="name=weights (repeatable); the name defaults to the weights file stem")
+    parser.add_argument('--socket', default=DEFAULT_SOCKET)
+    parser.add_argument('--backend', default=None, help="torch, onnx, openvino or auto (default DETECTOR_BACKEND)")
+    parser.add_argument('--max-batch', type=int, default=16)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0, help="Longest wait for a batch to fill")
+    args = parser.parse_args()
+
+    from detector_backend import load_detector
+
+    models = {}
+    for spec in args.model:
+        name, weights = parse_model(spec)
+        models[name] = load_detector(weights, backend=args.backend)
+    server = InferenceServer(models, args.socket, args.max_batch, args.max_wait_ms)
+    # terminate() (e.g. from the load test) shuts down cleanly and removes the socket
+    signal.signal(signal.SIGTERM, lambda *_: server.close())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopping inference server")
+    finally:
+        server.close()
+        for name, stats in server.stats()['models'].items():
+            print(f"{name}: {stats['requests']} requests in {stats['batches']} batches "
+                  f"(mean batch {stats['mean_batch']:.1f}, queue wait {stats['mean_queue_wait_ms']:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Load test for inference_server.py
+Chạy N client giả lập (mỗi client một process) gửi frame ngẫu nhiên tới server, đo throughput và độ trễ p50/p95/p99
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from inference_server import DEFAULT_SOCKET, InferenceClient, parse_model
+
+
+def run_client(index, socket_path, model, size, duration, rate, options, results):
+    """Send synthetic frames for `duration` seconds (at `rate` FPS, 0 = as fast as possible)"""
+    width, height = size
+    rng = np.random.default_rng(index)
+    frames = [rng.integers(0, 255, (height, width, 3), dtype=np.uint8) for _ in range(4)]
+    client = InferenceClient(model, socket_path)
+    latencies = []
+    errors = 0
+    start = time.perf_counter()
+    next_send = start
+    try:
+        while time.perf_counter() - start < duration:
+            if rate > 0:
+                delay = next_send - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                next_send += 1.0 / rate
+            sent = time.perf_counter()
+            try:
+                client.predict(frames[len(latencies) % len(frames)], **options)
+            except RuntimeError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - sent)
+    finally:
+        client.close()
+    results.put({'client': index, 'latencies': latencies, 'errors': errors})
+
+
+def wait_for_socket(path, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if os.path.exists(path):
+            return True
+        time.sleep(0.2)
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput and tail latency of the inference server")
+    parser.add_argument('--socket', default=DEFAULT_SOCKET)
+    parser.add_argument('--model', required=True, help="Served model name, or name=weights with --start-server")
+    parser.add_argument('--start-server', action='store_true', help="Start inference_server.py for the test")
+    parser.add_argument('--max-batch', type=int, default=16)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=30.0, help="Seconds per client")
+    parser.add_argument('--rate', type=float, default=0.0, help="Frames/s per client (0 = closed loop)")
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--output', default='inference_load_report.json')
+    args = parser.parse_args()
+
+    name, _ = parse_model(args.model)
+    server = None
+    if args.start_server:
+        server = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                'inference_server.py'),
+                                   '--model', args.model if '=' in args.model else f"{name}={args.model}",
+                                   '--socket', args.socket, '--max-batch', str(args.max_batch),
+                                   '--max-wait-ms', str(args.max_wait_ms)])
+        if not wait_for_socket(args.socket, 300):
+            print("✗ Inference server did not start")
+            server.terminate()
+            return
+
+    try:
+        results = mp.Queue()
+        options = {'imgsz': args.imgsz}
+        clients = [mp.Process(target=run_client, args=(i, args.socket, name, (args.width, args.height),
+                                                       args.duration, args.rate, options, results))
+                   for i in range(args.clients)]
+        start = time.perf_counter()
+        for process in clients:
+            process.start()
+        per_client = [results.get() for _ in clients]
+        wall_time = time.perf_counter() - start
+        for process in clients:
+            process.join()
+
+        stats_client = InferenceClient(name, args.socket)
+        server_stats = stats_client.server_stats()['models'][name]
+        stats_client.close()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    latencies = np.concatenate([np.asarray(r['latencies']) for r in per_client]) * 1000
+    requests = len(latencies)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if requests else (0.0, 0.0, 0.0)
+    report = {
+        'model': name,
+        'clients': args.clients,
+        'frame_size': [args.width, args.height],
+        'rate_per_client': args.rate,
+        'max_batch': args.max_batch,
+        'max_wait_ms': args.max_wait_ms,
+        'requests': requests,
+        'errors': sum(r['errors'] for r in per_client),
+        'wall_time_s': wall_time,
+        'throughput_fps': requests / wall_time if wall_time > 0 else 0.0,
+        'latency_ms': {'mean': float(latencies.mean()) if requests else 0.0,
+                       'p50': float(p50), 'p95': float(p95), 'p99': float(p99)},
+        'server': server_stats
+    }
+
+    print(f"\n=== Inference server load test: {name}, {args.clients} clients, {args.width}x{args.height} ===")
+    print(f"Requests: {requests} ({report['errors']} errors) in {wall_time:.1f}s")
+    print(f"Throughput: {report['throughput_fps']:.1f} frames/s")
+    print(f"Latency: p50={p50:.1f}ms p95={p95:.1f}ms p99={p99:.1f}ms")
+    print(f"Server: mean batch {server_stats['mean_batch']:.1f}, "
+          f"queue wait {server_stats['mean_queue_wait_ms']:.1f} ms, batch time {server_stats['mean_batch_ms']:.1f} ms")
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"✓ Report saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
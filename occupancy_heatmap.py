@@ -0,0 +1,168 @@
+"""
+Temporal occupancy heatmap
+Cộng dồn vùng chiếm chỗ của xe theo thời gian (có suy giảm theo hàm mũ) trên lưới độ phân giải thấp, vẽ chỉ trong các vùng (zone)
+"""
+
+import math
+import os
+
+import cv2
+import numpy as np
+
+
+class OccupancyHeatmap:
+    """Exponentially decaying occupancy accumulator at reduced resolution.
+
+    Each detection adds dt seconds over its ground footprint (lower half of
+    the box), so a cell reads as "seconds occupied" with a half-life of
+    half_life seconds; a permanently occupied cell saturates at
+    half_life / ln 2. Decay is lazy: instead of scaling the whole grid every
+    frame, a global gain shrinks and new splats are divided by it, so an
+    update costs O(boxes). The grid is renormalized only when the gain gets
+    tiny.
+    """
+
+    def __init__(self, frame_size, scale=0.25, half_life=10.0, default_dt=1.0 / 15,
+                 colormap=cv2.COLORMAP_JET, alpha=0.45, min_level=8,
+                 export_dir=None, export_interval=60.0):
+        width, height = frame_size
+        self.scale = scale
+        self.grid_size = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+        self.accumulator = np.zeros((self.grid_size[1], self.grid_size[0]), dtype=np.float32)
+        self.decay_rate = math.log(2) / half_life
+        self.saturation = half_life / math.log(2)
+        self.default_dt = default_dt
+        self.gain = 1.0
+        self.last_timestamp = None
+
+        self.alpha = alpha
+        self.min_level = min_level
+        # Colour map lookup table, built once: level (0..255) -> BGR
+        self.lut = cv2.applyColorMap(np.arange(256, dtype=np.uint8).reshape(-1, 1), colormap).reshape(256, 3)
+
+        # Zone mask cache, rebuilt only when the polygons change
+        self.zone_key = None
+        self.zone_rect = None
+        self.zone_mask = None
+
+        self.export_dir = export_dir
+        self.export_interval = export_interval
+        self.window_start = None
+        self.exports = 0
+
+    def update(self, boxes, timestamp=None):
+        """Decay to timestamp (seconds) and splat the footprints of boxes ([x1, y1, x2, y2, ...] rows)"""
+        if timestamp is None or self.last_timestamp is None:
+            dt = self.default_dt
+        else:
+            dt = max(0.0, timestamp - self.last_timestamp)
+        if timestamp is not None:
+            self.last_timestamp = timestamp
+
+        self.gain *= math.exp(-self.decay_rate * dt)
+        if self.gain < 1e-4:
+            self.accumulator *= self.gain
+            self.gain = 1.0
+
+        boxes = np.asarray(boxes, dtype=np.float64)
+        if boxes.ndim == 2 and len(boxes) and dt > 0:
+            grid_w, grid_h = self.grid_size
+            x1 = np.clip(np.floor(boxes[:, 0] * self.scale), 0, grid_w).astype(int)
+            x2 = np.clip(np.ceil(boxes[:, 2] * self.scale), 0, grid_w).astype(int)
+            y2 = np.clip(np.ceil(boxes[:, 3] * self.scale), 0, grid_h).astype(int)
+            y1 = np.clip(np.floor((boxes[:, 1] + boxes[:, 3]) / 2 * self.scale), 0, grid_h).astype(int)
+            weight = dt / self.gain
+            for bx1, by1, bx2, by2 in zip(x1, y1, x2, y2):
+                self.accumulator[by1:by2, bx1:bx2] += weight
+
+        if self.export_dir and timestamp is not None:
+            self.maybe_export(timestamp)
+
+    def values(self):
+        """Current decayed occupancy grid in seconds"""
+        return self.accumulator * self.gain
+
+    def levels(self, region=None):
+        """Occupancy as uint8 0..255 relative to saturation, optionally for a (x, y, w, h) grid region"""
+        grid = self.accumulator
+        if region is not None:
+            x, y, w, h = region
+            grid = grid[y:y + h, x:x + w]
+        levels = grid * (self.gain * 255.0 / self.saturation)
+        return np.clip(levels, 0, 255).astype(np.uint8)
+
+    def update_zones(self, polygons, frame_shape):
+        """Cache the bounding rect of all zones and the zone mask inside it"""
+        key = (frame_shape[:2], tuple(tuple((int(x), int(y)) for x, y in p) for p in polygons if len(p) >= 3))
+        if key == self.zone_key:
+            return
+        self.zone_key = key
+        self.zone_rect = None
+        self.zone_mask = None
+        if not key[1]:
+            return
+
+        height, width = frame_shape[:2]
+        points = np.array([pt for polygon in key[1] for pt in polygon], dtype=np.int32)
+        x, y, w, h = cv2.boundingRect(points)
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + w, width), min(y + h, height)
+        if x1 <= x0 or y1 <= y0:
+            return
+        mask = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+        cv2.fillPoly(mask, [np.array(p, dtype=np.int32) - (x0, y0) for p in key[1]], 1)
+        self.zone_rect = (x0, y0, x1 - x0, y1 - y0)
+        self.zone_mask = mask
+
+    def render(self, frame, polygons):
+        """Blend the coloured heatmap into frame in place, only inside the zones"""
+        self.update_zones(polygons, frame.shape)
+        if self.zone_rect is None:
+            return frame
+
+        x, y, w, h = self.zone_rect
+        grid_w, grid_h = self.grid_size
+        gx0, gy0 = int(x * self.scale), int(y * self.scale)
+        gx1 = min(grid_w, max(gx0 + 1, int(math.ceil((x + w) * self.scale))))
+        gy1 = min(grid_h, max(gy0 + 1, int(math.ceil((y + h) * self.scale))))
+        levels = self.levels((gx0, gy0, gx1 - gx0, gy1 - gy0))
+        if not levels.any():
+            return frame
+
+        # Colour at grid resolution, then upscale: the LUT lookup stays tiny
+        colored = cv2.resize(self.lut[levels], (w, h), interpolation=cv2.INTER_LINEAR)
+        levels = cv2.resize(levels, (w, h), interpolation=cv2.INTER_LINEAR)
+        _, active = cv2.threshold(levels, self.min_level - 1, 1, cv2.THRESH_BINARY)
+        mask = cv2.bitwise_and(self.zone_mask, active)
+        roi = frame[y:y + h, x:x + w]
+        blended = cv2.addWeighted(roi, 1 - self.alpha, colored, self.alpha, 0)
+        cv2.copyTo(blended, mask, roi)
+        return frame
+
+    def render_full(self):
+        """Colour image of the whole grid (for export)"""
+        return self.lut[self.levels()]
+
+    def export(self, path):
+        """Save the current heatmap as .npy (seconds occupied) or as a colour image"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if path.endswith('.npy'):
+            np.save(path, self.values())
+        else:
+            cv2.imwrite(path, self.render_full())
+        self.exports += 1
+        return path
+
+    def maybe_export(self, timestamp):
+        """Write heatmap_<start>-<end>s.npy/.png whenever an export window of export_interval video seconds ends"""
+        if self.window_start is None:
+            self.window_start = timestamp
+            return
+        if timestamp - self.window_start < self.export_interval:
+            return
+        name = f"heatmap_{int(self.window_start):06d}-{int(timestamp):06d}s"
+        self.export(os.path.join(self.export_dir, name + '.npy'))
+        self.export(os.path.join(self.export_dir, name + '.png'))
+        self.window_start = timestamp
@@ -0,0 +1,207 @@
+"""
+Bounded staged pipeline executor
+Chạy decode → inference → đếm → vẽ trên các luồng riêng, nối bằng hàng đợi có giới hạn, trả kết quả đúng thứ tự frame
+"""
+
+import queue
+import threading
+import time
+
+_SENTINEL = object()
+
+
+class PipelineError(RuntimeError):
+    """Raised in the consumer when a pipeline stage failed"""
+
+
+class _StageQueue:
+    """Blocking bounded queue that keeps depth statistics"""
+
+    def __init__(self, name, maxsize):
+        self.name = name
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.maxsize = maxsize
+        self.puts = 0
+        self.depth_total = 0
+        self.max_depth = 0
+        self.blocked_time = 0.0
+
+    def put(self, item, stop_event):
+        start = time.perf_counter()
+        while True:
+            try:
+                self.queue.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                if stop_event.is_set():
+                    return False
+        self.blocked_time += time.perf_counter() - start
+        depth = self.queue.qsize()
+        self.puts += 1
+        self.depth_total += depth
+        if depth > self.max_depth:
+            self.max_depth = depth
+        return True
+
+    def get(self, stop_event):
+        while True:
+            try:
+                return self.queue.get(timeout=0.1)
+            except queue.Empty:
+                if stop_event.is_set():
+                    return _SENTINEL
+
+    def stats(self):
+        return {
+            'depth': self.queue.qsize(),
+            'max_depth': self.max_depth,
+            'avg_depth': self.depth_total / self.puts if self.puts else 0.0,
+            'capacity': self.maxsize,
+            'producer_blocked_s': self.blocked_time
+        }
+
+
+class StagedPipeline:
+    """Source thread plus a chain of worker stages connected by blocking bounded queues.
+
+    source() is called repeatedly on its own thread and returns the next item,
+    or None when the input is exhausted. Each stage is (name, fn) or
+    (name, fn, workers); fn(item) returns the item handed to the next stage.
+    Iterating the pipeline yields the final items in source order, even when a
+    stage runs several workers. A stage exception stops the pipeline and is
+    re-raised from the iterator as PipelineError.
+    """
+
+    def __init__(self, source, stages, queue_size=4, metrics=None, name='pipeline'):
+        self.source = source
+        self.stages = [tuple(stage) + (1,) if len(stage) == 2 else tuple(stage) for stage in stages]
+        self.metrics = metrics
+        self.name = name
+        self.stop_event = threading.Event()
+        self.error = None
+
+        # queues[i] feeds stage i; queues[-1] feeds the consumer
+        names = [stage[0] for stage in self.stages] + ['output']
+        self.queues = [_StageQueue(stage_name, queue_size) for stage_name in names]
+        self.finished_workers = [0] * len(self.stages)
+        self.finish_lock = threading.Lock()
+        self.threads = []
+        self.items_in = 0
+        self.items_out = 0
+        self.started = False
+
+    def start(self):
+        if self.started:
+            return self
+        self.started = True
+        self.threads.append(threading.Thread(target=self._source_loop, name=f"{self.name}-source", daemon=True))
+        for index, (stage_name, fn, workers) in enumerate(self.stages):
+            for worker in range(workers):
+                self.threads.append(threading.Thread(target=self._stage_loop, args=(index,),
+                                                     name=f"{self.name}-{stage_name}-{worker}", daemon=True))
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def _fail(self, stage_name, exc):
+        if self.error is None:
+            self.error = (stage_name, exc)
+        self.stop_event.set()
+
+    def _source_loop(self):
+        first_queue = self.queues[0]
+        seq = 0
+        try:
+            while not self.stop_event.is_set():
+                start = time.perf_counter()
+                item = self.source()
+                if self.metrics is not None:
+                    self.metrics.record('decode', time.perf_counter() - start)
+                if item is None:
+                    break
+                if not first_queue.put((seq, item), self.stop_event):
+                    return
+                seq += 1
+                self.items_in = seq
+        except Exception as e:
+            self._fail('source', e)
+        finally:
+            # One sentinel per worker of the first stage
+            for _ in range(self.stages[0][2] if self.stages else 1):
+                first_queue.put(_SENTINEL, self.stop_event)
+
+    def _stage_loop(self, index):
+        stage_name, fn, _ = self.stages[index]
+        in_queue, out_queue = self.queues[index], self.queues[index + 1]
+        while True:
+            job = in_queue.get(self.stop_event)
+            if job is _SENTINEL:
+                break
+            seq, item = job
+            start = time.perf_counter()
+            try:
+                result = fn(item)
+            except Exception as e:
+                self._fail(stage_name, e)
+                break
+            if self.metrics is not None:
+                self.metrics.record(stage_name, time.perf_counter() - start)
+            if not out_queue.put((seq, result), self.stop_event):
+                break
+
+        # The last worker of this stage to finish passes the shutdown downstream
+        with self.finish_lock:
+            self.finished_workers[index] += 1
+            last = self.finished_workers[index] == self.stages[index][2]
+        if last:
+            downstream = self.stages[index + 1][2] if index + 1 < len(self.stages) else 1
+            for _ in range(downstream):
+                out_queue.put(_SENTINEL, self.stop_event)
+
+    def __iter__(self):
+        """Yield final stage results in source order"""
+        self.start()
+        output = self.queues[-1]
+        pending = {}
+        next_seq = 0
+        while True:
+            job = output.get(self.stop_event)
+            if job is _SENTINEL:
+                break
+            seq, item = job
+            pending[seq] = item
+            while next_seq in pending:
+                self.items_out += 1
+                yield pending.pop(next_seq)
+                next_seq += 1
+            self.update_gauges()
+
+        # Results still waiting for an earlier frame (only after a failure)
+        for seq in sorted(pending):
+            self.items_out += 1
+            yield pending[seq]
+
+        if self.error is not None:
+            stage_name, exc = self.error
+            raise PipelineError(f"Pipeline stage '{stage_name}' failed: {exc}") from exc
+
+    def update_gauges(self):
+        if self.metrics is None:
+            return
+        for stage_queue in self.queues:
+            self.metrics.set_gauge(f"queue_depth_{stage_queue.name}", stage_queue.queue.qsize())
+
+    def stop(self):
+        """Stop all threads; safe to call at any time, including after normal completion"""
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join(timeout=2.0)
+
+    def queue_stats(self):
+        return {stage_queue.name: stage_queue.stats() for stage_queue in self.queues}
+
+    def print_stats(self):
+        print(f"Pipeline {self.name}: {self.items_in} items in, {self.items_out} out")
+        for name, stats in self.queue_stats().items():
+            print(f"  queue -> {name:<10} avg depth {stats['avg_depth']:.1f}/{stats['capacity']}, "
+                  f"max {stats['max_depth']}, producer blocked {stats['producer_blocked_s']:.1f}s")
@@ -0,0 +1,145 @@
+"""
+License-plate cascade on vehicle crops
+Chỉ tìm biển số trong crop của xe/xe máy chưa có biển số tốt, chạy theo batch và thưa hơn vehicle detection, kết quả gắn vào bản ghi của từng xe
+"""
+
+import numpy as np
+
+from crop_batch import CropBatcher
+
+
+def box_iou(boxes_a, boxes_b):
+    """IoU matrix between two (N, 4) and (M, 4) arrays of x1, y1, x2, y2"""
+    a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float64).reshape(-1, 4)
+    w = np.clip(np.minimum(a[:, None, 2], b[None, :, 2]) - np.maximum(a[:, None, 0], b[None, :, 0]), 0, None)
+    h = np.clip(np.minimum(a[:, None, 3], b[None, :, 3]) - np.maximum(a[:, None, 1], b[None, :, 1]), 0, None)
+    inter = w * h
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+class PlateCascade:
+    """Plate detection on vehicle crops, attached to per-vehicle records.
+
+    Vehicles are followed across frames (by the caller's track ids, or by
+    greedy IoU matching when none are given). Every `interval` frames the crops
+    of the vehicles that still lack a plate with confidence >= good_conf are
+    sent to the plate model as one batch. A vehicle's best plate is stored
+    relative to its box, so it follows the vehicle without being detected again.
+    """
+
+    def __init__(self, detector, interval=3, good_conf=0.6, conf=0.25, vehicle_labels=('car', 'bike'),
+                 crop_size=320, batch_size=32, iou=0.3, max_age=30):
+        self.batcher = CropBatcher(detector, crop_size=crop_size, batch_size=batch_size)
+        self.names = detector.names
+        self.interval = max(1, interval)
+        self.good_conf = good_conf
+        self.conf = conf
+        self.vehicle_labels = vehicle_labels
+        self.iou = iou
+        self.max_age = max_age
+
+        self.records = {}
+        self.next_id = 1
+        self.frame = 0
+
+        self.runs = 0
+        self.crops_skipped = 0
+
+    def associate(self, boxes):
+        """Track ids for boxes by greedy IoU matching against the live records"""
+        ids = [None] * len(boxes)
+        live = list(self.records)
+        if live and boxes:
+            iou = box_iou([b[:4] for b in boxes], [self.records[i]['box'] for i in live])
+            for flat in np.argsort(-iou, axis=None):
+                row, col = divmod(int(flat), len(live))
+                if iou[row, col] < self.iou:
+                    break
+                if ids[row] is None and live[col] is not None:
+                    ids[row] = live[col]
+                    live[col] = None
+        for row, track_id in enumerate(ids):
+            if track_id is None:
+                ids[row] = self.next_id
+                self.next_id += 1
+        return ids
+
+    def update(self, frame, vehicle_boxes, vehicle_names, track_ids=None):
+        """Update the vehicle records of one frame; returns the records of the car/bike boxes.
+
+        Each record holds track_id, box, label, index (row in vehicle_boxes),
+        attempts and plate (None or a dict with label, confidence and box in
+        frame coordinates).
+        """
+        self.frame += 1
+        rows = [i for i, box in enumerate(vehicle_boxes) if vehicle_names[int(box[4])] in self.vehicle_labels]
+        boxes = [[float(v) for v in vehicle_boxes[i][:4]] for i in rows]
+        if track_ids is None:
+            ids = self.associate(boxes)
+        else:
+            ids = [track_ids[i] for i in rows]
+
+        for row, track_id, box in zip(rows, ids, boxes):
+            record = self.records.setdefault(track_id, {'track_id': track_id, 'attempts': 0, 'plate': None})
+            record.update(box=box, label=vehicle_names[int(vehicle_boxes[row][4])], index=row, last_seen=self.frame)
+        for track_id in [i for i, r in self.records.items() if self.frame - r['last_seen'] > self.max_age]:
+            del self.records[track_id]
+
+        records = [self.records[track_id] for track_id in ids]
+        if (self.frame - 1) % self.interval == 0:
+            self.detect_plates(frame, records)
+        for record in records:
+            self.project_plate(record)
+        return records
+
+    def detect_plates(self, frame, records):
+        pending = [r for r in records if r['plate'] is None or r['plate']['confidence'] < self.good_conf]
+        self.crops_skipped += len(records) - len(pending)
+        if not pending:
+            return
+        self.runs += 1
+        detections = self.batcher.detect(frame, [r['box'] for r in pending], conf=self.conf)
+        # Keep the most confident plate of each crop
+        for x1, y1, x2, y2, class_id, confidence, crop in detections[np.argsort(detections[:, 5])]:
+            record = pending[int(crop)]
+            if record['plate'] is not None and record['plate']['confidence'] >= confidence:
+                continue
+            bx1, by1, bx2, by2 = record['box']
+            w, h = max(bx2 - bx1, 1.0), max(by2 - by1, 1.0)
+            record['plate'] = {
+                'label': self.names[int(class_id)],
+                'confidence': float(confidence),
+                'relative': (float(x1 - bx1) / w, float(y1 - by1) / h, float(x2 - bx1) / w, float(y2 - by1) / h)
+            }
+        for record in pending:
+            record['attempts'] += 1
+
+    def project_plate(self, record):
+        """Plate box on the vehicle's current box"""
+        plate = record['plate']
+        if plate is None:
+            return
+        bx1, by1, bx2, by2 = record['box']
+        w, h = bx2 - bx1, by2 - by1
+        rx1, ry1, rx2, ry2 = plate['relative']
+        plate['box'] = [int(bx1 + rx1 * w), int(by1 + ry1 * h), int(bx1 + rx2 * w), int(by1 + ry2 * h)]
+
+    def stats(self):
+        stats = self.batcher.stats()
+        stats.update({
+            'runs': self.runs,
+            'crops_skipped_good_plate': self.crops_skipped,
+            'vehicles': len(self.records),
+            'good_plates': sum(1 for r in self.records.values()
+                               if r['plate'] is not None and r['plate']['confidence'] >= self.good_conf)
+        })
+        return stats
+
+    def print_stats(self):
+        s = self.stats()
+        print(f"Plate cascade: {s['runs']} runs, {s['crops']} crops in {s['calls']} calls, "
+              f"{s['crops_skipped_good_plate']} crops skipped (plate already read), "
+              f"{s['good_plates']}/{s['vehicles']} vehicles with a good plate, {s['crops_per_s']:.0f} crops/s")
@@ -1,11 +1,18 @@
-from ultralytics import YOLO
+from detector_backend import load_detector
+from helmet_cascade import HelmetCascade
+from plate_cascade import PlateCascade
+from detection_record import class_ids, from_result, select
 import cv2
 import os
 import torch
 
 def predict_yolo():
-    vehicle_model = YOLO(r"D:\JUPYTER NOTEBOOK\Traffic Detection using YOLO\runs\train_vehicle\exp_vehicle\weights\best.pt")
-    license_plate_model = YOLO(r"D:\JUPYTER NOTEBOOK\Traffic Detection using YOLO\runs\train_license\exp_license\weights\best.pt")  # Đường dẫn đến mô hình biển số xe
+    vehicle_model = load_detector(r"D:\JUPYTER NOTEBOOK\Traffic Detection using YOLO\runs\train_vehicle\exp_vehicle\weights\best.pt")
+    license_plate_model = load_detector(r"D:\JUPYTER NOTEBOOK\Traffic Detection using YOLO\runs\train_license\exp_license\weights\best.pt")  # Đường dẫn đến mô hình biển số xe
+    # Mũ bảo hiểm của tất cả xe máy được phát hiện trong một lần gọi model
+    helmet_cascade = HelmetCascade(vehicle_model)
+    # Biển số: crop của tất cả xe/xe máy trong một batch
+    plate_cascade = PlateCascade(license_plate_model)
     test_dir = r"D:\JUPYTER NOTEBOOK\Traffic Detection using YOLO\Combined_Data\valid\images\2009_003589_jpg.rf.98daa631a5563cfde3be9729f44190cf.jpg"
     image = cv2.imread(test_dir)
     if image is None:
@@ -16,69 +23,27 @@ def predict_yolo():
         device=0,
         save=False
     )
-    final_results = []
-    for result in vehicle_results:
-        boxes = result.boxes
-        labels = result.names
+    labels = vehicle_model.names
+    detections = select(from_result(vehicle_results[0]), class_ids(labels, ['bike', 'car']))
+    xyxy = detections['xyxy'].astype(int).tolist()
+    final_results = [{'label': labels[int(class_id)], 'confidence': float(confidence), 'box': box}
+                     for box, class_id, confidence in zip(xyxy, detections['cls'], detections['conf'])]
+    vehicle_boxes = [box + [int(class_id)] for box, class_id in zip(xyxy, detections['cls'])]
 
-        for box in boxes:
-            label = labels[int(box.cls)]
-            confidence = float(box.conf)
-            x1, y1, x2, y2 = map(int, box.xyxy[0])
+    # Biển số được gắn vào kết quả của xe tương ứng
+    for record in plate_cascade.update(image, vehicle_boxes, vehicle_model.names):
+        if record['plate'] is not None:
+            final_results[record['index']]['plate'] = record['plate']
+            final_results.append({
+                'label': record['plate']['label'],
+                'confidence': record['plate']['confidence'],
+                'box': record['plate']['box']
+            })
 
-            if label in ['bike', 'car']:
-                final_results.append({
-                    'label': label,
-                    'confidence': confidence,
-                    'box': [x1, y1, x2, y2]
-                })
-                vehicle_image = image[y1:y2, x1:x2]
-                lp_results = license_plate_model.predict(
-                    source=vehicle_image,
-                    device=0,
-                    save=False
-                )
-
-                for lp_result in lp_results:
-                    lp_boxes = lp_result.boxes
-                    lp_labels = lp_result.names
-                    for lp_box in lp_boxes:
-                        lp_label = lp_labels[int(lp_box.cls)]
-                        if lp_label == 'license_plate':  
-                            lp_confidence = float(lp_box.conf)
-                            lp_x1, lp_y1, lp_x2, lp_y2 = map(int, lp_box.xyxy[0])
-                            lp_x1, lp_x2 = lp_x1 + x1, lp_x2 + x1
-                            lp_y1, lp_y2 = lp_y1 + y1, lp_y2 + y1
-
-                            final_results.append({
-                                'label': lp_label,
-                                'confidence': lp_confidence,
-                                'box': [lp_x1, lp_y1, lp_x2, lp_y2]
-                            })
-            if label == 'bike':
-                bike_image = image[y1:y2, x1:x2]
-                helmet_results = vehicle_model.predict(
-                    source=bike_image,
-                    device=0,
-                    save=False
-                )
-
-                for h_result in helmet_results:
-                    h_boxes = h_result.boxes
-                    h_labels = h_result.names
-                    for h_box in h_boxes:
-                        h_label = h_labels[int(h_box.cls)]
-                        if h_label in ['Helmet', 'Non_helmet']:
-                            h_confidence = float(h_box.conf)
-                            h_x1, h_y1, h_x2, h_y2 = map(int, h_box.xyxy[0])
-                            h_x1, h_x2 = h_x1 + x1, h_x2 + x1
-                            h_y1, h_y2 = h_y1 + y1, h_y2 + y1
-
-                            final_results.append({
-                                'label': h_label,
-                                'confidence': h_confidence,
-                                'box': [h_x1, h_y1, h_x2, h_y2]
-                            })
+    # Mũ bảo hiểm: một batch cho tất cả crop xe máy
+    final_results.extend(helmet_cascade.detect(image, vehicle_boxes, vehicle_model.names))
+    helmet_cascade.print_stats()
+    plate_cascade.print_stats()
 
     for result in final_results:
         label = result['label']
@@ -110,7 +75,6 @@ def predict_yolo():
 
 if __name__ == "__main__":
     if not torch.cuda.is_available():
-        print("GPU không khả dụng. Vui lòng kiểm tra cài đặt CUDA!")
-        exit()
+        print("⚠ GPU không khả dụng, chạy trên CPU (backend chọn qua DETECTOR_BACKEND)")
     
     predict_yolo()
\ No newline at end of file
@@ -1,4 +1,4 @@
-from ultralytics import YOLO
+from detector_backend import load_detector
 import cv2
 import os
 import torch
@@ -6,14 +6,13 @@ import torch
 def predict_yolo(video_path, model_path, output_dir):
     # Kiểm tra GPU
     if not torch.cuda.is_available():
-        print("GPU không khả dụng. Vui lòng kiểm tra cài đặt CUDA!")
-        return
+        print("⚠ GPU không khả dụng, chạy trên CPU (backend chọn qua DETECTOR_BACKEND)")
     if not os.path.exists(video_path):
         print(f"File video {video_path} không tồn tại!")
         return
 
     try:
-        model = YOLO(model_path)
+        model = load_detector(model_path)
     except Exception as e:
         print(f"Lỗi khi tải mô hình: {e}")
         return
@@ -0,0 +1,193 @@
+"""
+INT8 post-training quantization for the custom YOLO models
+Hiệu chỉnh (calibrate) trên một mẫu ảnh train trong data yaml, tạo model INT8 cho CPU (OpenVINO / ONNX Runtime) và so sánh với FP32
+"""
+
+import argparse
+import json
+import os
+import random
+
+import cv2
+import numpy as np
+import yaml
+from ultralytics import YOLO
+
+from compare_backends import measure_accuracy, measure_latency, model_size_mb, val_images
+from detector_backend import artefact_path, export_model, load_detector, module_available
+
+# Custom models and the dataset each one was trained on
+MODELS = {
+    'vehicle': (r"D:\JUPYTER NOTEBOOK\Traffic Detection using YOLO\runs\train_vehicle\exp_vehicle\weights\best.pt",
+                'data.yaml'),
+    'helmet': (r"D:\PROJECTS\Traffic Detection using YOLO\runs\train_helmet\exp_helmet\weights\best.pt",
+               'data_helmet.yaml'),
+    'license': (r"D:\JUPYTER NOTEBOOK\Traffic Detection using YOLO\runs\train_license\exp_license\weights\best.pt",
+                'license_data.yaml'),
+}
+
+
+def calibration_dataset(weights, data, count, seed=0):
+    """Sample `count` train images of a dataset yaml into <stem>_calib.txt and a yaml that points at it"""
+    with open(data, encoding='utf-8') as f:
+        config = yaml.safe_load(f)
+    train = config['train']
+    if not os.path.isabs(train) and config.get('path'):
+        train = os.path.join(config['path'], train)
+    images = sorted(p for p in os.listdir(train) if p.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp')))
+    random.Random(seed).shuffle(images)
+    images = [os.path.join(train, name) for name in images[:count]]
+
+    stem, _ = os.path.splitext(weights)
+    list_path = stem + '_calib.txt'
+    with open(list_path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(images) + '\n')
+    calib_yaml = stem + '_calib.yaml'
+    # The INT8 exporters calibrate on the 'val' split, so both splits point at the sample
+    with open(calib_yaml, 'w', encoding='utf-8') as f:
+        yaml.safe_dump({'train': list_path, 'val': list_path, 'nc': config['nc'], 'names': config['names']}, f,
+                       allow_unicode=True)
+    return images, calib_yaml
+
+
+def letterbox(image, imgsz):
+    """Resize keeping aspect ratio and pad to imgsz x imgsz, as ultralytics does before inference"""
+    height, width = image.shape[:2]
+    ratio = min(imgsz / height, imgsz / width)
+    new_w, new_h = int(round(width * ratio)), int(round(height * ratio))
+    resized = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    canvas = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    top, left = (imgsz - new_h) // 2, (imgsz - new_w) // 2
+    canvas[top:top + new_h, left:left + new_w] = resized
+    return canvas
+
+
+class ImageCalibrationReader:
+    """ONNX Runtime calibration reader feeding preprocessed images one at a time"""
+
+    def __init__(self, images, input_name, imgsz):
+        self.images = iter(images)
+        self.input_name = input_name
+        self.imgsz = imgsz
+
+    def get_next(self):
+        for path in self.images:
+            image = cv2.imread(path)
+            if image is None:
+                continue
+            blob = letterbox(image, self.imgsz)[:, :, ::-1].transpose(2, 0, 1)
+            blob = np.ascontiguousarray(blob, dtype=np.float32)[None] / 255.0
+            return {self.input_name: blob}
+        return None
+
+
+def quantize_openvino(weights, calib_yaml, imgsz):
+    """INT8 OpenVINO model via ultralytics export (NNCF calibration on calib_yaml)"""
+    # ultralytics writes it to <stem>_int8_openvino_model, where detector_backend looks for it
+    # Dynamic shape: tiled and crop-batch inference send several images per call
+    return str(YOLO(weights).export(format='openvino', int8=True, dynamic=True, data=calib_yaml, imgsz=imgsz,
+                                    fraction=1.0))
+
+
+def quantize_onnx(weights, images, imgsz):
+    """INT8 ONNX model via ONNX Runtime static QDQ quantization of the FP32 export"""
+    import onnx
+    import onnxruntime
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_static
+
+    fp32_path = export_model(weights, 'onnx', imgsz)
+    int8_path = artefact_path(weights, 'onnx', int8=True)
+    input_name = onnxruntime.InferenceSession(fp32_path, providers=['CPUExecutionProvider']).get_inputs()[0].name
+    quantize_static(fp32_path, int8_path, ImageCalibrationReader(images, input_name, imgsz),
+                    quant_format=QuantFormat.QDQ, per_channel=True,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+
+    # Keep the ultralytics metadata (class names, stride, imgsz) so YOLO() can load the INT8 model
+    fp32_model = onnx.load(fp32_path)
+    int8_model = onnx.load(int8_path)
+    del int8_model.metadata_props[:]
+    int8_model.metadata_props.extend(fp32_model.metadata_props)
+    onnx.save(int8_model, int8_path)
+    return int8_path
+
+
+def evaluate(weights, backend, precision, data, images, imgsz, skip_map):
+    detector = load_detector(weights, backend=backend, imgsz=imgsz, precision=precision)
+    row = {'precision': detector.precision, 'backend': detector.backend, 'path': detector.path,
+           'size_mb': model_size_mb(detector.path)}
+    row.update(measure_latency(detector, images, imgsz=imgsz))
+    if not skip_map:
+        row.update(measure_accuracy(detector, data, imgsz=imgsz))
+    return row
+
+
+def print_report(report):
+    print(f"\n{'model':<9} {'precision':<10} {'size MB':>8} {'mean ms':>9} {'speedup':>8} "
+          f"{'mAP50':>7} {'mAP50-95':>9} {'ΔmAP50-95':>10}  verdict")
+    for name, entry in report.items():
+        fp32, int8 = entry['fp32'], entry['int8']
+        for row in (fp32, int8):
+            speedup = fp32.get('mean_ms', 0) / row['mean_ms'] if row.get('mean_ms') else 0.0
+            delta = row.get('map50_95', 0.0) - fp32.get('map50_95', 0.0)
+            verdict = entry['verdict'] if row is int8 else ''
+            print(f"{name:<9} {row['precision'].upper():<10} {row['size_mb']:>8.1f} {row.get('mean_ms', 0):>9.1f} "
+                  f"{speedup:>7.2f}x {row.get('map50', 0):>7.3f} {row.get('map50_95', 0):>9.3f} "
+                  f"{delta:>+10.3f}  {verdict}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="INT8 post-training quantization with an FP32 comparison report")
+    parser.add_argument('--models', nargs='+', default=list(MODELS), choices=list(MODELS))
+    parser.add_argument('--backend', default='openvino', choices=['openvino', 'onnx'])
+    parser.add_argument('--calib-images', type=int, default=300, help="Train images sampled for calibration")
+    parser.add_argument('--latency-images', type=int, default=100, help="Val images used for the latency test")
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--max-map-drop', type=float, default=0.01, help="Largest acceptable mAP50-95 loss")
+    parser.add_argument('--skip-map', action='store_true', help="Latency and size only")
+    parser.add_argument('--output', default='quantization_report.json')
+    args = parser.parse_args()
+
+    if not module_available('openvino' if args.backend == 'openvino' else 'onnxruntime'):
+        print(f"✗ {args.backend} chưa được cài đặt")
+        return
+
+    report = {}
+    for name in args.models:
+        weights, data = MODELS[name]
+        if not os.path.exists(weights):
+            print(f"⚠ Model not found: {weights}")
+            continue
+        print(f"\n=== {name}: {weights} ===")
+        images, calib_yaml = calibration_dataset(weights, data, args.calib_images)
+        print(f"✓ {len(images)} calibration images from {data}")
+
+        if args.backend == 'openvino':
+            path = quantize_openvino(weights, calib_yaml, args.imgsz)
+        else:
+            path = quantize_onnx(weights, images, args.imgsz)
+        print(f"✓ INT8 model: {path}")
+
+        latency_images = val_images(data, args.latency_images)
+        entry = {
+            'fp32': evaluate(weights, args.backend, 'fp32', data, latency_images, args.imgsz, args.skip_map),
+            'int8': evaluate(weights, args.backend, 'int8', data, latency_images, args.imgsz, args.skip_map)
+        }
+        if args.skip_map:
+            entry['verdict'] = 'mAP not measured'
+        else:
+            drop = entry['fp32']['map50_95'] - entry['int8']['map50_95']
+            entry['verdict'] = 'deploy INT8' if drop <= args.max_map_drop else 'keep FP32'
+        report[name] = entry
+
+    if not report:
+        return
+    print_report(report)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({'backend': args.backend, 'imgsz': args.imgsz, 'max_map_drop': args.max_map_drop,
+                   'models': report}, f, indent=2)
+    print(f"✓ Report saved to {args.output}")
+    print("Deploy an INT8 model with DETECTOR_PRECISION=int8 (and the same DETECTOR_BACKEND)")
+
+
+if __name__ == "__main__":
+    main()
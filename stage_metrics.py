@@ -0,0 +1,193 @@
+"""
+Per-stage latency instrumentation
+Đo thời gian từng bước xử lý (decode, inference, tracking, ...) bằng histogram log-bucket và ghi snapshot định kỳ
+"""
+
+import json
+import math
+import os
+import threading
+import time
+
+# Log-spaced buckets: 4 per octave from 10 µs up to ~80 s (each bucket ~19% wide)
+BUCKET_MIN = 1e-5
+BUCKETS_PER_OCTAVE = 4
+NUM_BUCKETS = 4 * 23
+LOG_BASE = math.log(2) / BUCKETS_PER_OCTAVE
+
+
+class StageHistogram:
+    """Fixed-size log-bucket latency histogram with O(1) record"""
+
+    def __init__(self):
+        self.buckets = [0] * NUM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        if seconds <= BUCKET_MIN:
+            index = 0
+        else:
+            index = min(NUM_BUCKETS - 1, int(math.log(seconds / BUCKET_MIN) / LOG_BASE))
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        """Approximate q-th percentile in seconds (geometric middle of the bucket)"""
+        if self.count == 0:
+            return 0.0
+        rank = q / 100.0 * self.count
+        seen = 0
+        for index, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank and n > 0:
+                return min(self.max, BUCKET_MIN * math.exp(LOG_BASE * (index + 0.5)))
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean_ms': self.total / self.count * 1000 if self.count else 0.0,
+            'p50_ms': self.percentile(50) * 1000,
+            'p95_ms': self.percentile(95) * 1000,
+            'p99_ms': self.percentile(99) * 1000,
+            'max_ms': self.max * 1000,
+            'total_s': self.total
+        }
+
+
+class _StageTimer:
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class StageMetrics:
+    """Named-stage timers for one pipeline with a periodically rewritten snapshot file.
+
+    Usage:
+        metrics = StageMetrics('draw_count_video')
+        with metrics.stage('inference'):
+            results = model(frame)
+        metrics.frame_done()
+
+    The snapshot is JSON, or Prometheus text format when the path ends in .prom.
+    """
+
+    def __init__(self, pipeline, snapshot_path=None, snapshot_interval=10.0):
+        self.pipeline = pipeline
+        if snapshot_path is None:
+            snapshot_dir = os.environ.get('STAGE_METRICS_DIR', 'metrics')
+            snapshot_path = os.path.join(snapshot_dir, f"{pipeline}.json")
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.gauges = {}
+        self.frames = 0
+        self.started = time.time()
+        self.last_snapshot = time.perf_counter()
+
+    def stage(self, name):
+        """Context manager that times one execution of a stage"""
+        return _StageTimer(self, name)
+
+    def record(self, name, seconds):
+        with self.lock:
+            histogram = self.stages.get(name)
+            if histogram is None:
+                histogram = self.stages[name] = StageHistogram()
+            histogram.record(seconds)
+
+    def set_gauge(self, name, value):
+        """Store the latest value of an instantaneous measurement (e.g. a queue depth)"""
+        with self.lock:
+            self.gauges[name] = value
+
+    def frame_done(self):
+        """Count one pipeline frame and rewrite the snapshot when the interval has passed"""
+        self.frames += 1
+        now = time.perf_counter()
+        if self.snapshot_interval and now - self.last_snapshot >= self.snapshot_interval:
+            self.last_snapshot = now
+            self.write_snapshot()
+
+    def snapshot(self):
+        with self.lock:
+            stages = {name: histogram.summary() for name, histogram in self.stages.items()}
+            gauges = dict(self.gauges)
+        uptime = time.time() - self.started
+        return {
+            'pipeline': self.pipeline,
+            'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'uptime_s': uptime,
+            'frames': self.frames,
+            'fps': self.frames / uptime if uptime > 0 else 0.0,
+            'stages': stages,
+            'gauges': gauges
+        }
+
+    def to_prometheus(self, snapshot=None):
+        snapshot = snapshot or self.snapshot()
+        label = f'pipeline="{self.pipeline}"'
+        lines = [
+            '# TYPE pipeline_frames_total counter',
+            f'pipeline_frames_total{{{label}}} {snapshot["frames"]}',
+            '# TYPE stage_latency_seconds summary'
+        ]
+        for name, s in snapshot['stages'].items():
+            stage_label = f'{label},stage="{name}"'
+            for quantile, key in (('0.5', 'p50_ms'), ('0.95', 'p95_ms'), ('0.99', 'p99_ms')):
+                lines.append(f'stage_latency_seconds{{{stage_label},quantile="{quantile}"}} {s[key] / 1000:.6f}')
+            lines.append(f'stage_latency_seconds_sum{{{stage_label}}} {s["total_s"]:.6f}')
+            lines.append(f'stage_latency_seconds_count{{{stage_label}}} {s["count"]}')
+        if snapshot.get('gauges'):
+            lines.append('# TYPE pipeline_gauge gauge')
+            for name, value in snapshot['gauges'].items():
+                lines.append(f'pipeline_gauge{{{label},name="{name}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def write_snapshot(self, path=None):
+        """Atomically rewrite the snapshot file so readers never see a partial write"""
+        path = path or self.snapshot_path
+        snapshot = self.snapshot()
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                if path.endswith('.prom'):
+                    f.write(self.to_prometheus(snapshot))
+                else:
+                    json.dump(snapshot, f, indent=2)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠ Cannot write metrics snapshot {path}: {e}")
+        return snapshot
+
+    def print_summary(self):
+        """Print the per-stage table and write a final snapshot"""
+        snapshot = self.write_snapshot()
+        print(f"\n=== Stage latency: {self.pipeline} ({snapshot['frames']} frames, {snapshot['fps']:.1f} FPS) ===")
+        print(f"{'stage':<18} {'count':>7} {'mean ms':>9} {'p50':>8} {'p95':>8} {'p99':>8} {'total s':>8}")
+        for name, s in sorted(snapshot['stages'].items(), key=lambda item: -item[1]['total_s']):
+            print(f"{name:<18} {s['count']:>7} {s['mean_ms']:>9.2f} {s['p50_ms']:>8.2f} "
+                  f"{s['p95_ms']:>8.2f} {s['p99_ms']:>8.2f} {s['total_s']:>8.1f}")
+        print(f"Metrics snapshot: {self.snapshot_path}")
+        return snapshot
@@ -1,14 +1,21 @@
-from ultralytics import YOLO
+from detector_backend import load_detector
 import cv2
 import numpy as np
+from zone_index import ZoneIndex
 import torch
 import os
+from stage_metrics import StageMetrics
+from tiled_inference import TiledDetector
+from helmet_cascade import HelmetCascade
+from plate_cascade import PlateCascade
+from detection_record import from_result, to_rows
 
 # Biến toàn cục
 polygons = []  # Lưu danh sách các đa giác (mỗi đa giác là danh sách các điểm)
 current_polygon = []  # Lưu các điểm của đa giác đang vẽ
 drawing = False
 current_frame = None  # Biến lưu frame hiện tại
+zone_index = ZoneIndex()  # Bitmask các đa giác, chỉ vẽ lại khi đa giác thay đổi
 
 def draw_polygon(event, x, y, flags, param):
     global drawing, current_polygon, polygons, current_frame
@@ -33,28 +40,14 @@ def draw_polygon(event, x, y, flags, param):
         cv2.polylines(img_copy, [np.array(polygons[-1])], True, (0, 255, 0), 2)
         cv2.imshow('Frame', img_copy)
 
-def is_vehicle_in_polygon(box, polygon):
-    """Kiểm tra xem tâm của bounding box có nằm trong đa giác hay không"""
-    box_center_x = (box[0] + box[2]) / 2
-    box_center_y = (box[1] + box[3]) / 2
-    polygon_np = np.array(polygon, dtype=np.int32)
-    return cv2.pointPolygonTest(polygon_np, (box_center_x, box_center_y), False) >= 0
-
 def count_vehicles_in_polygons(boxes, polygons, class_names):
-    """Đếm số lượng xe trong từng đa giác"""
-    polygon_counts = []
-    for polygon in polygons:
-        counts = {'bike': 0, 'car': 0}
-        for box in boxes:
-            if is_vehicle_in_polygon(box, polygon):
-                class_id = int(box[4])
-                class_name = class_names[class_id]
-                if class_name == 'bike':
-                    counts['bike'] += 1
-                elif class_name == 'car':
-                    counts['car'] += 1
-        polygon_counts.append(counts)
-    return polygon_counts
+    """Đếm số lượng xe trong từng đa giác (tra tâm box trên bitmask của zone_index)"""
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 5)
+    per_class = zone_index.count(boxes, boxes[:, 4].astype(int), polygons, minlength=len(class_names))
+    names = [class_names[i] for i in range(len(class_names))]
+    bike = [i for i, name in enumerate(names) if name == 'bike']
+    car = [i for i, name in enumerate(names) if name == 'car']
+    return [{'bike': int(row[bike].sum()), 'car': int(row[car].sum())} for row in per_class]
 
 def save_predictions(polygons, polygon_counts, filename='predict.txt'):
     """Lưu tọa độ đa giác và số lượng xe vào file"""
@@ -64,17 +57,49 @@ def save_predictions(polygons, polygon_counts, filename='predict.txt'):
             f.write(f"  bikes: {counts['bike']}, Cars: {counts['car']}\n")
             f.write("---\n")
 
+def detect_vehicles(vehicle_model, vehicle_tiler, frame):
+    """Boxes [x1, y1, x2, y2, class_id]; frame lớn (4K) được chia tile, bỏ các tile ngoài đa giác"""
+    if vehicle_tiler.enabled_for(frame):
+        detections = vehicle_tiler.detect(frame, polygons)
+        return [row[:5] for row in detections.tolist()]
+    results = vehicle_model.predict(source=frame, device=0, save=False)
+    return to_rows(from_result(results[0]), confidence=False).tolist()
+
+def draw_helmets(image, helmets):
+    """Vẽ các box Helmet / Non_helmet (tọa độ frame) trả về bởi HelmetCascade"""
+    for helmet in helmets:
+        h_x1, h_y1, h_x2, h_y2 = helmet['box']
+        cv2.rectangle(image, (h_x1, h_y1), (h_x2, h_y2), (0, 0, 255), 2)
+        cv2.putText(image, f"{helmet['label']} {helmet['confidence']:.2f}", (h_x1, h_y1 - 10),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
+
+def draw_plates(image, vehicle_records):
+    """Vẽ biển số đã gắn vào bản ghi của từng xe (PlateCascade)"""
+    for record in vehicle_records:
+        plate = record['plate']
+        if plate is None:
+            continue
+        x_min, y_min, x_max, y_max = plate['box']
+        cv2.rectangle(image, (x_min, y_min), (x_max, y_max), (0, 255, 0), 2)
+        cv2.putText(image, f"{plate['label']} {plate['confidence']:.2f}", (x_min, y_min - 10),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+
 def main():
     global current_frame, polygons, current_polygon
 
     # Kiểm tra GPU
     if not torch.cuda.is_available():
-        print("GPU không khả dụng. Vui lòng kiểm tra cài đặt CUDA!")
-        exit()
+        print("⚠ GPU không khả dụng, chạy trên CPU (backend chọn qua DETECTOR_BACKEND)")
 
     # Load hai mô hình YOLO
-    vehicle_model = YOLO(r"D:\JUPYTER NOTEBOOK\Traffic Detection using YOLO\runs\train_vehicle\exp_vehicle\weights\epoch10.pt")
-    license_model = YOLO(r"D:\JUPYTER NOTEBOOK\Traffic Detection using YOLO\runs\train_license\exp_license\weights\best.pt")
+    vehicle_model = load_detector(r"D:\JUPYTER NOTEBOOK\Traffic Detection using YOLO\runs\train_vehicle\exp_vehicle\weights\epoch10.pt")
+    license_model = load_detector(r"D:\JUPYTER NOTEBOOK\Traffic Detection using YOLO\runs\train_license\exp_license\weights\best.pt")
+    # Nguồn 4K: chạy vehicle_model theo tile chồng lấn để xe máy ở xa không bị mất khi thu nhỏ về 640px
+    vehicle_tiler = TiledDetector(vehicle_model)
+    # Mũ bảo hiểm: gom crop của tất cả xe máy trong frame thành một batch
+    helmet_cascade = HelmetCascade(vehicle_model)
+    # Biển số: chỉ chạy license_model trên crop xe/xe máy chưa có biển số tốt, 3 frame một lần
+    plate_cascade = PlateCascade(license_model, interval=3)
     
     # Đường dẫn đến ảnh hoặc video
     # source = r"D:\JUPYTER NOTEBOOK\Traffic Detection using YOLO\Combined_Data\test\images\static-images.vnncdn.net-vps_images_publish-000001-000003-2024-7-11-_w-camera5-4176.jpg"
@@ -98,29 +123,21 @@ def main():
     vehicle_class_names = vehicle_model.names  # Danh sách tên lớp (e.g., ['bike', 'car', 'Helmet', 'Non_helmet'])
 
     if is_video:
+        metrics = StageMetrics('test')
         while cap.isOpened():
-            ret, frame = cap.read()
+            with metrics.stage('decode'):
+                ret, frame = cap.read()
             if not ret:
                 break
             current_frame = frame.copy()
 
             # Dự đoán với vehicle_model
-            vehicle_results = vehicle_model.predict(source=current_frame, device=0, save=False)
-            vehicle_boxes = []
-            for result in vehicle_results:
-                for box in result.boxes:
-                    x_min, y_min, x_max, y_max = box.xyxy[0].tolist()
-                    class_id = box.cls[0].item()
-                    vehicle_boxes.append([x_min, y_min, x_max, y_max, class_id])
-
-            # Dự đoán với license_model
-            license_results = license_model.predict(source=current_frame, device=0, save=False)
-            license_boxes = []
-            for result in license_results:
-                for box in result.boxes:
-                    x_min, y_min, x_max, y_max = box.xyxy[0].tolist()
-                    class_id = box.cls[0].item()
-                    license_boxes.append([x_min, y_min, x_max, y_max, class_id])
+            with metrics.stage('inference'):
+                vehicle_boxes = detect_vehicles(vehicle_model, vehicle_tiler, current_frame)
+
+            # Biển số trên crop của xe (thay cho lần chạy license_model trên toàn frame)
+            with metrics.stage('plate_inference'):
+                vehicle_records = plate_cascade.update(frame, vehicle_boxes, vehicle_class_names)
 
             # Vẽ bounding box của phương tiện và mũ
             for box in vehicle_boxes:
@@ -133,35 +150,13 @@ def main():
                 cv2.putText(current_frame, class_name, (int(x_min), int(y_min) - 10),
                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
 
-            # Xử lý mũ bảo hiểm cho xe máy
-            for box in vehicle_boxes:
-                x_min, y_min, x_max, y_max, class_id = box
-                class_name = vehicle_class_names[int(class_id)]
-                if class_name == 'bike':
-                    bike_image = current_frame[int(y_min):int(y_max), int(x_min):int(x_max)]
-                    helmet_results = vehicle_model.predict(source=bike_image, device=0, save=False)
-                    for h_result in helmet_results:
-                        for h_box in h_result.boxes:
-                            h_class_id = h_box.cls[0].item()
-                            h_label = vehicle_class_names[int(h_class_id)]
-                            if h_label in ['Helmet', 'Non_helmet']:
-                                h_confidence = float(h_box.conf)
-                                h_x1, h_y1, h_x2, h_y2 = h_box.xyxy[0].tolist()
-                                h_x1, h_x2 = int(h_x1) + int(x_min), int(h_x2) + int(x_min)
-                                h_y1, h_y2 = int(h_y1) + int(y_min), int(h_y2) + int(y_min)
-                                cv2.rectangle(current_frame, (h_x1, h_y1), (h_x2, h_y2), (0, 0, 255), 2)
-                                cv2.putText(current_frame, f'{h_label} {h_confidence:.2f}', (h_x1, h_y1 - 10),
-                                           cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
+            # Xử lý mũ bảo hiểm cho xe máy: crop từ frame gốc (chưa vẽ), một batch cho tất cả xe máy
+            with metrics.stage('helmet_inference'):
+                helmets = helmet_cascade.detect(frame, vehicle_boxes, vehicle_class_names)
+            draw_helmets(current_frame, helmets)
 
             # Vẽ bounding box của biển số
-            license_class_names = license_model.names  # Danh sách tên lớp (e.g., ['biensoxehoi'])
-            for box in license_boxes:
-                x_min, y_min, x_max, y_max, class_id = box
-                class_name = license_class_names[int(class_id)]
-                if class_name == 'biensoxehoi':
-                    cv2.rectangle(current_frame, (int(x_min), int(y_min)), (int(x_max), int(y_max)), (0, 255, 0), 2)
-                    cv2.putText(current_frame, class_name, (int(x_min), int(y_min) - 10),
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+            draw_plates(current_frame, vehicle_records)
 
             # Vẽ các đa giác đã hoàn thành
             for polygon in polygons:
@@ -174,7 +169,8 @@ def main():
                     cv2.circle(current_frame, point, 3, (0, 0, 255), -1)
 
             # Đếm số lượng xe trong từng đa giác
-            vehicle_counts = count_vehicles_in_polygons(vehicle_boxes, polygons, vehicle_class_names)
+            with metrics.stage('zone_test'):
+                vehicle_counts = count_vehicles_in_polygons(vehicle_boxes, polygons, vehicle_class_names)
 
             # Hiển thị số lượng xe
             total_counts = {'bike': 0, 'car': 0}
@@ -190,9 +186,11 @@ def main():
             cv2.putText(current_frame, f'Total Cars: {total_counts["car"]}', (10, 60 + len(vehicle_counts) * 30),
                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
 
-            cv2.imshow('Frame', current_frame)
+            with metrics.stage('display'):
+                cv2.imshow('Frame', current_frame)
+                key = cv2.waitKey(1) & 0xFF
+            metrics.frame_done()
 
-            key = cv2.waitKey(1) & 0xFF
             if key == ord('q'):
                 break
             elif key == ord('s'):
@@ -201,23 +199,16 @@ def main():
                 print("Polygon coordinates and counts:", list(zip(polygons, vehicle_counts)))
 
         cap.release()
+        vehicle_tiler.print_stats()
+        helmet_cascade.print_stats()
+        plate_cascade.print_stats()
+        metrics.print_summary()
     else:
         # Xử lý ảnh tĩnh
-        vehicle_results = vehicle_model.predict(source=current_frame, device=0, save=False)
-        vehicle_boxes = []
-        for result in vehicle_results:
-            for box in result.boxes:
-                x_min, y_min, x_max, y_max = box.xyxy[0].tolist()
-                class_id = box.cls[0].item()
-                vehicle_boxes.append([x_min, y_min, x_max, y_max, class_id])
-
-        license_results = license_model.predict(source=current_frame, device=0, save=False)
-        license_boxes = []
-        for result in license_results:
-            for box in result.boxes:
-                x_min, y_min, x_max, y_max = box.xyxy[0].tolist()
-                class_id = box.cls[0].item()
-                license_boxes.append([x_min, y_min, x_max, y_max, class_id])
+        vehicle_boxes = detect_vehicles(vehicle_model, vehicle_tiler, current_frame)
+        # Ảnh tĩnh không đổi nên chỉ chạy mũ bảo hiểm một lần, không chạy lại mỗi vòng hiển thị
+        helmets = helmet_cascade.detect(current_frame, vehicle_boxes, vehicle_class_names)
+        vehicle_records = plate_cascade.update(current_frame, vehicle_boxes, vehicle_class_names)
 
         while True:
             # Vẽ bounding box của phương tiện và mũ
@@ -232,34 +223,11 @@ def main():
                 cv2.putText(frame_copy, class_name, (int(x_min), int(y_min) - 10),
                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
 
-            # Xử lý mũ bảo hiểm cho xe máy
-            for box in vehicle_boxes:
-                x_min, y_min, x_max, y_max, class_id = box
-                class_name = vehicle_class_names[int(class_id)]
-                if class_name == 'bike':
-                    bike_image = frame_copy[int(y_min):int(y_max), int(x_min):int(x_max)]
-                    helmet_results = vehicle_model.predict(source=bike_image, device=0, save=False)
-                    for h_result in helmet_results:
-                        for h_box in h_result.boxes:
-                            h_class_id = h_box.cls[0].item()
-                            h_label = vehicle_class_names[int(h_class_id)]
-                            if h_label in ['Helmet', 'Non_helmet']:
-                                h_confidence = float(h_box.conf)
-                                h_x1, h_y1, h_x2, h_y2 = h_box.xyxy[0].tolist()
-                                h_x1, h_x2 = int(h_x1) + int(x_min), int(h_x2) + int(x_min)
-                                h_y1, h_y2 = int(h_y1) + int(y_min), int(h_y2) + int(y_min)
-                                cv2.rectangle(frame_copy, (h_x1, h_y1), (h_x2, h_y2), (0, 0, 255), 2)
-                                cv2.putText(frame_copy, f'{h_label} {h_confidence:.2f}', (h_x1, h_y1 - 10),
-                                           cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
+            # Vẽ mũ bảo hiểm của xe máy
+            draw_helmets(frame_copy, helmets)
 
             # Vẽ bounding box của biển số
-            for box in license_boxes:
-                x_min, y_min, x_max, y_max, class_id = box
-                class_name = license_model.names[int(class_id)]
-                if class_name == 'biensoxehoi':
-                    cv2.rectangle(frame_copy, (int(x_min), int(y_min)), (int(x_max), int(y_max)), (0, 255, 0), 2)
-                    cv2.putText(frame_copy, class_name, (int(x_min), int(y_min) - 10),
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+            draw_plates(frame_copy, vehicle_records)
 
             # Vẽ các đa giác đã hoàn thành
             for polygon in polygons:
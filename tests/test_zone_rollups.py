@@ -0,0 +1,41 @@
+import csv
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from zone_rollups import ZoneRollups
+
+
+def read_rows(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return list(csv.DictReader(f))
+
+
+def test_update_without_zones(tmp_path):
+    # No polygon drawn yet (startup, or after 'c' clears the zones)
+    rollups = ZoneRollups(['bike', 'car'], output_dir=str(tmp_path))
+    rollups.update(0.0, [])
+    rollups.update(0.5, [{'bike': 1, 'car': 2}])
+    rollups.update(1.5, [])
+    rollups.close()
+
+    # The [1, 2) second only saw frames without zones, so only [0, 1) has a row
+    rows = read_rows(tmp_path / 'zones_1s.csv')
+    assert len(rows) == 1
+    assert rows[0]['zone'] == '1'
+    assert rows[0]['frames'] == '2'
+    assert rows[0]['bike_max'] == '1'
+    assert rows[0]['car_max'] == '2'
+    assert float(rows[0]['bike_mean']) == 0.5
+    assert float(rows[0]['car_mean']) == 1.0
+    assert rollups.rows_written['1s'] == 1
+
+
+def test_frames_without_zones_write_nothing(tmp_path):
+    rollups = ZoneRollups(['bike', 'car'], output_dir=str(tmp_path))
+    for i in range(5):
+        rollups.update(i * 0.5, [])
+    rollups.close()
+
+    assert rollups.rows_written == {'1s': 0, '1min': 0, '15min': 0}
+    assert not os.path.exists(tmp_path / 'zones_1s.csv')
@@ -0,0 +1,161 @@
+"""
+Threaded video capture with a bounded frame buffer
+Đọc và giải mã video trên luồng riêng để vòng lặp xử lý không bị chặn bởi việc decode
+"""
+
+import threading
+import time
+from collections import deque
+
+import cv2
+
+LIVE_PREFIXES = ('rtsp://', 'rtmp://', 'http://', 'https://', 'udp://', 'tcp://')
+
+
+def is_live_source(source):
+    """Webcam indices and network streams are live, anything else is a file"""
+    if isinstance(source, int):
+        return True
+    if isinstance(source, str):
+        return source.isdigit() or source.lower().startswith(LIVE_PREFIXES)
+    return False
+
+
+class ThreadedCapture:
+    """Drop-in replacement for cv2.VideoCapture that decodes on a background thread.
+
+    Frames are kept in a small bounded buffer. With policy 'drop_oldest' the
+    oldest buffered frame is discarded when the buffer is full, so latency stays
+    bounded on live cameras. With policy 'block' the decoder waits for the
+    consumer, so no frame of a recorded file is lost.
+    """
+
+    POLICIES = ('drop_oldest', 'block')
+
+    def __init__(self, source, buffer_size=4, policy=None):
+        if policy is None:
+            policy = 'drop_oldest' if is_live_source(source) else 'block'
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown capture policy: {policy} (expected one of {self.POLICIES})")
+
+        # Accept a path/index or an already opened capture-like object
+        if isinstance(source, (str, int)):
+            self.cap = cv2.VideoCapture(int(source) if isinstance(source, str) and source.isdigit() else source)
+        else:
+            self.cap = source
+
+        self.policy = policy
+        self.buffer_size = max(1, buffer_size)
+        self.buffer = deque()
+        self.cond = threading.Condition()
+        self.cap_lock = threading.Lock()
+        self.stopped = False
+        self.finished = False
+
+        # Counters
+        self.frames_decoded = 0
+        self.frames_dropped = 0
+        self.frames_delivered = 0
+        self.decode_time = 0.0
+        self.wait_time = 0.0
+        self.max_buffered = 0
+
+        # Index (1-based, in source order) of the frame last returned by read()
+        self.frame_index = 0
+
+        self.thread = threading.Thread(target=self._decode_loop, name="capture-decode", daemon=True)
+        if self.cap.isOpened():
+            self.thread.start()
+        else:
+            self.finished = True
+
+    def _decode_loop(self):
+        """Decode frames until the source ends or release() is called"""
+        while True:
+            with self.cond:
+                if self.policy == 'block':
+                    while len(self.buffer) >= self.buffer_size and not self.stopped:
+                        self.cond.wait()
+                if self.stopped:
+                    break
+
+            start = time.perf_counter()
+            with self.cap_lock:
+                ret, frame = self.cap.read()
+            elapsed = time.perf_counter() - start
+
+            with self.cond:
+                self.decode_time += elapsed
+                if not ret:
+                    self.finished = True
+                    self.cond.notify_all()
+                    break
+
+                self.frames_decoded += 1
+                if len(self.buffer) >= self.buffer_size:
+                    self.buffer.popleft()
+                    self.frames_dropped += 1
+                # A FrameSampler source skips frames, so keep the source position it reports
+                self.buffer.append((getattr(self.cap, 'frame_index', self.frames_decoded), frame))
+                self.max_buffered = max(self.max_buffered, len(self.buffer))
+                self.cond.notify_all()
+
+    def read(self):
+        """Return (ret, frame) like cv2.VideoCapture.read()"""
+        start = time.perf_counter()
+        with self.cond:
+            while not self.buffer and not self.finished and not self.stopped:
+                self.cond.wait()
+            self.wait_time += time.perf_counter() - start
+
+            if not self.buffer:
+                return False, None
+
+            self.frame_index, frame = self.buffer.popleft()
+            self.frames_delivered += 1
+            self.cond.notify_all()
+            return True, frame
+
+    def get(self, prop_id):
+        with self.cap_lock:
+            return self.cap.get(prop_id)
+
+    def set(self, prop_id, value):
+        with self.cap_lock:
+            return self.cap.set(prop_id, value)
+
+    def isOpened(self):
+        return self.cap.isOpened() or len(self.buffer) > 0
+
+    def release(self):
+        """Stop the decode thread and release the underlying capture"""
+        with self.cond:
+            self.stopped = True
+            self.buffer.clear()
+            self.cond.notify_all()
+        if self.thread.is_alive():
+            self.thread.join(timeout=2.0)
+        with self.cap_lock:
+            self.cap.release()
+
+    def stats(self):
+        """Capture counters as a dict"""
+        with self.cond:
+            return {
+                'policy': self.policy,
+                'frames_decoded': self.frames_decoded,
+                'frames_delivered': self.frames_delivered,
+                'frames_dropped': self.frames_dropped,
+                'decode_time_s': self.decode_time,
+                'avg_decode_ms': self.decode_time / self.frames_decoded * 1000 if self.frames_decoded else 0.0,
+                'consumer_wait_s': self.wait_time,
+                'buffered': len(self.buffer),
+                'max_buffered': self.max_buffered
+            }
+
+    def print_stats(self):
+        stats = self.stats()
+        print(f"Capture ({stats['policy']}): decoded {stats['frames_decoded']}, "
+              f"dropped {stats['frames_dropped']}, "
+              f"decode time {stats['decode_time_s']:.1f}s ({stats['avg_decode_ms']:.1f} ms/frame), "
+              f"consumer wait {stats['consumer_wait_s']:.1f}s")
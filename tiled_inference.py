@@ -0,0 +1,182 @@
+"""
+Sliced (tiled) inference for high-resolution sources
+Cắt frame 4K thành các tile chồng lấn, chạy detector theo batch, bỏ tile nằm ngoài mọi vùng (zone) và gộp box bằng NMS theo lớp
+"""
+
+import math
+
+import cv2
+import numpy as np
+
+
+def nms(boxes, scores, iou_threshold):
+    """Greedy NMS in numpy; returns the kept indices sorted by descending score"""
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.int64)
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = np.maximum(0, x2 - x1) * np.maximum(0, y2 - y1)
+    order = np.argsort(-scores)
+    keep = []
+    while len(order):
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        w = np.maximum(0, np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]))
+        h = np.maximum(0, np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]))
+        inter = w * h
+        iou = inter / np.maximum(areas[i] + areas[rest] - inter, 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+def class_aware_nms(detections, iou_threshold):
+    """NMS per class on [x1, y1, x2, y2, class_id, confidence] rows (boxes of different classes never suppress)"""
+    if len(detections) == 0:
+        return detections
+    # Shift each class into its own coordinate range so one NMS pass handles all classes
+    offset = detections[:, 4:5] * (detections[:, :4].max() + 1)
+    keep = nms(detections[:, :4] + offset, detections[:, 5], iou_threshold)
+    return detections[keep]
+
+
+def tile_layout(frame_size, tile_size=640, overlap=0.2, grid=None):
+    """Overlapping (x1, y1, x2, y2) tiles covering a frame of frame_size (width, height).
+
+    Either square tiles of tile_size with the given overlap fraction, or an explicit
+    grid=(columns, rows) whose tiles are enlarged by the overlap fraction.
+    """
+    width, height = frame_size
+    if grid is not None:
+        columns, rows = grid
+        tile_w = math.ceil(width / columns * (1 + overlap))
+        tile_h = math.ceil(height / rows * (1 + overlap))
+    else:
+        tile_w = tile_h = tile_size
+        columns = max(1, math.ceil((width - tile_w * overlap) / (tile_w * (1 - overlap))))
+        rows = max(1, math.ceil((height - tile_h * overlap) / (tile_h * (1 - overlap))))
+    tile_w, tile_h = min(tile_w, width), min(tile_h, height)
+
+    # Spread the tiles evenly so the last one ends exactly at the frame border
+    xs = np.linspace(0, width - tile_w, columns).round().astype(int) if columns > 1 else [0]
+    ys = np.linspace(0, height - tile_h, rows).round().astype(int) if rows > 1 else [0]
+    return [(int(x), int(y), int(x) + tile_w, int(y) + tile_h) for y in ys for x in xs]
+
+
+class TiledDetector:
+    """Runs a Detector on overlapping tiles of a large frame and merges the results.
+
+    Tiles are sent to the detector in batches. Tiles that do not touch any zone
+    polygon are skipped. Boxes cut by an inner tile border are dropped: objects
+    smaller than the overlap are seen whole by the neighbouring tile, larger
+    ones by the downscaled full-frame pass that is added by default. Remaining
+    duplicates are removed with class-aware NMS.
+    """
+
+    def __init__(self, detector, tile_size=640, overlap=0.2, grid=None, batch_size=8,
+                 full_frame=True, iou=0.5, edge_margin=2, min_frame_width=2560):
+        self.detector = detector
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.grid = grid
+        self.batch_size = batch_size
+        self.full_frame = full_frame
+        self.iou = iou
+        self.edge_margin = edge_margin
+        self.min_frame_width = min_frame_width
+
+        self.layout_key = None
+        self.tiles = []
+        self.zone_key = None
+        self.active = []
+
+        self.frames = 0
+        self.tiles_run = 0
+        self.tiles_skipped = 0
+
+    def enabled_for(self, frame):
+        """Tiling only pays off on frames much larger than the detector input"""
+        return frame.shape[1] >= self.min_frame_width
+
+    def layout(self, frame_shape):
+        key = frame_shape[:2]
+        if key != self.layout_key:
+            self.layout_key = key
+            self.tiles = tile_layout((frame_shape[1], frame_shape[0]), self.tile_size, self.overlap, self.grid)
+            self.zone_key = None
+        return self.tiles
+
+    def active_tiles(self, frame_shape, polygons):
+        """Tiles that overlap at least one zone (all tiles when there are no zones)"""
+        tiles = self.layout(frame_shape)
+        polygons = [p for p in polygons or [] if len(p) >= 3]
+        key = tuple(tuple((int(x), int(y)) for x, y in p) for p in polygons)
+        if key == self.zone_key:
+            return self.active
+        self.zone_key = key
+        if not polygons:
+            self.active = list(tiles)
+            return self.active
+
+        # Rasterize the zones at 1/8 resolution and keep tiles with any zone pixel
+        scale = 8
+        height, width = frame_shape[:2]
+        mask = np.zeros((math.ceil(height / scale), math.ceil(width / scale)), dtype=np.uint8)
+        cv2.fillPoly(mask, [np.array(p, dtype=np.int32) // scale for p in polygons], 1)
+        self.active = [tile for tile in tiles
+                       if mask[tile[1] // scale:math.ceil(tile[3] / scale),
+                               tile[0] // scale:math.ceil(tile[2] / scale)].any()]
+        return self.active
+
+    def predict_batch(self, images, **kwargs):
+        results = []
+        # Exports with a static batch (e.g. older OpenVINO INT8 models) take fewer images per call
+        batch_size = min(self.batch_size, getattr(self.detector, 'max_batch', None) or self.batch_size)
+        for start in range(0, len(images), batch_size):
+            results.extend(self.detector.predict(images[start:start + batch_size], verbose=False, **kwargs))
+        return results
+
+    def detect(self, frame, polygons=None, conf=0.25, classes=None, **kwargs):
+        """Detections on frame as an (N, 6) array of [x1, y1, x2, y2, class_id, confidence]"""
+        tiles = self.active_tiles(frame.shape, polygons)
+        self.frames += 1
+        self.tiles_run += len(tiles)
+        self.tiles_skipped += len(self.tiles) - len(tiles)
+
+        height, width = frame.shape[:2]
+        images = [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in tiles]
+        regions = list(tiles)
+        if self.full_frame:
+            images.append(frame)
+            regions.append((0, 0, width, height))
+        if not images:
+            return np.zeros((0, 6), dtype=np.float32)
+
+        results = self.predict_batch(images, conf=conf, iou=self.iou, classes=classes, **kwargs)
+        parts = []
+        for result, (x0, y0, x1, y1) in zip(results, regions):
+            if result.boxes is None or len(result.boxes) == 0:
+                continue
+            boxes = result.boxes.xyxy.cpu().numpy() + (x0, y0, x0, y0)
+            # Drop boxes touching a tile edge that lies inside the frame (the object is cut there)
+            m = self.edge_margin
+            cut = (((boxes[:, 0] <= x0 + m) & (x0 > 0)) | ((boxes[:, 1] <= y0 + m) & (y0 > 0))
+                   | ((boxes[:, 2] >= x1 - m) & (x1 < width)) | ((boxes[:, 3] >= y1 - m) & (y1 < height)))
+            detections = np.column_stack([boxes, result.boxes.cls.cpu().numpy(), result.boxes.conf.cpu().numpy()])
+            parts.append(detections[~cut])
+        if not parts:
+            return np.zeros((0, 6), dtype=np.float32)
+        return class_aware_nms(np.concatenate(parts).astype(np.float32), self.iou)
+
+    def stats(self):
+        frames = max(self.frames, 1)
+        total = self.tiles_run + self.tiles_skipped
+        return {
+            'tiles_per_frame': len(self.tiles),
+            'tiles_run_per_frame': self.tiles_run / frames,
+            'skipped_pct': 100.0 * self.tiles_skipped / total if total else 0.0
+        }
+
+    def print_stats(self):
+        s = self.stats()
+        print(f"Tiled inference: {s['tiles_per_frame']} tiles/frame, {s['tiles_run_per_frame']:.1f} run, "
+              f"{s['skipped_pct']:.0f}% skipped outside zones")
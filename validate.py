@@ -1,8 +1,8 @@
-from ultralytics import YOLO
+from detector_backend import load_detector
 
 def validate_yolo():
     # model = YOLO("runs/train/exp/weights/best.pt")
-    model = YOLO(r"D:/JUPYTER NOTEBOOK/Traffic Detection using YOLO/runs/train/exp/weights/best.pt")
+    model = load_detector(r"D:/JUPYTER NOTEBOOK/Traffic Detection using YOLO/runs/train/exp/weights/best.pt")
     metrics = model.val(
         data=r"D:/JUPYTER NOTEBOOK/Traffic Detection using YOLO/data.yaml",
         device=0  
@@ -13,6 +13,5 @@ def validate_yolo():
 if __name__ == "__main__":
     import torch
     if not torch.cuda.is_available():
-        print("GPU không khả dụng. Vui lòng kiểm tra cài đặt CUDA!")
-        exit()
+        print("⚠ GPU không khả dụng, chạy trên CPU (backend chọn qua DETECTOR_BACKEND)")
     validate_yolo()
\ No newline at end of file
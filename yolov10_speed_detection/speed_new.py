@@ -171,33 +171,14 @@ class SpeedEstimator:
         
         return new_speed
 
-    def estimate_speed(self, im0, tracks):
+    def update(self, boxes, t_ids, timestamp=None):
         """
-        Estimates speed using IPM for maximum accuracy across all frame positions.
+        Updates track histories and speeds without drawing.
+        Timestamp is the frame time in seconds (video time for recorded files); defaults to wall-clock time.
         """
-        if tracks[0].boxes.id is None:
-            return im0
-       
-        boxes = tracks[0].boxes.xyxy.cpu()
-        clss = tracks[0].boxes.cls.cpu().tolist()
-        t_ids = tracks[0].boxes.id.int().cpu().tolist()
-        annotator = Annotator(im0, line_width=self.tf)
-        
-        # Draw perspective transformation area for visualization
-        cv2.polylines(im0, [self.src_points.astype(int)], True, (0, 255, 255), 2)
-        cv2.putText(im0, "IPM Area", (int(self.src_points[0][0]), int(self.src_points[0][1]) - 10), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 1)
-        
-        # Draw speed line
-        cv2.line(im0, self.reg_pts[0], self.reg_pts[1], (255, 0, 255), self.tf * 2)
-        
-        # Add calibration info
-        cv2.putText(im0, f"IPM: {self.real_world_width}m x {self.real_world_length}m", 
-                   (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+        current_time = time() if timestamp is None else timestamp
 
-        current_time = time()
-
-        for box, t_id, cls in zip(boxes, t_ids, clss):
+        for box, t_id in zip(boxes, t_ids):
             track = self.trk_history[t_id]
             bbox_center = (float((box[0] + box[2]) / 2), float((box[1] + box[3]) / 2))
             track.append(bbox_center)
@@ -209,8 +190,6 @@ class SpeedEstimator:
                 track.pop(0)
                 self.track_times[t_id].pop(0)
 
-            trk_pts = np.array(track).astype(np.int32).reshape((-1, 1, 2))
-
             # Initialize speed for new objects
             if t_id not in self.spd:
                 self.spd[t_id] = 0
@@ -226,6 +205,44 @@ class SpeedEstimator:
                     smoothed_speed = self.smooth_speed(t_id, calculated_speed)
                     self.spd[t_id] = max(0, min(200, smoothed_speed))
 
+        return {t_id: self.spd[t_id] for t_id in t_ids}
+
+    def forget(self, active_ids):
+        """Drops the history of tracks that are no longer active."""
+        for t_id in [t for t in self.trk_history if t not in active_ids]:
+            for history in (self.trk_history, self.track_times, self.speed_history, self.spd):
+                history.pop(t_id, None)
+
+    def estimate_speed(self, im0, tracks):
+        """
+        Estimates speed using IPM for maximum accuracy across all frame positions.
+        """
+        if tracks[0].boxes.id is None:
+            return im0
+       
+        boxes = tracks[0].boxes.xyxy.cpu()
+        clss = tracks[0].boxes.cls.cpu().tolist()
+        t_ids = tracks[0].boxes.id.int().cpu().tolist()
+        annotator = Annotator(im0, line_width=self.tf)
+        
+        # Draw perspective transformation area for visualization
+        cv2.polylines(im0, [self.src_points.astype(int)], True, (0, 255, 255), 2)
+        cv2.putText(im0, "IPM Area", (int(self.src_points[0][0]), int(self.src_points[0][1]) - 10), 
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 1)
+        
+        # Draw speed line
+        cv2.line(im0, self.reg_pts[0], self.reg_pts[1], (255, 0, 255), self.tf * 2)
+        
+        # Add calibration info
+        cv2.putText(im0, f"IPM: {self.real_world_width}m x {self.real_world_length}m", 
+                   (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+
+        self.update(boxes, t_ids)
+
+        for box, t_id, cls in zip(boxes, t_ids, clss):
+            track = self.trk_history[t_id]
+            trk_pts = np.array(track).astype(np.int32).reshape((-1, 1, 2))
+
             # Display results
             speed_value = int(self.spd.get(t_id, 0))
             track_quality = len(track)
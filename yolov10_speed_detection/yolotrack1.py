@@ -1,9 +1,13 @@
 import cv2
-from ultralytics import YOLO
+import os
+import sys
 from speed_new import SpeedEstimator
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from detector_backend import load_detector
+
 # Load YOLOv8 model
-model = YOLO("yolov10n.pt")
+model = load_detector("yolov10n.pt")
 # Initialize global variable to store cursor coordinates
 line_pts = [(0, 288), (1019, 288)]
 names = model.model.names  # This is a dictionary